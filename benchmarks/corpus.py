@@ -0,0 +1,131 @@
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+
+quicktime_epoch = datetime(1904, 1, 1)
+
+
+def ifd(entries, start):
+    """
+    Little endian IFD of ASCII and LONG entries placed at offset start of the TIFF data
+    """
+    values = b''
+    data_offset = start + 2 + 12 * len(entries) + 4
+    packed = struct.pack('<H', len(entries))
+    for tag, value in sorted(entries.items()):
+        if isinstance(value, int):
+            packed += struct.pack('<HHII', tag, 4, 1, value)
+            continue
+        value = value.encode() + b'\x00'
+        if len(value) <= 4:
+            packed += struct.pack('<HHI', tag, 2, len(value)) + value.ljust(4, b'\x00')
+            continue
+        packed += struct.pack('<HHII', tag, 2, len(value), data_offset + len(values))
+        values += value
+    return packed + b'\x00\x00\x00\x00' + values
+
+
+def exif(date, subseconds=None):
+    """
+    TIFF data with the date as ModifyDate, DateTimeOriginal and CreateDate
+    """
+    value = date.strftime('%Y:%m:%d %H:%M:%S')
+    exif_entries = {0x9003: value, 0x9004: value}
+    if subseconds:
+        exif_entries[0x9291] = subseconds
+        exif_entries[0x9292] = subseconds
+    ifd0 = {0x0132: value, 0x8769: 0}
+    first = ifd(ifd0, 8)
+    ifd0[0x8769] = 8 + len(first)
+    first = ifd(ifd0, 8)
+    return b'II*\x00' + struct.pack('<I', 8) + first + ifd(exif_entries, 8 + len(first))
+
+
+def jpeg(date, payload=b'', subseconds=None):
+    """
+    JPEG with an EXIF segment followed by payload as the image data
+    """
+    app1 = b'Exif\x00\x00' + exif(date, subseconds)
+    return (
+        b'\xff\xd8' +
+        b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 +
+        b'\xff\xda' + struct.pack('>H', 2) + payload.replace(b'\xff', b'\xfe') +
+        b'\xff\xd9'
+    )
+
+
+def box(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def mp4(date, payload=b''):
+    """
+    MP4 with a movie header holding the date and payload as the media data
+    """
+    seconds = int((date - quicktime_epoch).total_seconds())
+    mvhd = box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>IIII', seconds, seconds, 1000, 0) + b'\x00' * 80)
+    return box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41') + box(b'moov', mvhd) + box(b'mdat', payload)
+
+
+def xmp(date):
+    return (
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmp:CreateDate="%s"/>'
+        '</rdf:RDF></x:xmpmeta>' % date.isoformat()
+    ).encode()
+
+
+def generate(root, files=1000, size=65536, depth=4, collisions=0.1, duplicates=0.1,
+             xmp_files=0.05, videos=0.2, seed=0):
+    """
+    Create a reproducible corpus of JPEG and MP4 files with valid dates in root.
+    collisions is the share of files with the same date as another one but different content,
+    duplicates the share of exact copies of another file and xmp_files the share with an xmp sidecar.
+    Files are spread over a directory tree up to depth levels deep. Returns the number of each kind of file
+    """
+    rng = random.Random(seed)
+    counts = {'files': 0, 'jpeg': 0, 'mp4': 0, 'collisions': 0, 'duplicates': 0, 'xmp': 0, 'bytes': 0}
+    dates = []
+    written = []
+
+    for i in range(files):
+        directory = os.path.join(root, *['d%d' % rng.randrange(4) for _ in range(rng.randint(0, depth))])
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        kind = rng.random()
+        if written and kind < duplicates:
+            with open(rng.choice(written), 'rb') as f:
+                content = f.read()
+            extension = '.mp4' if content[4:8] == b'ftyp' else '.jpg'
+            counts['duplicates'] += 1
+        else:
+            if dates and kind < duplicates + collisions:
+                date = rng.choice(dates)
+                counts['collisions'] += 1
+            else:
+                date = datetime(2010, 1, 1) + timedelta(seconds=rng.randrange(10 * 365 * 86400))
+                dates.append(date)
+
+            payload = bytes(rng.getrandbits(8) for _ in range(min(size, 256))) * max(1, size // 256)
+            if rng.random() < videos:
+                content, extension = mp4(date, payload), '.mp4'
+                counts['mp4'] += 1
+            else:
+                content, extension = jpeg(date, payload), '.jpg'
+                counts['jpeg'] += 1
+
+        file = os.path.join(directory, 'IMG_%06d%s' % (i, extension))
+        with open(file, 'wb') as f:
+            f.write(content)
+        written.append(file)
+        counts['files'] += 1
+        counts['bytes'] += len(content)
+
+        if rng.random() < xmp_files:
+            with open(file + '.xmp', 'wb') as f:
+                f.write(xmp(datetime(2010, 1, 1)))
+            counts['xmp'] += 1
+
+    return counts
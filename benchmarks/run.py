@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Benchmark phockup on a synthetic corpus.
+
+Usage:
+    python -m benchmarks.run [--files=N] [--size=BYTES] [--repeat=N] [--seed=N] [--workers=N]
+                             [--output=FILE] [--compare=FILE]
+
+Every benchmark is run --repeat times on the same corpus and the fastest run is reported.
+The results are printed and written as JSON to --output. With --compare the results
+of a previous run are shown next to the new ones.
+"""
+import getopt
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate  # noqa: E402
+from src.checksum import FileDigest  # noqa: E402
+from src.date import Date  # noqa: E402
+from src.exif import Exif  # noqa: E402
+from src.native import NativeReader  # noqa: E402
+from src.phockup import Phockup  # noqa: E402
+from src.printer import Printer, QUIET  # noqa: E402
+from src.scanner import Scanner  # noqa: E402
+
+
+def list_files(root):
+    return [entry.path for entry in Scanner(root) if not entry.name.endswith('.xmp')]
+
+
+def bench_scan(corpus, output, files):
+    list_files(corpus)
+
+
+def bench_native(corpus, output, files):
+    reader = NativeReader()
+    for file in files:
+        reader.read(file)
+
+
+def bench_exiftool(corpus, output, files):
+    for i in range(0, len(files), 100):
+        Exif.batch(files[i:i + 100])
+
+
+def bench_date(corpus, output, files, exif_data):
+    for file in files:
+        Date(file).from_exif(exif_data[file])
+
+
+def bench_checksum(corpus, output, files):
+    for file in files:
+        FileDigest(file).full()
+
+
+def bench_copy(corpus, output, files):
+    os.makedirs(output)
+    for i, file in enumerate(files):
+        shutil.copy2(file, os.path.join(output, '%d' % i))
+
+
+def bench_phockup(corpus, output, files, workers=1):
+    return stage_times(Phockup(corpus, output, workers=workers))
+
+
+def bench_phockup_exiftool(corpus, output, files, workers=1):
+    return stage_times(Phockup(corpus, output, workers=workers, exiftool_only=True))
+
+
+def stage_times(phockup):
+    """
+    Time spent in each stage of an end to end run. Stages run in parallel so they add up to more than the run
+    """
+    return {stage: timing['total'] for stage, timing in phockup.stats.report()['stages'].items()}
+
+
+benchmarks = (
+    ('scan', bench_scan, False),
+    ('native', bench_native, False),
+    ('exiftool', bench_exiftool, True),
+    ('date', bench_date, False),
+    ('checksum', bench_checksum, False),
+    ('copy', bench_copy, False),
+    ('phockup', bench_phockup, False),
+    ('phockup_exiftool', bench_phockup_exiftool, True),
+)
+
+
+def measure(func, corpus, work, files, repeat, **args):
+    """
+    Return the shortest time of repeat runs and what the fastest run returned
+    """
+    best = None
+    details = None
+    for _ in range(repeat):
+        output = os.path.join(work, 'output')
+        shutil.rmtree(output, ignore_errors=True)
+        start = time.perf_counter()
+        result = func(corpus, output, files, **args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best, details = elapsed, result
+    shutil.rmtree(os.path.join(work, 'output'), ignore_errors=True)
+    return best, details
+
+
+def run(count, size, repeat, seed, workers):
+    exiftool = shutil.which('exiftool') is not None
+    work = tempfile.mkdtemp(prefix='phockup-benchmark-')
+    try:
+        corpus = os.path.join(work, 'corpus')
+        counts = generate(corpus, count, size, seed=seed)
+        files = list_files(corpus)
+        reader = NativeReader()
+        exif_data = {file: reader.read(file) or {} for file in files}
+
+        results = {}
+        for name, func, needs_exiftool in benchmarks:
+            if needs_exiftool and not exiftool:
+                continue
+            if name.startswith('phockup'):
+                args = {'workers': workers}
+            elif name == 'date':
+                args = {'exif_data': exif_data}
+            else:
+                args = {}
+            seconds, details = measure(func, corpus, work, files, repeat, **args)
+            results[name] = {
+                'seconds': round(seconds, 6),
+                'files_per_second': round(len(files) / seconds, 3) if seconds else None,
+                'mb_per_second': round(counts['bytes'] / seconds / 1000000, 3) if seconds else None,
+            }
+            if details:
+                results[name]['stages'] = details
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        'corpus': dict(counts, seed=seed, size=size),
+        'repeat': repeat,
+        'workers': workers,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def show(report, previous=None):
+    print('Corpus: %(files)d files, %(duplicates)d duplicates, %(collisions)d collisions, %(xmp)d xmp files' %
+          report['corpus'])
+    for name, result in report['results'].items():
+        line = '%-18s %10.4f s %12.1f files/s %10.1f MB/s' % (
+            name, result['seconds'], result['files_per_second'] or 0, result['mb_per_second'] or 0)
+        if previous and name in previous['results']:
+            line += '  %+.1f%%' % ((previous['results'][name]['seconds'] / result['seconds'] - 1) * 100)
+        print(line)
+    if previous:
+        print('Change is the speedup against the compared run, positive is faster')
+
+
+def main(argv):
+    count, size, repeat, seed, workers = 1000, 65536, 3, 0, 1
+    output = compare = None
+
+    try:
+        opts, args = getopt.getopt(argv, "", ["files=", "size=", "repeat=", "seed=", "workers=", "output=", "compare="])
+    except getopt.GetoptError:
+        print(__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "--files":
+            count = int(arg)
+        if opt == "--size":
+            size = int(arg)
+        if opt == "--repeat":
+            repeat = max(1, int(arg))
+        if opt == "--seed":
+            seed = int(arg)
+        if opt == "--workers":
+            workers = max(1, int(arg))
+        if opt == "--output":
+            output = arg
+        if opt == "--compare":
+            compare = arg
+
+    Printer.configure(QUIET)
+    report = run(count, size, repeat, seed, workers)
+
+    previous = None
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f)
+    show(report, previous)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -4,42 +4,91 @@ import os
 import re
 import sys
 
+from src.checksum import algorithms
 from src.date import Date
 from src.dependency import check_dependencies
 from src.help import help
-from src.phockup import Phockup
-from src.printer import Printer
+from src.phockup import Phockup, PhockupError
+from src.printer import Printer, QUIET, NORMAL, VERBOSE
+from src.server import Server, default_socket, submit
 
 version = '1.5.11'
 printer = Printer()
 
+short_options = "d:r:f:mltoyqvh"
+long_options = ["date=", "regex=", "move", "link", "original-names", "timestamp", "date-field=", "dry-run", "batch-size=", "workers=", "exif-workers=", "transfer-workers=", "cache", "cache-path=", "cache-limit=", "clear-cache", "index", "index-path=", "rebuild-index", "hash=", "resume", "incremental", "scan-workers=", "unordered", "exiftool-only", "reflink=", "progress", "report=", "quiet", "verbose", "log-format=", "plan=", "apply-plan=", "watch", "watch-settle=", "watch-polling", "inputs-from=", "archives", "connect", "socket=", "help"]
+
+
+def positive_number(arg, message):
+    try:
+        number = int(arg)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise PhockupError(message)
+    return number
+
+
+def configure_printer(opts):
+    """
+    Set up the output before any other option is handled so their messages follow the settings
+    """
+    verbosity = NORMAL
+    log_format = 'text'
+    for opt, arg in opts:
+        if opt in ("-q", "--quiet"):
+            verbosity = QUIET
+        if opt in ("-v", "--verbose"):
+            verbosity = VERBOSE
+        if opt == "--log-format":
+            if arg not in ('text', 'json'):
+                printer.error("Log format must be text or json")
+            log_format = arg
+
+    Printer.configure(verbosity, log_format, buffered=True)
 
-def main(argv):
-    check_dependencies()
 
+def options(opts):
+    """
+    Return the Phockup arguments of the parsed command line options. Raises PhockupError for invalid values
+    """
     move = False
     link = False
+    reflink = None
     date_regex = None
     dir_format = os.path.sep.join(['%Y', '%m', '%d'])
     original_filenames = False
     timestamp = False
     date_field = None
     dry_run = False
-
-    try:
-        opts, args = getopt.getopt(argv[2:], "d:r:f:mltoyh", ["date=", "regex=", "move", "link", "original-names", "timestamp", "date-field=", "dry-run", "help"])
-    except getopt.GetoptError:
-        help(version)
-        sys.exit(2)
+    batch_size = 100
+    workers = 1
+    exif_workers = None
+    transfer_workers = None
+    cache = None
+    cache_limit = 1000000
+    clear_cache = False
+    index = None
+    rebuild_index = False
+    hash_algorithm = 'sha256'
+    resume = False
+    incremental = False
+    scan_workers = 1
+    ordered = True
+    exiftool_only = False
+    progress = False
+    plan = None
+    apply_plan = None
+    watch = False
+    watch_settle = 2.0
+    watch_polling = False
+    archives = False
+    report = None
 
     for opt, arg in opts:
-        if opt in ("-h", "--help"):
-            help(version)
-            sys.exit(2)
-
         if opt in ("-d", "--date"):
             if not arg:
-                printer.error("Date format cannot be empty")
+                raise PhockupError("Date format cannot be empty")
             dir_format = Date().parse(arg)
 
         if opt in ("-m", "--move"):
@@ -50,6 +99,51 @@ def main(argv):
             link = True
             printer.line("Using link strategy")
 
+        if opt == "--plan":
+            if not arg:
+                raise PhockupError("Plan path cannot be empty")
+            plan = os.path.expanduser(arg)
+            printer.line("Writing plan to %s, not moving files" % plan)
+
+        if opt == "--apply-plan":
+            if not arg:
+                raise PhockupError("Plan path cannot be empty")
+            apply_plan = os.path.expanduser(arg)
+            printer.line("Applying plan %s" % apply_plan)
+
+        if opt == "--watch":
+            watch = True
+            printer.line("Watching the input directory for new files")
+
+        if opt == "--watch-settle":
+            try:
+                watch_settle = float(arg)
+            except ValueError:
+                watch_settle = -1
+            if watch_settle < 0:
+                raise PhockupError("Watch settle time must be a number of seconds")
+
+        if opt == "--watch-polling":
+            watch_polling = True
+
+        if opt == "--archives":
+            archives = True
+            printer.line("Reading media out of zip and tar archives")
+
+        if opt == "--progress":
+            progress = True
+
+        if opt == "--report":
+            if not arg:
+                raise PhockupError("Report path cannot be empty")
+            report = os.path.expanduser(arg)
+
+        if opt == "--reflink":
+            if arg not in ("auto", "always"):
+                raise PhockupError("Reflink mode must be auto or always")
+            reflink = arg
+            printer.line("Using reflink strategy (%s)" % reflink)
+
         if opt in ("-o", "--original-names"):
             original_filenames = True
             printer.line("Using original filenames")
@@ -58,7 +152,7 @@ def main(argv):
             try:
                 date_regex = re.compile(arg)
             except:
-                printer.error("Provided regex is invalid")
+                raise PhockupError("Provided regex is invalid")
 
         if opt in ("-t", "--timestamp"):
             timestamp = True
@@ -70,31 +164,266 @@ def main(argv):
 
         if opt in ("-f", "--date-field"):
             if not arg:
-                printer.error("Date field cannot be empty")
+                raise PhockupError("Date field cannot be empty")
             date_field = arg
             printer.line("Using as date field: %s" % date_field)
 
+        if opt == "--batch-size":
+            batch_size = positive_number(arg, "Batch size must be a positive number")
+
+        if opt == "--workers":
+            workers = positive_number(arg, "Number of workers must be a positive number")
+            printer.line("Using %d workers" % workers)
+
+        if opt == "--exif-workers":
+            exif_workers = positive_number(arg, "Number of exif workers must be a positive number")
+
+        if opt == "--transfer-workers":
+            transfer_workers = positive_number(arg, "Number of transfer workers must be a positive number")
+
+        if opt == "--cache":
+            cache = cache or True
+            printer.line("Using metadata cache")
+
+        if opt == "--cache-path":
+            if not arg:
+                raise PhockupError("Cache path cannot be empty")
+            cache = os.path.expanduser(arg)
+            printer.line("Using metadata cache: %s" % cache)
+
+        if opt == "--cache-limit":
+            cache_limit = positive_number(arg, "Cache limit must be a positive number")
+
+        if opt == "--clear-cache":
+            clear_cache = True
+
+        if opt == "--index":
+            index = index or True
+            printer.line("Using checksum index of the output directory")
+
+        if opt == "--index-path":
+            if not arg:
+                raise PhockupError("Index path cannot be empty")
+            index = os.path.expanduser(arg)
+            printer.line("Using checksum index: %s" % index)
+
+        if opt == "--rebuild-index":
+            index = index or True
+            rebuild_index = True
+
+        if opt == "--hash":
+            if arg not in algorithms():
+                raise PhockupError("Hash algorithm must be one of: %s" % ', '.join(sorted(algorithms())))
+            hash_algorithm = arg
+            printer.line("Using %s checksums" % hash_algorithm)
+
+        if opt == "--resume":
+            resume = True
+            printer.line("Resuming interrupted run")
+
+        if opt == "--incremental":
+            incremental = True
+            printer.line("Processing only new and changed files")
+
+        if opt == "--scan-workers":
+            scan_workers = positive_number(arg, "Number of scan workers must be a positive number")
+
+        if opt == "--unordered":
+            ordered = False
+            printer.line("Processing files in the order they are found")
+
+        if opt == "--exiftool-only":
+            exiftool_only = True
+            printer.line("Reading all metadata with exiftool")
+
 
     if link and move:
-        printer.error("Can't use move and link strategy together")
+        raise PhockupError("Can't use move and link strategy together")
 
-    if len(argv) < 2:
-        help(version)
-        sys.exit(2)
+    if reflink and (move or link):
+        raise PhockupError("Can't use reflink strategy together with move or link")
+
+    if plan and apply_plan:
+        raise PhockupError("Can't write and apply a plan together")
 
-    return Phockup(
-        argv[0], argv[1],
+    if watch and (plan or apply_plan):
+        raise PhockupError("Can't use plans in watch mode")
+
+    return dict(
         dir_format=dir_format,
         move=move,
         link=link,
+        reflink=reflink,
+        progress=progress,
+        report=report,
+        plan=plan,
+        apply_plan=apply_plan,
+        watch=watch,
+        watch_settle=watch_settle,
+        watch_polling=watch_polling,
+        archives=archives,
         date_regex=date_regex,
         original_filenames=original_filenames,
         timestamp=timestamp,
         date_field=date_field,
         dry_run=dry_run,
+        batch_size=batch_size,
+        workers=workers,
+        exif_workers=exif_workers or workers,
+        transfer_workers=transfer_workers or workers,
+        cache=cache,
+        cache_limit=cache_limit,
+        clear_cache=clear_cache,
+        index=index,
+        rebuild_index=rebuild_index,
+        hash_algorithm=hash_algorithm,
+        resume=resume,
+        incremental=incremental,
+        scan_workers=scan_workers,
+        ordered=ordered,
+        exiftool_only=exiftool_only,
     )
 
 
+def split_args(argv):
+    """
+    Split a command line into the directories given before the first option and the options
+    """
+    for position, arg in enumerate(argv):
+        if arg.startswith('-'):
+            return argv[:position], argv[position:]
+    return argv, []
+
+
+def read_inputs(path):
+    """
+    Return the input directories listed in a file, one per line. Empty lines and lines starting with # are ignored
+    """
+    try:
+        with open(os.path.expanduser(path)) as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        raise PhockupError('Cannot read the list of input directories "%s"' % path)
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def inputs_and_output(paths, opts):
+    """
+    Return the input directories and the output directory. The last directory is the output,
+    the ones before it and the ones listed in --inputs-from files are the inputs
+    """
+    inputs = paths[:-1]
+    for opt, arg in opts:
+        if opt == "--inputs-from":
+            inputs = inputs + read_inputs(arg)
+    if not paths or not inputs:
+        raise PhockupError("Input and output directories are required")
+    return inputs, paths[-1]
+
+
+def parse_args(argv):
+    """
+    Return the inputs, output and Phockup arguments of a command line. Raises PhockupError when it is invalid
+    """
+    paths, argv = split_args(argv)
+    try:
+        opts, args = getopt.getopt(argv, short_options, long_options)
+    except getopt.GetoptError as e:
+        raise PhockupError(str(e))
+    inputs, output = inputs_and_output(paths, opts)
+    return inputs, output, options(opts)
+
+
+def command_line(opts):
+    """
+    Rebuild the options of a parsed command line. Arguments of short options are separate
+    elements so empty ones are kept
+    """
+    line = []
+    for opt, arg in opts:
+        if opt.startswith('--') and opt[2:] + '=' in long_options:
+            line.append('%s=%s' % (opt, arg))
+        elif not opt.startswith('--') and opt[1] + ':' in short_options:
+            line.extend([opt, arg])
+        else:
+            line.append(opt)
+    return line
+
+
+def serve(argv):
+    try:
+        opts, args = getopt.getopt(argv, "qv", ["server", "socket=", "quiet", "verbose", "log-format="])
+    except getopt.GetoptError:
+        help(version)
+        sys.exit(2)
+
+    configure_printer(opts)
+    check_dependencies()
+    socket_path = dict(opts).get('--socket') or default_socket()
+    try:
+        Server(socket_path, parse_args).serve()
+    except PhockupError as e:
+        printer.error(str(e))
+
+
+def connect(paths, opts):
+    """
+    Send the job to a running server and print what it reports
+    """
+    socket_path = dict(opts).get('--socket') or default_socket()
+    try:
+        inputs, output = inputs_and_output(paths, opts)
+        job = inputs + [output] + command_line([
+            (opt, arg) for opt, arg in opts if opt not in ('--connect', '--socket', '--inputs-from')
+        ])
+        for event in submit(socket_path, job):
+            if event['event'] == 'queued':
+                printer.line('Waiting for the job running on "%s"' % event['output'])
+            elif event['event'] == 'result':
+                printer.result(event['source'], event['message'], status=event['action'], target=event['target'])
+            elif event['event'] == 'message':
+                printer.log(event['level'], event['line'])
+            elif event['event'] == 'progress':
+                printer.line(event['line'])
+            elif event['event'] == 'error':
+                printer.error(event['message'])
+    except PhockupError as e:
+        printer.error(str(e))
+
+
+def main(argv):
+    if argv and argv[0] == '--server':
+        serve(argv)
+        return
+
+    paths, argv = split_args(argv)
+    try:
+        opts, args = getopt.getopt(argv, short_options, long_options)
+    except getopt.GetoptError:
+        help(version)
+        sys.exit(2)
+
+    configure_printer(opts)
+
+    inputs_from = any(opt == "--inputs-from" for opt, arg in opts)
+    if len(paths) < (1 if inputs_from else 2) or any(opt in ("-h", "--help") for opt, arg in opts):
+        help(version)
+        sys.exit(2)
+
+    if any(opt == "--connect" for opt, arg in opts):
+        connect(paths, opts)
+        return
+
+    check_dependencies()
+    try:
+        inputs, output = inputs_and_output(paths, opts)
+        args = options(opts)
+    except PhockupError as e:
+        printer.error(str(e))
+
+    return Phockup(inputs, output, **args)
+
+
 if __name__ == '__main__':
     try:
         main(sys.argv[1:])
@@ -0,0 +1,224 @@
+import os
+import re
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from contextlib import closing
+
+from src.checksum import FileDigest, algorithms, block_size, partial_size
+from src.transfer import buffer_size
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# Extensions of the archives which are read as input sources
+archive_extensions = ('.zip', '.tar', '.tgz', '.tar.gz', '.tbz2', '.tar.bz2', '.txz', '.tar.xz')
+archive_component = re.compile(
+    r'\.(zip|tar|tgz|tar\.gz|tbz2|tar\.bz2|txz|tar\.xz)%s' % re.escape(os.path.sep), re.IGNORECASE)
+
+# The parts of os.stat results phockup uses, for archive members
+MemberStat = namedtuple('MemberStat', ('st_size', 'st_mtime', 'st_mtime_ns'))
+
+# Errors raised reading a corrupt or truncated member. bz2 and gzip raise OSError
+read_errors = (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError) + \
+    ((lzma.LZMAError,) if lzma is not None else ())
+
+
+class MemberError(Exception):
+    """
+    An archive member can't be read
+    """
+    pass
+
+
+def is_archive(path):
+    return path.lower().endswith(archive_extensions)
+
+
+class Archive(object):
+    """
+    A zip or tar archive read as an input directory without extracting it.
+    Members are listed once when the archive is opened. Their paths are the path of the archive
+    joined with the member name so they can be handled like files. Every thread reads members
+    through its own handle, so several workers stream out of the same archive at once and a
+    compressed tar is mostly read forward.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.is_zipfile(path)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.handles = []
+        self.members = {}
+        self.order = []
+
+        if self.zip:
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if not info.filename.endswith('/'):
+                        mtime = time.mktime(info.date_time + (0, 0, -1))
+                        self.add(info.filename, info, info.file_size, mtime)
+        else:
+            with tarfile.open(path) as archive:
+                for info in archive:
+                    if info.isfile():
+                        self.add(info.name, info, info.size, info.mtime)
+
+    def add(self, name, info, size, mtime):
+        parts = [part for part in name.split('/') if part not in ('', '.')]
+        if not parts:
+            return
+        member = os.path.join(self.path, *parts)
+        self.members[member] = info, MemberStat(size, mtime, int(mtime * 1e9)), len(self.order)
+        self.order.append(member)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __contains__(self, member):
+        return member in self.members
+
+    def stat(self, member):
+        return self.members[member][1]
+
+    def position(self, member):
+        return self.members[member][2]
+
+    def handle(self):
+        handle = getattr(self.local, 'handle', None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.path) if self.zip else tarfile.open(self.path)
+            self.local.handle = handle
+            with self.lock:
+                self.handles.append(handle)
+        return handle
+
+    def open(self, member):
+        info = self.members[member][0]
+        if self.zip:
+            return self.handle().open(info)
+        return self.handle().extractfile(info)
+
+    def blocks(self, member, size):
+        """
+        Yield the content of a member in blocks. Raises MemberError when the member can't be read
+        """
+        try:
+            with self.open(member) as stream:
+                for block in iter(lambda: stream.read(size), b''):
+                    yield block
+        except read_errors as e:
+            raise MemberError('Cannot read "%s": %s' % (member, e))
+
+    def copy(self, member, target):
+        """
+        Stream a member to target and give it the modification time of the member
+        """
+        with closing(self.blocks(member, buffer_size)) as blocks, open(target, 'wb') as f:
+            for block in blocks:
+                f.write(block)
+        mtime = self.stat(member).st_mtime
+        os.utime(target, (mtime, mtime))
+
+    def close(self):
+        with self.lock:
+            for handle in self.handles:
+                handle.close()
+            self.handles = []
+        self.local = threading.local()
+
+
+class Archives(object):
+    """
+    The archives opened during a run. Members of archives which were not scanned, e.g. the
+    sources of a plan or of an interrupted transfer, are found by opening their archive on demand
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.archives = {}
+        self.members = {}
+
+    def open(self, path):
+        """
+        Open an archive and return it, or None when it can't be read
+        """
+        with self.lock:
+            if path in self.archives:
+                return self.archives[path]
+            try:
+                archive = Archive(path)
+            except read_errors:
+                archive = None
+            self.archives[path] = archive
+            if archive is not None:
+                self.members.update(dict.fromkeys(archive, archive))
+            return archive
+
+    def find(self, file):
+        """
+        Return the archive file is a member of or None for a regular file
+        """
+        archive = self.members.get(file)
+        if archive is not None or not archive_component.search(file):
+            return archive
+
+        directory = os.path.dirname(file)
+        while directory != os.path.dirname(directory):
+            if is_archive(directory) and os.path.isfile(directory):
+                self.open(directory)
+                return self.members.get(file)
+            directory = os.path.dirname(directory)
+        return None
+
+    def close(self):
+        with self.lock:
+            for archive in self.archives.values():
+                if archive is not None:
+                    archive.close()
+            self.archives = {}
+            self.members = {}
+
+
+class MemberDigest(FileDigest):
+    """
+    FileDigest of an archive member. The member is streamed once for both checksums
+    """
+    def __init__(self, archive, member, algorithm='sha256'):
+        FileDigest.__init__(self, member, algorithm)
+        self.archive = archive
+
+    def size(self):
+        return self.archive.stat(self.file).st_size
+
+    def partial(self):
+        if self._partial is None:
+            self.read()
+        return self._partial
+
+    def full(self):
+        if self._full is None:
+            self.read()
+        return self._full
+
+    def read(self):
+        digest = algorithms()[self.algorithm]()
+        head = bytearray()
+        tail = bytearray()
+        with closing(self.archive.blocks(self.file, block_size)) as blocks:
+            for block in blocks:
+                digest.update(block)
+                if len(head) < partial_size:
+                    head += block[:partial_size - len(head)]
+                tail += block
+                if len(tail) > 2 * partial_size:
+                    del tail[:-partial_size]
+        partial = algorithms()[self.algorithm]()
+        partial.update(head)
+        partial.update(tail[-partial_size:])
+        self._full = digest.hexdigest()
+        self._partial = partial.hexdigest()
@@ -0,0 +1,107 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class MetadataCache(object):
+    """
+    SQLite cache of exif data. Entries are keyed by path, size, modification time and inode
+    so a file which did not change since it was read is not sent to exiftool again.
+    When the cache grows over limit entries the least recently used ones are removed.
+    """
+    def __init__(self, path, limit=1000000):
+        self.path = path
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, inode INTEGER, data TEXT, used REAL)'
+        )
+        self.connection.commit()
+
+    def key(self, file):
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        return os.path.abspath(file), stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def get_many(self, files, touch=True):
+        """
+        Return a dict with the cached data of the files and a list of the files which are not cached.
+        The found entries are marked as used unless touch is False, then nothing is written
+        """
+        found = {}
+        missing = []
+        used = []
+        with self.lock:
+            for file in files:
+                key = self.key(file)
+                row = None
+                if key:
+                    row = self.connection.execute(
+                        'SELECT data FROM metadata WHERE path = ? AND size = ? AND mtime = ? AND inode = ?', key
+                    ).fetchone()
+                if row:
+                    found[file] = json.loads(row[0])
+                    used.append(key[0])
+                else:
+                    missing.append(file)
+
+            if touch and used:
+                now = time.time()
+                self.connection.executemany('UPDATE metadata SET used = ? WHERE path = ?', [(now, path) for path in used])
+                self.connection.commit()
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        return found, missing
+
+    def set_many(self, data):
+        rows = []
+        now = time.time()
+        for file, exif in data.items():
+            key = self.key(file)
+            if key and exif:
+                rows.append(key + (json.dumps(exif), now))
+
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+
+    def evict(self):
+        """
+        Remove the least recently used entries over the limit
+        """
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM metadata WHERE path IN '
+                '(SELECT path FROM metadata ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.limit,)
+            )
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM metadata')
+            self.connection.commit()
+            self.connection.execute('VACUUM')
+
+    def close(self, evict=True):
+        if evict:
+            self.evict()
+        with self.lock:
+            self.connection.close()
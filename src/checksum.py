@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+block_size = 65536
+partial_size = 4 * 1024 * 1024
+
+
+def algorithms():
+    """
+    Return the available hash algorithms. SHA-256 is the default and always available
+    """
+    available = {'sha256': hashlib.sha256}
+    if hasattr(hashlib, 'blake2b'):
+        available['blake2b'] = hashlib.blake2b
+    if xxhash is not None:
+        available['xxhash'] = xxhash.xxh64
+    return available
+
+
+def checksum(file, algorithm='sha256'):
+    """
+    Calculate checksum of the whole file
+    """
+    digest = algorithms()[algorithm]()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def partial_checksum(file, algorithm='sha256'):
+    """
+    Calculate checksum of the first and the last partial_size bytes of the file
+    """
+    digest = algorithms()[algorithm]()
+    with open(file, 'rb') as f:
+        digest.update(f.read(partial_size))
+        f.seek(-partial_size, os.SEEK_END)
+        digest.update(f.read(partial_size))
+    return digest.hexdigest()
+
+
+class FileDigest(object):
+    """
+    Lazily computed size, partial and full checksum of a file.
+    Files are compared in tiers so the whole file is read only when everything else matches.
+    """
+    def __init__(self, file, algorithm='sha256'):
+        self.file = file
+        self.algorithm = algorithm
+        self._size = None
+        self._partial = None
+        self._full = None
+
+    def size(self):
+        if self._size is None:
+            self._size = os.path.getsize(self.file)
+        return self._size
+
+    def partial(self):
+        if self._partial is None:
+            self._partial = partial_checksum(self.file, self.algorithm)
+        return self._partial
+
+    def full(self):
+        if self._full is None:
+            self._full = checksum(self.file, self.algorithm)
+        return self._full
+
+    def matches(self, other):
+        if self.size() != other.size():
+            return False
+        if self.size() > 2 * partial_size and self.partial() != other.partial():
+            return False
+        return self.full() == other.full()
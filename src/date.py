@@ -1,11 +1,69 @@
 import os
 import re
 from datetime import datetime
+from functools import lru_cache
 import time
 
+# Layouts written by cameras and reported by exiftool: YYYY:MM:DD HH:MM:SS[.sss][+HH:MM]
+datestring_layout = re.compile(
+    r'(\d{4})([:-])(\d{2})\2(\d{2}) (\d{2}):(\d{2}):(\d{2})(?:\.(\d*))?([+-]\d{2}:\d{2})?$')
+timezone = re.compile(r'(.*)([+-]\d{2}:\d{2})')
+default_filename_regex = re.compile(
+    r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
+# Exif fields a date is taken from when no date field is given, in order of preference
+default_date_fields = ('SubSecCreateDate', 'SubSecDateTimeOriginal', 'CreateDate', 'DateTimeOriginal')
+
+
+@lru_cache(maxsize=1024)
+def parse_datestring(datestr):
+    """
+    Return the date, subseconds and timezone offset of a date string. Files taken in a burst
+    share the same date strings so the results are cached
+    """
+    match = datestring_layout.match(datestr)
+    if match is not None:
+        year, separator, month, day, hour, minute, second, subseconds, offset = match.groups()
+        try:
+            date = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+        except ValueError:
+            date = None
+        return date, subseconds or '', offset
+    return parse_other_datestring(datestr)
+
+
+def parse_other_datestring(datestr):
+    """
+    Slow path for date strings which don't have the usual layout
+    """
+    datestr = datestr.split('.')
+    date = datestr[0]
+    subseconds = datestr[1] if len(datestr) > 1 else ''
+    offset = None
+
+    match = timezone.match(date)
+    if match is not None:
+        date, offset = match.groups()
+    try:
+        parsed_date_time = datetime.strptime(date, "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        try:
+            parsed_date_time = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            parsed_date_time = None
+
+    match = timezone.match(subseconds)
+    if match is not None:
+        subseconds, offset = match.groups()
+    return parsed_date_time, subseconds, offset
+
+
 class Date():
-    def __init__(self, file=None):
+    def __init__(self, file=None, mtime=None):
         self.file = file
+        # Modification time for files which can't be stat'ed, e.g. archive members
+        self.mtime = mtime
+        # Where the last date came from: exif, filename, timestamp or None when there is no date
+        self.source = None
 
     def parse(self, date):
         date = date.replace("YYYY", "%Y")  # 2017 (year)
@@ -32,7 +90,7 @@ class Date():
         if date_field:
             keys = date_field.split()
         else:
-            keys = ['SubSecCreateDate', 'SubSecDateTimeOriginal', 'CreateDate', 'DateTimeOriginal']
+            keys = default_date_fields
 
         datestr = None
 
@@ -47,9 +105,10 @@ class Date():
         if datestr and isinstance(datestr, str) and not datestr.startswith('0000'):
             parsed_date = self.from_datestring(datestr)
         else:
-            parsed_date = {'date': None, 'subseconds': ''}
+            parsed_date = {'date': None, 'subseconds': '', 'offset': None}
 
         if parsed_date.get("date") is not None:
+            self.source = 'exif'
             return parsed_date
         else:
             if self.file:
@@ -58,36 +117,21 @@ class Date():
                 return parsed_date
 
     def from_datestring(self, datestr):
-        datestr = datestr.split('.')
-        date = datestr[0]
-        if len(datestr) > 1:
-            subseconds = datestr[1]
-        else:
-            subseconds = ''
-        search = r'(.*)([+-]\d{2}:\d{2})'
-        if re.search(search, date) is not None:
-            date = re.sub(search, r'\1', date)
-        try:
-            parsed_date_time = self.strptime(date, "%Y:%m:%d %H:%M:%S")
-        except ValueError:
-            try:
-                parsed_date_time = self.strptime(date, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                parsed_date_time = None
-        if re.search(search, subseconds) is not None:
-            subseconds = re.sub(search, r'\1', subseconds)
+        """
+        Parse an exif date. The timezone offset is returned as it was written (e.g. +02:00) or None
+        """
+        date, subseconds, offset = parse_datestring(datestr)
         return {
-            'date': parsed_date_time,
-            'subseconds': subseconds
+            'date': date,
+            'subseconds': subseconds,
+            'offset': offset
         }
 
     def from_filename(self, user_regex, timestamp=None):
         # If missing datetime from EXIF data check if filename is in datetime format.
         # For this use a user provided regex if possible.
         # Otherwise assume a filename such as IMG_20160915_123456.jpg as default.
-        default_regex = re.compile(
-            r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
-        regex = user_regex or default_regex
+        regex = user_regex or default_filename_regex
         matches = regex.search(os.path.basename(self.file))
 
         if matches:
@@ -99,18 +143,23 @@ class Date():
                 date = None
 
             if date:
+                self.source = 'filename'
                 return {
                     'date': date,
-                    'subseconds': ''
+                    'subseconds': '',
+                    'offset': None
                 }
             
         if timestamp: return self.from_timestamp()    
 
     def from_timestamp(self):
-        date = datetime.fromtimestamp(os.path.getmtime(self.file))
+        self.source = 'timestamp'
+        mtime = self.mtime if self.mtime is not None else os.path.getmtime(self.file)
+        date = datetime.fromtimestamp(mtime)
         return {
             'date': date,
-            'subseconds': ''
+            'subseconds': '',
+            'offset': None
         }
 
         
@@ -1,7 +1,148 @@
-from subprocess import check_output, CalledProcessError
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
+import atexit
 import json
-import shlex
-import sys
+import os
+import threading
+
+
+class ExifToolError(Exception):
+    pass
+
+
+def fits_line(arg):
+    """
+    Whether exiftool reads the argument back unchanged from a line of -@. It splits arguments
+    on line breaks, strips surrounding whitespace and skips lines starting with #
+    """
+    return '\n' not in arg and arg == arg.strip() and not arg.startswith('#')
+
+
+class ExifTool(object):
+    """
+    Long-lived exiftool process driven through the -stay_open batch protocol.
+    Arguments are written to its stdin one per line and the output is read back
+    until the {readyN} marker exiftool prints after each -executeN.
+    """
+    def __init__(self, executable='exiftool'):
+        self.executable = executable
+        self.process = None
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-'],
+            stdin=PIPE, stdout=PIPE, stderr=DEVNULL
+        )
+
+    def stop(self):
+        """
+        Ask exiftool to exit and kill it if it does not do so in time
+        """
+        with self.lock:
+            if not self.running():
+                self.process = None
+                return
+            try:
+                self.process.stdin.write(b'-stay_open\nFalse\n')
+                self.process.stdin.flush()
+                self.process.communicate(timeout=5)
+            except (OSError, ValueError, TimeoutExpired):
+                self.kill()
+            self.process = None
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait()
+        except (OSError, AttributeError):
+            pass
+        self.process = None
+
+    def execute(self, *args):
+        """
+        Run a single exiftool command and return its raw stdout.
+        If exiftool crashed or was never started it is (re)started and the command is retried once.
+        """
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if not self.running():
+                        self.start()
+                    return self.send(args)
+                except OSError:
+                    self.kill()
+            raise ExifToolError('exiftool is not available')
+
+    def send(self, args):
+        if not all(fits_line(arg) for arg in args):
+            raise ValueError('Arguments which do not fit on a line can\'t be sent to exiftool: %r' % (args,))
+        self.counter += 1
+        marker = ('{ready%d}' % self.counter).encode()
+
+        command = [os.fsencode(arg) for arg in ('-charset', 'filename=utf8') + tuple(args)]
+        command.append(('-execute%d' % self.counter).encode())
+        self.process.stdin.write(b'\n'.join(command) + b'\n')
+        self.process.stdin.flush()
+
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise BrokenPipeError('exiftool exited unexpectedly')
+            if line.rstrip() == marker:
+                break
+            output.append(line)
+
+        return b''.join(output)
+
+
+class ExifToolPool(object):
+    """
+    Hands out idle exiftool processes so several threads can read exif data at the same time.
+    A new process is started only when all existing ones are busy.
+    """
+    def __init__(self, executable='exiftool'):
+        self.executable = executable
+        self.tools = []
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def execute(self, *args):
+        with self.lock:
+            if self.idle:
+                tool = self.idle.pop()
+            else:
+                tool = ExifTool(self.executable)
+                self.tools.append(tool)
+        try:
+            return tool.execute(*args)
+        finally:
+            with self.lock:
+                self.idle.append(tool)
+
+    def execute_once(self, *args):
+        """
+        Run a separate exiftool with the arguments on its command line and return its raw stdout.
+        Used for arguments the long-lived processes can't be sent, e.g. file names with line breaks
+        """
+        try:
+            process = Popen([self.executable] + list(args), stdout=PIPE, stderr=DEVNULL)
+        except OSError:
+            raise ExifToolError('exiftool is not available')
+        return process.communicate()[0]
+
+    def stop(self):
+        with self.lock:
+            for tool in self.tools:
+                tool.stop()
+
+
+exiftool = ExifToolPool()
+atexit.register(exiftool.stop)
 
 
 class Exif(object):
@@ -9,13 +150,41 @@ class Exif(object):
         self.file = file
 
     def data(self):
+        execute = exiftool.execute if fits_line(self.file) else exiftool.execute_once
         try:
-            exif_command = 'exiftool -time:all -mimetype -j %s' % shlex.quote(self.file)
-            if sys.platform == 'win32':
-                exif_command = exif_command.replace("\'", "\"")
-            data = check_output(exif_command, shell=True).decode('UTF-8')
+            data = execute('-time:all', '-mimetype', '-j', self.file).decode('UTF-8')
             exif = json.loads(data)[0]
-        except (CalledProcessError, UnicodeDecodeError):
+        except (ExifToolError, ValueError, IndexError):
             return None
 
         return exif
+
+    @staticmethod
+    def batch(files):
+        """
+        Read exif data for many files with a single exiftool command.
+        Results are mapped back to the files by their SourceFile. Files exiftool
+        could not read are mapped to an empty dict. If the whole batch fails
+        each file is read on its own so one bad file does not affect the others.
+        Files whose names can't be sent in a batch, e.g. with line breaks, are read on their own too.
+        """
+        single = [file for file in files if not fits_line(file)]
+        exif_data = dict((file, Exif(file).data() or {}) for file in single)
+        files = [file for file in files if fits_line(file)]
+        if not files:
+            return exif_data
+
+        try:
+            data = exiftool.execute('-time:all', '-mimetype', '-j', *files).decode('UTF-8')
+            items = json.loads(data) if data.strip() else []
+        except (ExifToolError, ValueError):
+            exif_data.update((file, Exif(file).data() or {}) for file in files)
+            return exif_data
+
+        found = {}
+        for item in items:
+            if isinstance(item, dict) and 'SourceFile' in item:
+                found[os.path.normpath(item['SourceFile'])] = item
+
+        exif_data.update((file, found.get(os.path.normpath(file), {})) for file in files)
+        return exif_data
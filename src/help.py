@@ -3,7 +3,7 @@ def help(version):
     phockup - v{version}
 
 SYNOPSIS
-    phockup INPUTDIR OUTPUTDIR [OPTIONS]
+    phockup INPUTDIR [INPUTDIR ...] OUTPUTDIR [OPTIONS]
 
 DESCRIPTION
     Media sorting tool to organize photos and videos from your camera in folders by year, month and day.
@@ -12,7 +12,9 @@ DESCRIPTION
 
 ARGUMENTS
     INPUTDIR
-        Specify the source directory where your photos are located
+        Specify the source directory where your photos are located.
+        Several input directories are processed together in a single run.
+        A zip or tar archive can be used as input directory too.
 
     OUTPUTDIR
         Specify the output directory where your photos should be exported
@@ -43,6 +45,7 @@ OPTIONS
 
     -m | --move
         Instead of copying the process will move all files from the INPUTDIR to the OUTPUTDIR.
+        Files moved from another filesystem are verified before they are deleted from the INPUTDIR.
         This is useful when working with a big collection of files and the
         remaining free space is not enough to make a copy of the INPUTDIR.
 
@@ -50,6 +53,19 @@ OPTIONS
         Instead of copying the process will make hard links to all files in INPUTDIR and place them in the OUTPUTDIR.
         This is useful when working with working structure and want to create YYYY/MM/DD structure to point to same files.
 
+    --reflink
+        Instead of copying the process will create copy-on-write clones (reflinks) of the files in OUTPUTDIR.
+        On filesystems supporting it (e.g. Btrfs, XFS) this is instant and takes no additional space.
+        File metadata is preserved the same way as when copying.
+
+        The mode is required, a bare --reflink is not accepted. Supported modes:
+            auto   - clone when possible, otherwise copy the files
+            always - clone the files and fail if the filesystem doesn't support it.
+                     Files are still copied when OUTPUTDIR is on another filesystem
+
+        Example:
+            --reflink=auto
+
     -o | --original-names
         Organize the files in selected format or using the default year/month/day format but keep original filenames.
 
@@ -83,5 +99,159 @@ OPTIONS
 
     -y | --dry-run
         Don't move any files, just show which changes would be done.
+
+    --batch-size
+        Number of files whose EXIF data is read with a single exiftool call. Default is 100.
+
+    --workers
+        Number of files processed at the same time. Each worker reads EXIF data with its own exiftool
+        process and copies, moves or links files in parallel. The result is the same as with a single worker.
+
+    --exif-workers
+        Number of exiftool processes reading EXIF data at the same time. Defaults to the number of workers.
+
+    --transfer-workers
+        Number of files copied, moved or linked at the same time. Defaults to the number of workers.
+
+    --cache
+        Keep the EXIF data of processed files in a cache in OUTPUTDIR/.phockup/cache.sqlite.
+        Files which did not change since they were read (same path, size, modification time and inode)
+        are not read by exiftool again on the next run.
+
+    --cache-path
+        Use the cache file at the given path instead of the one in OUTPUTDIR.
+
+    --cache-limit
+        Maximum number of files kept in the cache. The least recently used ones are removed. Default is 1000000.
+
+    --clear-cache
+        Remove all entries from the cache before processing the files.
+
+    --index
+        Keep an index of the checksums of all files in OUTPUTDIR in OUTPUTDIR/.phockup/index.sqlite.
+        A file which is already stored anywhere in OUTPUTDIR is skipped as a duplicate,
+        even when it has a different name or date directory.
+
+    --index-path
+        Use the index file at the given path instead of the one in OUTPUTDIR.
+
+    --rebuild-index
+        Index all files which are already in OUTPUTDIR before processing. Use it once for
+        directories created before the index was used. Implies --index.
+
+    --hash
+        Hash algorithm used to compare files: sha256 (default), blake2b or xxhash.
+        xxhash requires the xxhash Python package. Changing the algorithm rebuilds the index.
+
+    --resume
+        Continue a run which was interrupted. Every transfer is recorded in OUTPUTDIR/.phockup/journal
+        and files which were already processed are skipped without reading their EXIF data again.
+        Transfers left half done are always finished or rolled back, even without this option.
+
+    --incremental
+        Process only files which are new or changed since the previous incremental run.
+        Processed input files are recorded with their size and modification time in
+        OUTPUTDIR/.phockup/manifest.sqlite.
+
+    --scan-workers
+        Number of directories of INPUTDIR listed at the same time. Useful on network drives. Default is 1.
+
+    --unordered
+        Process files in the order they are found instead of sorted by name. Directories are not
+        sorted before processing which is faster for big directories, but when several files get
+        the same name the -2, -3 ... suffixes may differ between runs.
+
+    --exiftool-only
+        Read metadata of all files with exiftool. By default files which are clearly not images or
+        videos (by their content and extension, e.g. text files or archives) are moved to the unknown
+        directory without starting exiftool. The dates of JPEG, HEIC, TIFF based RAW
+        (CR2, NEF, ARW, DNG) and MP4/MOV files are read directly by phockup and only the other
+        files, or files without dates in the expected places, are read by exiftool.
+        Native reading is not used when --date-field lists fields other than
+        CreateDate, DateTimeOriginal, ModifyDate and their SubSec variants.
+
+    --plan
+        Plan the run without changing anything, like --dry-run, and write the plan to the given file.
+        Files which get the same name are suffixed the same way as in a real run.
+
+        Example:
+            --plan=~/phockup-plan.jsonl
+
+    --apply-plan
+        Transfer the files of a plan written by --plan without reading their metadata again.
+        Use it with the same INPUTDIR and OUTPUTDIR, a plan written for others is refused.
+        Choose the strategy with -m, -l or --reflink.
+        Files whose target was created by something else since the plan was written are skipped.
+
+        Example:
+            --apply-plan=~/phockup-plan.jsonl
+
+    --watch
+        After processing INPUTDIR keep running and process new files as they appear in it until
+        interrupted with Ctrl-C. Uses inotify when the inotify_simple Python package is installed
+        and checks INPUTDIR every second otherwise.
+
+    --watch-settle
+        Seconds a new file has to keep its size and modification time before it is processed
+        in watch mode. Default is 2.
+
+        Example:
+            --watch-settle=10
+
+    --watch-polling
+        Check INPUTDIR every second in watch mode instead of using inotify.
+
+    --archives
+        Read the images and videos in zip and tar archives (also compressed .tar.gz, .tar.bz2
+        and .tar.xz) found in INPUTDIR instead of treating the archives as unknown files.
+        Members are streamed to OUTPUTDIR without extracting the archives. An archive given as
+        INPUTDIR is always read this way. Members are always copied, even with -m or -l.
+
+    --inputs-from
+        Read input directories from a file, one per line. Lines starting with # are ignored.
+        With this option INPUTDIR can be left out.
+
+        Example:
+            --inputs-from=~/cards.txt
+
+    --server
+        Start a server which runs the jobs sent with --connect. exiftool, metadata caches and
+        indexes stay open between the jobs. Jobs with the same OUTPUTDIR are run one after the other.
+        Use it as the only option: phockup.py --server [--socket=PATH]
+
+    --connect
+        Send the job to a running server instead of processing the files in this process and
+        print what the server reports. Closing the client cancels the job.
+
+    --socket
+        Unix socket of the server. Default is phockup.sock in $XDG_RUNTIME_DIR or the home directory.
+
+        Example:
+            --socket=/tmp/phockup.sock
+
+    -q | --quiet
+        Print only errors and warnings.
+
+    -v | --verbose
+        Print also details about reading metadata of every batch of files.
+
+    --log-format
+        Format of the output: text (default) or json. In json format every message is a JSON object
+        on a separate line. Results of processed files have the source, target and status fields.
+
+        Example:
+            --log-format=json
+
+    --progress
+        Print the number of processed files, files/s and MB/s every few seconds.
+        The estimated time left is shown once the whole INPUTDIR was scanned.
+
+    --report
+        Write a JSON report of the run to the given file. It contains the number of scanned,
+        transferred, duplicated, unknown and skipped files, the transferred bytes and the time
+        spent in each stage (scan, exif, checksum, date, duplicate, transfer) with a histogram of the durations.
+
+        Example:
+            --report=~/phockup-report.json
 """.format(version=version,
            regex="(?P<day>\d{2})\.(?P<month>\d{2})\.(?P<year>\d{4})[_-]?(?P<hour>\d{2})\.(?P<minute>\d{2})\.(?P<second>\d{2})"))
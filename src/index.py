@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+
+
+class HashIndex(object):
+    """
+    SQLite index of the output directory mapping file checksums to their paths.
+    It is updated as files are written so a duplicate is found with a single lookup
+    wherever it is stored. Paths are kept relative to the output directory.
+    algorithm is the one the index was built with. It differs from the requested one
+    until the index is rebuilt. Changes are committed in batches of commit_every and on close.
+    """
+    commit_every = 1000
+
+    def __init__(self, path, root, algorithm='sha256'):
+        self.path = path
+        self.root = root
+        self.requested_algorithm = algorithm
+        self.lock = threading.Lock()
+        self.uncommitted = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, checksum TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS files_checksum ON files (checksum)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', ('algorithm', algorithm))
+        self.connection.commit()
+
+        self.algorithm = self.connection.execute('SELECT value FROM meta WHERE key = ?', ('algorithm',)).fetchone()[0]
+
+    def relative(self, file):
+        return os.path.relpath(file, self.root)
+
+    def find(self, checksum):
+        """
+        Return the path of a file with the checksum. Entries of files which no longer exist are removed
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT path FROM files WHERE checksum = ?', (checksum,)).fetchall()
+            for row in rows:
+                file = os.path.join(self.root, row[0])
+                if os.path.isfile(file):
+                    return file
+                self.connection.execute('DELETE FROM files WHERE path = ?', (row[0],))
+                self.changed()
+        return None
+
+    def add(self, checksum, file):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (self.relative(file), checksum))
+            self.changed()
+
+    def remove(self, file):
+        with self.lock:
+            self.connection.execute('DELETE FROM files WHERE path = ?', (self.relative(file),))
+            self.changed()
+
+    def changed(self):
+        """
+        Count a change made with the lock held and commit when a batch is complete
+        """
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def rebuild(self, checksum, ignored_dirs=()):
+        """
+        Index all files in the output directory from scratch using the checksum function
+        """
+        rows = []
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = [directory for directory in dirs if directory not in ignored_dirs]
+            for filename in files:
+                file = os.path.join(root, filename)
+                if os.path.isfile(file):
+                    rows.append((self.relative(file), checksum(file)))
+
+        with self.lock:
+            self.connection.execute('DELETE FROM files')
+            self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?)', rows)
+            self.connection.execute('UPDATE meta SET value = ? WHERE key = ?', (self.requested_algorithm, 'algorithm'))
+            self.connection.commit()
+            self.uncommitted = 0
+            self.algorithm = self.requested_algorithm
+        return len(rows)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+
+def temp_file(target):
+    """
+    Temporary name next to the target. Files are written there and renamed when complete
+    """
+    directory, name = os.path.split(target)
+    return os.path.join(directory, '.%s.phockup-tmp' % name)
+
+
+class Journal(object):
+    """
+    Write-ahead journal of the transfers of a run stored as JSON lines.
+    A start entry is written before a file is transferred and a done entry after the file
+    and its xmp files are in place. Entries started but never done are left by an
+    interrupted run and are recovered by the next one.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        self.pending = {}
+        self.file = None
+        self.mode = 'a'
+        self.closed = False
+
+        if os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line can be incomplete if the run was killed while writing it
+                    continue
+                if entry.get('op') == 'start':
+                    self.pending[entry['source']] = entry
+                elif entry.get('op') == 'done':
+                    self.pending.pop(entry['source'], None)
+                    self.done.add(entry['source'])
+                elif entry.get('op') == 'undo':
+                    self.pending.pop(entry['source'], None)
+
+    def open(self, resume=False):
+        """
+        Start a journal for a new run. When resuming the entries of the previous run are kept.
+        The file itself is written only when the first entry is added
+        """
+        self.mode = 'a' if resume else 'w'
+        self.closed = False
+        if not resume:
+            self.done = set()
+        return self
+
+    def write(self, entry):
+        """
+        Add an entry. A closed journal refuses it rather than reopening the file
+        """
+        with self.lock:
+            if self.closed:
+                raise ValueError('The journal %s is closed' % self.path)
+            if self.file is None:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                self.file = open(self.path, self.mode)
+                # The entries written from now on are never truncated
+                self.mode = 'a'
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+
+    def start(self, source, target, **details):
+        entry = dict(details, op='start', source=os.path.abspath(source), target=target)
+        self.write(entry)
+        with self.lock:
+            self.pending[entry['source']] = entry
+
+    def finish(self, source):
+        source = os.path.abspath(source)
+        with self.lock:
+            self.pending.pop(source, None)
+            self.done.add(source)
+        self.write({'op': 'done', 'source': source})
+
+    def undo(self, source):
+        """
+        Forget a started transfer which was rolled back
+        """
+        source = os.path.abspath(source)
+        with self.lock:
+            self.pending.pop(source, None)
+        self.write({'op': 'undo', 'source': source})
+
+    def compact(self):
+        """
+        Forget the done entries and rewrite the journal with only the pending ones, so a journal
+        which is never closed, e.g. of a watch, doesn't grow without bound
+        """
+        with self.lock:
+            if self.closed:
+                return
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.done = set()
+            if not self.pending:
+                if os.path.isfile(self.path):
+                    os.remove(self.path)
+                return
+
+            temp = self.path + '.tmp'
+            with open(temp, 'w') as f:
+                for entry in self.pending.values():
+                    f.write(json.dumps(entry) + '\n')
+            os.replace(temp, self.path)
+            self.mode = 'a'
+
+    def is_done(self, source):
+        return os.path.abspath(source) in self.done
+
+    def close(self, remove=False):
+        with self.lock:
+            self.closed = True
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if remove and os.path.isfile(self.path):
+                os.remove(self.path)
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import threading
+
+
+class Manifest(object):
+    """
+    SQLite list of the input files which were already processed together with their size and
+    modification time. A file which is in the manifest and did not change since is not processed again.
+    """
+    commit_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.uncommitted = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)')
+        self.connection.commit()
+
+    def is_processed(self, file, stat=None):
+        """
+        Check if the file was processed and did not change since. An already known stat result can be passed
+        """
+        try:
+            stat = stat or os.stat(file)
+        except OSError:
+            return False
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT size, mtime FROM files WHERE path = ?', (os.path.abspath(file),)
+            ).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns
+
+    def add(self, file, stat=None):
+        try:
+            stat = stat or os.stat(file)
+        except OSError:
+            return
+
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?)',
+                (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.connection.commit()
+                self.uncommitted = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
@@ -0,0 +1,76 @@
+import os
+
+# Leading bytes of image and video formats
+media_signatures = (
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a', b'GIF89a',
+    b'II*\x00', b'MM\x00*',  # TIFF, CR2, NEF, ARW, DNG ...
+    b'IIRO', b'IIRS', b'IIU\x00',  # ORF, RW2
+    b'II\x1a\x00\x00\x00HEAPCCDR',  # CRW
+    b'FUJIFILMCCD-RAW',
+    b'FOVb',  # X3F
+    b'\x00MRM',  # MRW
+    b'8BPS',  # PSD
+    b'BM',
+    b'\x00\x00\x00\x0cjP  \r\n\x87\n',  # JPEG 2000
+    b'\xff\x4f\xff\x51',  # JPEG 2000 codestream
+    b'\x1a\x45\xdf\xa3',  # Matroska, WebM
+    b'\x00\x00\x01\xba', b'\x00\x00\x01\xb3',  # MPEG
+    b'\x30\x26\xb2\x75\x8e\x66\xcf\x11',  # ASF, WMV
+    b'FLV',
+    b'<svg', b'<?xml',
+)
+
+# Leading bytes of formats which are never images or videos
+other_signatures = (
+    b'PK\x03\x04', b'PK\x05\x06',  # ZIP, Office documents
+    b'%PDF',
+    b'\x1f\x8b',  # gzip
+    b'7z\xbc\xaf\x27\x1c',
+    b'Rar!',
+    b'\x7fELF',
+    b'MZ',
+    b'SQLite format 3\x00',
+    b'\xd0\xcf\x11\xe0',  # Old Office documents
+)
+
+# Extensions of files which are never images or videos unless their content says so
+other_extensions = {
+    '.txt', '.log', '.csv', '.json', '.ini', '.cfg', '.md', '.html', '.htm', '.css', '.js', '.py',
+    '.zip', '.gz', '.tar', '.7z', '.rar', '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    '.db', '.sqlite', '.exe', '.dll', '.bin', '.dat', '.tmp', '.lnk', '.url', '.ds_store',
+}
+
+
+def is_media(file):
+    """
+    Guess from the first bytes and the extension if the file is an image or a video.
+    Returns True for media, False for files which are clearly not media and
+    None when only exiftool can tell
+    """
+    try:
+        with open(file, 'rb') as f:
+            header = f.read(32)
+    except OSError:
+        return None
+    return is_media_header(header, file)
+
+
+def is_media_header(header, file):
+    """
+    is_media for the first bytes of a file which were read already
+    """
+    if not header:
+        return False
+    if header.startswith(media_signatures):
+        return True
+    if header[4:8] == b'ftyp':  # MP4, MOV, 3GP, HEIC, AVIF, CR3
+        return True
+    if header[:4] == b'RIFF' and header[8:12] in (b'WEBP', b'AVI '):
+        return True
+    if header.startswith(other_signatures):
+        return False
+    if os.path.splitext(file)[1].lower() in other_extensions:
+        return False
+    return None
@@ -0,0 +1,384 @@
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+
+from src.date import default_date_fields
+
+# Date fields the native reader can produce. Other fields are only available from exiftool
+fields = (
+    'SubSecCreateDate', 'SubSecDateTimeOriginal', 'SubSecModifyDate',
+    'CreateDate', 'DateTimeOriginal', 'ModifyDate',
+)
+
+tiff_types = {
+    '.cr2': 'image/x-canon-cr2',
+    '.nef': 'image/x-nikon-nef',
+    '.arw': 'image/x-sony-arw',
+    '.dng': 'image/x-adobe-dng',
+}
+
+# EXIF tags with the date fields they are reported as by exiftool
+ifd0_tags = {0x0132: 'ModifyDate'}
+exif_ifd_tag = 0x8769
+exif_tags = {
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'CreateDate',
+    0x9010: 'OffsetTime',
+    0x9011: 'OffsetTimeOriginal',
+    0x9012: 'OffsetTimeDigitized',
+    0x9290: 'SubSecTime',
+    0x9291: 'SubSecTimeOriginal',
+    0x9292: 'SubSecTimeDigitized',
+}
+subsec_fields = (
+    ('SubSecCreateDate', 'CreateDate', 'SubSecTimeDigitized', 'OffsetTimeDigitized'),
+    ('SubSecDateTimeOriginal', 'DateTimeOriginal', 'SubSecTimeOriginal', 'OffsetTimeOriginal'),
+    ('SubSecModifyDate', 'ModifyDate', 'SubSecTime', 'OffsetTime'),
+)
+
+quicktime_epoch = datetime(1904, 1, 1)
+quicktime_brands = (b'qt  ', b'isom', b'iso2', b'mp41', b'mp42', b'avc1', b'M4V ')
+
+# Bytes read from the beginning of a stream and largest moov box read from further on
+header_size = 1024 * 1024
+moov_limit = 64 * 1024 * 1024
+
+
+class NativeReader(object):
+    """
+    Read the dates phockup needs straight from JPEG, HEIC, TIFF based RAW and MP4/MOV files
+    without starting exiftool. The result has the same keys exiftool reports for these fields.
+    read returns None for any file it can't handle so it can be read by exiftool instead.
+    date_fields are the fields the date is taken from. Files without any of them are left to exiftool too
+    """
+    def __init__(self, date_fields=default_date_fields):
+        self.date_fields = tuple(date_fields)
+
+    def read(self, file):
+        try:
+            with open(file, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < 12:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self.parse(file, data)
+        except (OSError, ValueError, struct.error, IndexError):
+            return None
+
+    def read_stream(self, file, stream, data=None):
+        """
+        Read the dates from the beginning of a stream which can't be mapped, e.g. an archive member.
+        data are the first header_size bytes when they were read already.
+        The moov box QuickTime files often keep at their end is found by skipping the boxes before it
+        """
+        try:
+            if data is None:
+                data = stream.read(header_size)
+            if len(data) < 12:
+                return None
+            if data[4:8] == b'ftyp' and data[8:12] in quicktime_brands:
+                if not self.find_box(data, 0, len(data), b'moov'):
+                    ftyp = struct.unpack('>I', data[:4])[0]
+                    moov = self.stream_box(stream, data, b'moov')
+                    if moov is None:
+                        return None
+                    data = data[:ftyp] + moov
+            return self.parse(file, data)
+        except (OSError, ValueError, struct.error, IndexError):
+            return None
+
+    def stream_box(self, stream, data, kind):
+        """
+        Return the top level box of the kind from a stream of which data was read already.
+        The stream is only read forward
+        """
+        offset = 0
+        position = len(data)
+        while True:
+            head = data[offset:offset + 16]
+            known = data[offset:]
+            if len(head) < 16:
+                if offset > position:
+                    self.skip(stream, offset - position)
+                    position = offset
+                more = stream.read(16 - len(head))
+                position += len(more)
+                head += more
+                known = head
+            if len(head) < 8:
+                return None
+
+            size, box = struct.unpack('>I4s', head[:8])
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', head[8:16])[0]
+                header = 16
+            if size < header:
+                # A box without size extends to the end of the file
+                return None
+            if box == kind:
+                if size > moov_limit:
+                    return None
+                known = known[:size]
+                return known + stream.read(size - len(known))
+            offset += size
+
+    def skip(self, stream, count):
+        if stream.seekable():
+            stream.seek(count, os.SEEK_CUR)
+            return
+        while count > 0:
+            block = stream.read(min(count, 65536))
+            if not block:
+                return
+            count -= len(block)
+
+    def parse(self, file, data):
+        extension = os.path.splitext(file)[1].lower()
+        if data[:3] == b'\xff\xd8\xff':
+            return self.result('image/jpeg', self.jpeg(data))
+        if data[:4] in (b'II*\x00', b'MM\x00*'):
+            return self.result(tiff_types.get(extension, 'image/tiff'), self.tiff(data, 0))
+        if data[4:8] == b'ftyp':
+            brand = data[8:12]
+            if brand in (b'heic', b'heix', b'mif1', b'msf1'):
+                return self.result('image/heic', self.heic(data))
+            if brand == b'qt  ':
+                return self.result('video/quicktime', self.quicktime(data))
+            if brand in quicktime_brands:
+                return self.result('video/mp4', self.quicktime(data))
+        return None
+
+    def result(self, mimetype, dates):
+        """
+        Build exiftool like output. Files without a date in the date fields are left to exiftool
+        which can also find dates in places not read here (e.g. XMP or maker notes)
+        """
+        if not dates:
+            return None
+
+        # Zero dates are written by cameras without a clock set, exiftool may find a real date elsewhere
+        dates = dict((name, value) for name, value in dates.items() if not value.startswith('0000:00:00'))
+
+        exif = {'MIMEType': mimetype}
+        for name in ('CreateDate', 'DateTimeOriginal', 'ModifyDate'):
+            if name in dates:
+                exif[name] = dates[name]
+
+        for name, date, subsec, offset in subsec_fields:
+            if date in dates and (subsec in dates or offset in dates):
+                value = dates[date]
+                if subsec in dates:
+                    value += '.' + dates[subsec]
+                if offset in dates:
+                    value += dates[offset]
+                exif[name] = value
+
+        if not any(name in exif for name in self.date_fields):
+            return None
+        return exif
+
+    def jpeg(self, data):
+        offset = 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xff:
+                return None
+            marker = data[offset + 1]
+            if marker == 0xff:
+                offset += 1
+                continue
+            if marker in (0xd9, 0xda):
+                return None
+            length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+            if marker == 0xe1 and data[offset + 4:offset + 10] == b'Exif\x00\x00':
+                return self.tiff(data, offset + 10)
+            offset += 2 + length
+        return None
+
+    def tiff(self, data, start):
+        order = data[start:start + 2]
+        if order == b'II':
+            endian = '<'
+        elif order == b'MM':
+            endian = '>'
+        else:
+            return None
+
+        ifd0 = struct.unpack(endian + 'I', data[start + 4:start + 8])[0]
+        dates = {}
+        entries = self.ifd(data, start, start + ifd0, endian)
+
+        for tag, name in ifd0_tags.items():
+            if tag in entries:
+                dates[name] = entries[tag]
+        if exif_ifd_tag in entries:
+            exif = self.ifd(data, start, start + entries[exif_ifd_tag], endian)
+            for tag, name in exif_tags.items():
+                if tag in exif:
+                    dates[name] = exif[tag]
+
+        return dates
+
+    def ifd(self, data, start, offset, endian):
+        """
+        Read the ASCII and LONG values of an IFD
+        """
+        values = {}
+        count = struct.unpack(endian + 'H', data[offset:offset + 2])[0]
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            tag, kind, length = struct.unpack(endian + 'HHI', data[entry:entry + 8])
+            if kind == 2:
+                if length <= 4:
+                    raw = data[entry + 8:entry + 8 + length]
+                else:
+                    pointer = struct.unpack(endian + 'I', data[entry + 8:entry + 12])[0]
+                    raw = data[start + pointer:start + pointer + length]
+                value = raw.split(b'\x00')[0].decode('ascii', 'replace').strip()
+                if value:
+                    values[tag] = value
+            elif kind in (4, 13) and length == 1:
+                values[tag] = struct.unpack(endian + 'I', data[entry + 8:entry + 12])[0]
+        return values
+
+    def boxes(self, data, start, end):
+        """
+        Yield type, payload start and end of the ISO base media boxes in the range
+        """
+        offset = start
+        while offset + 8 <= end:
+            size, kind = struct.unpack('>I4s', data[offset:offset + 8])
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+                header = 16
+            elif size == 0:
+                size = end - offset
+            if size < header:
+                return
+            yield kind, offset + header, min(offset + size, end)
+            offset += size
+
+    def find_box(self, data, start, end, kind):
+        for box, payload, box_end in self.boxes(data, start, end):
+            if box == kind:
+                return payload, box_end
+        return None
+
+    def quicktime(self, data):
+        moov = self.find_box(data, 0, len(data), b'moov')
+        if not moov:
+            return None
+        mvhd = self.find_box(data, moov[0], moov[1], b'mvhd')
+        if not mvhd:
+            return None
+
+        version = data[mvhd[0]]
+        if version == 1:
+            created, modified = struct.unpack('>QQ', data[mvhd[0] + 4:mvhd[0] + 20])
+        else:
+            created, modified = struct.unpack('>II', data[mvhd[0] + 4:mvhd[0] + 12])
+
+        # 0 means the time was never set
+        dates = {}
+        if created:
+            dates['CreateDate'] = self.quicktime_date(created)
+        if modified:
+            dates['ModifyDate'] = self.quicktime_date(modified)
+        return dates
+
+    def quicktime_date(self, seconds):
+        return (quicktime_epoch + timedelta(seconds=seconds)).strftime('%Y:%m:%d %H:%M:%S')
+
+    def heic(self, data):
+        """
+        Find the Exif item through the iinf and iloc boxes of the meta box and read it as TIFF
+        """
+        meta = self.find_box(data, 0, len(data), b'meta')
+        if not meta:
+            return None
+        # meta is a full box, skip version and flags
+        start, end = meta[0] + 4, meta[1]
+
+        iinf = self.find_box(data, start, end, b'iinf')
+        iloc = self.find_box(data, start, end, b'iloc')
+        if not iinf or not iloc:
+            return None
+
+        item_id = self.heic_exif_item(data, iinf)
+        if item_id is None:
+            return None
+        location = self.heic_item_location(data, iloc, item_id)
+        if location is None:
+            return None
+
+        # Exif item starts with the offset to the TIFF header
+        skip = struct.unpack('>I', data[location:location + 4])[0]
+        return self.tiff(data, location + 4 + skip)
+
+    def heic_exif_item(self, data, iinf):
+        version = data[iinf[0]]
+        offset = iinf[0] + (8 if version else 6)
+        for kind, payload, end in self.boxes(data, offset, iinf[1]):
+            if kind != b'infe':
+                continue
+            infe_version = data[payload]
+            if infe_version < 2:
+                continue
+            if infe_version == 2:
+                item_id = struct.unpack('>H', data[payload + 4:payload + 6])[0]
+                item_type = data[payload + 8:payload + 12]
+            else:
+                item_id = struct.unpack('>I', data[payload + 4:payload + 8])[0]
+                item_type = data[payload + 10:payload + 14]
+            if item_type == b'Exif':
+                return item_id
+        return None
+
+    def heic_item_location(self, data, iloc, item_id):
+        offset = iloc[0]
+        version = data[offset]
+        sizes = data[offset + 4]
+        offset_size, length_size = sizes >> 4, sizes & 0x0f
+        base_offset_size = data[offset + 5] >> 4
+        index_size = data[offset + 5] & 0x0f if version in (1, 2) else 0
+        offset += 6
+
+        if version < 2:
+            count = struct.unpack('>H', data[offset:offset + 2])[0]
+            offset += 2
+        else:
+            count = struct.unpack('>I', data[offset:offset + 4])[0]
+            offset += 4
+
+        for _ in range(count):
+            if version < 2:
+                current = struct.unpack('>H', data[offset:offset + 2])[0]
+                offset += 2
+            else:
+                current = struct.unpack('>I', data[offset:offset + 4])[0]
+                offset += 4
+            if version in (1, 2):
+                offset += 2
+            offset += 2  # data reference index
+            base = self.number(data, offset, base_offset_size)
+            offset += base_offset_size
+            extents = struct.unpack('>H', data[offset:offset + 2])[0]
+            offset += 2
+
+            first = None
+            for i in range(extents):
+                offset += index_size
+                extent_offset = self.number(data, offset, offset_size)
+                offset += offset_size + length_size
+                if first is None:
+                    first = extent_offset
+
+            if current == item_id:
+                return base + (first or 0)
+        return None
+
+    def number(self, data, offset, size):
+        if size == 0:
+            return 0
+        return int.from_bytes(data[offset:offset + size], 'big')
@@ -1,90 +1,849 @@
 #!/usr/bin/env python3
-import hashlib
+import json
+import mimetypes
 import os
+import queue
 import re
 import shutil
 import sys
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
 
+from src.archive import Archives, MemberDigest, MemberError, is_archive, read_errors
+from src.cache import MetadataCache
+from src.checksum import FileDigest
 from src.date import Date
 from src.exif import Exif
+from src.index import HashIndex
+from src.journal import Journal, temp_file
+from src.manifest import Manifest
+from src.mime import is_media, is_media_header
+from src.native import NativeReader, fields as native_fields, header_size
+from src.pipeline import Pipeline, Stage
 from src.printer import Printer
+from src.scanner import Scanner, interleave
+from src.stats import Stats
+from src.transfer import MoveError, ReflinkError, move, reflink
+from src.watcher import Watcher
 
 printer = Printer()
 ignored_files = (".DS_Store", "Thumbs.db")
+state_dir = '.phockup'
+media_mimetype = re.compile('^(image/.+|video/.+|application/vnd.adobe.photoshop)$')
+
+
+# Result of a processed file passed to callbacks and yielded by Phockup.results.
+# action is copied, moved, linked, cloned or planned for a transferred file, otherwise
+# duplicate, missing, conflict, recovered or rolled back. date_source is exif, filename,
+# timestamp or None and timings has the seconds spent on the file in the date, duplicate and transfer stages
+Result = namedtuple('Result', ('source', 'target', 'action', 'date_source', 'timings', 'message'))
+
+
+class PhockupError(Exception):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def format_dir(day, dir_format):
+    return day.strftime(dir_format)
 
 
 class Phockup():
+    """
+    Organize the files of input into output. By default the files are processed by the constructor.
+    To use phockup as a library pass run=False and call run or iterate over results.
+    Every callback is called with the Result of each processed file and every messages callback
+    with the level and text of each other line the run prints, such as the cache and index statistics.
+    resources can hand out metadata caches and indexes which stay open after the run (see src.server.Resources).
+    With printing=False nothing is printed, results and messages only go to the callbacks
+    """
     def __init__(self, input, output, **args):
-        input = os.path.expanduser(input)
+        inputs = [input] if isinstance(input, str) else list(input)
+        inputs = [os.path.expanduser(input) for input in inputs]
         output = os.path.expanduser(output)
 
-        if input.endswith(os.path.sep):
-            input = input[:-1]
+        inputs = [input[:-1] if input.endswith(os.path.sep) else input for input in inputs]
         if output.endswith(os.path.sep):
             output = output[:-1]
 
-        self.input = input
+        # input can be a list of directories which are processed together in a single run
+        self.inputs = inputs
+        self.input = inputs[0] if inputs else ''
         self.output = output
         self.dir_format = args.get('dir_format', os.path.sep.join(['%Y', '%m', '%d']))
         self.move = args.get('move', False)
         self.link = args.get('link', False)
+        self.reflink = args.get('reflink', None)
         self.original_filenames = args.get('original_filenames', False)
         self.date_regex = args.get('date_regex', None)
         self.timestamp = args.get('timestamp', False)
         self.date_field = args.get('date_field', False)
-        self.dry_run = args.get('dry_run', False)
+        self.plan_path = args.get('plan', None)
+        self.apply_plan_path = args.get('apply_plan', None)
+        self.dry_run = args.get('dry_run', False) or bool(self.plan_path)
+        self.batch_size = max(1, args.get('batch_size', 100))
+        self.workers = max(1, args.get('workers', 1))
+        self.exif_workers = max(1, args.get('exif_workers', self.workers))
+        self.transfer_workers = max(1, args.get('transfer_workers', self.workers))
+        self.queue_size = max(1, args.get('queue_size', 4 * self.workers))
+        self.cache_path = args.get('cache', None)
+        self.cache_limit = args.get('cache_limit', 1000000)
+        self.clear_cache = args.get('clear_cache', False)
+        self.index_path = args.get('index', None)
+        self.hash_algorithm = args.get('hash_algorithm', 'sha256')
+        self.rebuild_index = args.get('rebuild_index', False)
+        self.resume = args.get('resume', False)
+        self.incremental = args.get('incremental', False)
+        self.scan_workers = max(1, args.get('scan_workers', 1))
+        self.ordered = args.get('ordered', True)
+        self.native = not args.get('exiftool_only', False)
+        self.watch = args.get('watch', False)
+        self.watch_settle = args.get('watch_settle', 2.0)
+        self.watch_polling = args.get('watch_polling', False)
+        self.read_archives = args.get('archives', False)
+        self.report_path = args.get('report', None)
+        self.progress = args.get('progress', False)
+        self.printing = args.get('printing', True)
+        self.stats = Stats(self.progress_printer(), self.progress)
+        self.callbacks = list(args.get('callbacks', ()))
+        self.messages = list(args.get('messages', ()))
+        self.resources = args.get('resources', None)
+        self.cancelled = threading.Event()
+
+        # Fields other than the ones the native reader knows are only available from exiftool
+        if self.date_field and not set(self.date_field.split()) <= set(native_fields):
+            self.native = False
+        self.native_reader = NativeReader(self.date_field.split()) if self.date_field else NativeReader()
+
+        if self.cache_path is True:
+            self.cache_path = os.path.join(self.output, state_dir, 'cache.sqlite')
+        if self.index_path is True or (self.rebuild_index and not self.index_path):
+            self.index_path = os.path.join(self.output, state_dir, 'index.sqlite')
+
+        self.reserved = {}
+        self.reserved_checksums = {}
+        self.reserved_lock = threading.Lock()
+        self.planned = {}
+        self.known_dirs = set()
+        self.archives = Archives()
+        self.details = {}
+        self.details_lock = threading.Lock()
+        self.plan_entries = None
+        self.cache = None
+        self.index = None
+        self.journal = None
+        self.manifest = None
 
+        if args.get('run', True):
+            try:
+                self.run()
+            except PhockupError as e:
+                printer.error(str(e))
+
+    def run(self):
+        """
+        Process the files and return the stats of the run. Raises PhockupError when it can't be started
+        """
+        self.cancelled.clear()
+        self.stats = Stats(self.progress_printer(), self.progress)
         self.check_directories()
-        self.walk_directory()
+        if self.apply_plan_path:
+            self.apply_plan()
+        else:
+            self.walk_directory()
+        return self.stats
+
+    def results(self):
+        """
+        Run in a background thread and yield the Result of every file as soon as it is processed.
+        At most queue_size results wait to be taken, a run whose results are not taken waits for them.
+        Closing the generator before the end cancels the run. Errors of the run are raised by the generator
+        """
+        results = queue.Queue(self.queue_size)
+        finished = object()
+        closed = threading.Event()
+        errors = []
+
+        def put(item):
+            # Results nobody takes any more are dropped so the run can stop
+            while not closed.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def run():
+            try:
+                self.run()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                put(finished)
+
+        self.callbacks.append(put)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                result = results.get()
+                if result is finished:
+                    break
+                yield result
+        finally:
+            closed.set()
+            if thread.is_alive():
+                self.cancel()
+                thread.join()
+            self.callbacks.remove(put)
+
+        if errors:
+            raise errors[0]
+
+    def cancel(self):
+        """
+        Stop the run. Files being transferred are finished and the journal is kept so the run can be resumed
+        """
+        self.cancelled.set()
+
+    def progress_printer(self):
+        return printer if self.printing else None
 
     def check_directories(self):
         """
         Check if input and output directories exist.
-        If input does not exists it exits the process
-        If output does not exists it tries to create it or exit with error
+        If an input does not exists it raises PhockupError
+        If output does not exists it tries to create it or raises PhockupError
         """
-        if not os.path.isdir(self.input) or not os.path.exists(self.input):
-            printer.error('Input directory "%s" does not exist or cannot be accessed' % self.input)
-            return
+        if not self.inputs:
+            raise PhockupError('No input directory given')
+        for input in self.inputs:
+            if is_archive(input) and os.path.isfile(input):
+                continue
+            if not os.path.isdir(input) or not os.path.exists(input):
+                raise PhockupError('Input directory "%s" does not exist or cannot be accessed' % input)
+        self.inputs = self.distinct_inputs()
         if not os.path.exists(self.output):
-            printer.line('Output directory "%s" does not exist, creating now' % self.output)
+            self.log('info', 'Output directory "%s" does not exist, creating now' % self.output)
             try:
                 if not self.dry_run:
                     os.makedirs(self.output)
             except Exception:
-                printer.error('Cannot create output directory. No write access!')
+                raise PhockupError('Cannot create output directory. No write access!')
+
+    def distinct_inputs(self):
+        """
+        Drop inputs which are given twice or are inside another input so no file is scanned twice
+        """
+        roots = [(input, os.path.realpath(input)) for input in self.inputs]
+        inputs = []
+        seen = set()
+        for input, real in roots:
+            if real in seen:
+                continue
+            seen.add(real)
+            parent = next((other for other, other_real in roots if real.startswith(os.path.join(other_real, ''))), None)
+            if parent is not None:
+                self.log('info', 'Skipping input "%s", it is inside "%s"' % (input, parent))
+                continue
+            inputs.append(input)
+        return inputs
 
     def walk_directory(self):
         """
-        Walk input directory recursively and call process_file for each file except the ignored ones
+        Scan input directories recursively and process each file except the ignored ones.
+        Files go through a pipeline of stages connected by bounded queues:
+        scan -> exif data -> target planning -> transfer
+        Planning is done in walk order so the suffixes are the same however many workers are used
+        """
+        if self.watch:
+            self.watch_directory()
+            return
+
+        self.run_pipeline(self.stages(), self.scan_batches())
+
+    def stages(self):
+        return [
+            Stage(self.read_batch, self.exif_workers),
+            Stage(self.plan_batch, ordered=True, expand=True),
+            Stage(self.transfer_plan, self.transfer_workers),
+        ]
+
+    def watch_directory(self):
+        """
+        Process the input directory and then keep processing new files as they appear until the run is cancelled.
+        exiftool, the cache, the index and the known output directories are kept between the changes
+        """
+        watcher = Watcher(self.inputs, ignored_dirs=(state_dir,), settle=self.watch_settle, polling=self.watch_polling)
+        self.open_resources()
+        completed = False
+        try:
+            Pipeline(self.stages(), self.queue_size, self.cancelled).run(self.scan_batches())
+            interrupted = self.cancelled.is_set()
+            self.compact_journal(interrupted)
+            self.log('info', 'Watching %s for new files' % ', '.join('"%s"' % input for input in self.inputs))
+            # Buffered output is only written by later output, which may not come while idle
+            printer.flush()
+            for files in watcher.watch(self.cancelled):
+                Pipeline(self.stages(), self.queue_size, self.cancelled).run(self.watched_batches(files))
+                interrupted = self.cancelled.is_set()
+                self.compact_journal(interrupted)
+                printer.flush()
+            # A watch ends when it is cancelled. Only one cancelled while idle left nothing pending
+            completed = not interrupted
+        finally:
+            watcher.close()
+            self.close_resources(completed)
+
+    def apply_plan(self):
+        """
+        Transfer the files of a plan written by a dry run with --plan without reading their metadata again.
+        Files are transferred in the order they are stored on the disk to keep the reads sequential
+        """
+        entries = sorted(self.read_plan(), key=self.disk_order)
+        self.run_pipeline([Stage(self.apply_entry, self.transfer_workers)], entries)
+
+    def run_pipeline(self, stages, source):
+        self.open_resources()
+        completed = False
+        try:
+            Pipeline(stages, self.queue_size, self.cancelled).run(source)
+            completed = not self.cancelled.is_set()
+        finally:
+            self.close_resources(completed)
+
+    def open_resources(self):
+        self.open_cache()
+        self.open_index()
+        self.open_journal()
+        self.open_manifest()
+        self.open_plan()
+
+    def close_resources(self, completed):
+        self.close_cache()
+        self.close_index()
+        self.close_journal(completed)
+        self.close_manifest()
+        self.close_plan(completed)
+        self.archives.close()
+        self.write_report()
+        printer.flush()
+
+    def write_report(self):
+        """
+        Write counters and stage timings of the run as JSON if a report was requested
+        """
+        if self.stats.progress and self.printing:
+            printer.line(self.stats.progress_line())
+        if self.report_path:
+            self.stats.write_report(self.report_path)
+            self.log('info', 'Report written to %s' % self.report_path)
+
+    def open_cache(self):
+        """
+        Open the metadata cache if one is used. In dry run mode only an existing cache is used and
+        it is not written to, a cache which would be cleared is not used at all
+        """
+        self.cache = None
+        if not self.cache_path or (self.dry_run and (self.clear_cache or not os.path.isfile(self.cache_path))):
+            return
+
+        if self.resources is not None:
+            self.cache = self.resources.cache(self.cache_path, self.cache_limit)
+        else:
+            self.cache = MetadataCache(self.cache_path, self.cache_limit)
+        self.cache_counts = self.cache.hits, self.cache.misses
+        if self.clear_cache:
+            self.cache.clear()
+            self.log('info', 'Metadata cache cleared')
+
+    def close_cache(self):
+        if self.cache is None:
+            return
+
+        hits, misses = self.cache_counts
+        self.log('info', 'Metadata cache: %d hits, %d misses' % (self.cache.hits - hits, self.cache.misses - misses))
+        if self.resources is None:
+            self.cache.close(evict=not self.dry_run)
+        elif not self.dry_run:
+            self.cache.evict()
+        self.cache = None
+
+    def open_index(self):
+        """
+        Open the checksum index of the output directory if one is used. In dry run mode only an existing index is used
+        """
+        self.index = None
+        if not self.index_path or (self.dry_run and not os.path.isfile(self.index_path)):
+            return
+
+        if self.resources is not None:
+            self.index = self.resources.index(self.index_path, self.output, self.hash_algorithm)
+        else:
+            self.index = HashIndex(self.index_path, self.output, self.hash_algorithm)
+        if self.index.algorithm != self.hash_algorithm and not self.rebuild_index:
+            self.log('info', 'Index was built with %s checksums' % self.index.algorithm)
+            if self.dry_run:
+                self.close_index()
+                return
+            self.rebuild_index = True
+        if self.rebuild_index and not self.dry_run:
+            self.log('info', 'Rebuilding index of "%s"' % self.output)
+            count = self.index.rebuild(self.checksum, ignored_dirs=(state_dir,))
+            self.log('info', 'Indexed %d files' % count)
+
+    def close_index(self):
+        if self.index is None:
+            return
+
+        if self.resources is None:
+            self.index.close()
+        else:
+            # The index stays open in the server, its changes are saved at the end of every job
+            self.index.commit()
+        self.index = None
+
+    def open_journal(self):
+        """
+        Open the journal of the transfers and recover the ones an interrupted run left behind
         """
-        for root, _, files in os.walk(self.input):
-            files.sort()
-            for filename in files:
-                if filename in ignored_files:
+        self.journal = None
+        if self.dry_run:
+            return
+
+        self.journal = Journal(os.path.join(self.output, state_dir, 'journal')).open(self.resume)
+        self.recover_journal()
+
+    def recover_journal(self):
+        """
+        Finish or roll back the transfers started but not done by an interrupted run.
+        A complete target is kept and its xmp files are processed. A temporary file is always removed,
+        a move removes its source only once the verified file has its target name so it is never complete.
+        A moved file whose source is still there is finished when the target has its content and rolled back otherwise
+        """
+        for source, entry in sorted(self.journal.pending.items()):
+            target = entry['target']
+            temp = temp_file(target)
+
+            if os.path.isfile(temp):
+                os.remove(temp)
+
+            if entry.get('move') and os.path.isfile(target) and os.path.isfile(source):
+                # Interrupted after the target was in place but before the source was removed
+                if self.digest(source).matches(FileDigest(target, self.hash_algorithm)):
+                    os.remove(source)
+                else:
+                    os.remove(target)
+
+            if not os.path.isfile(target):
+                self.add_result(source, 'rolled back interrupted transfer', 'rolled back')
+                self.journal.undo(source)
+                continue
+
+            self.add_result(source, 'finished interrupted transfer to %s' % target, 'recovered', target)
+            if not entry.get('xmp'):
+                self.process_xmp(source, entry['name'], entry['suffix'], entry['output'], recovering=True)
+            self.journal.finish(source)
+
+    def close_journal(self, completed):
+        """
+        Close the journal. It is removed after a completed run and kept for --resume otherwise.
+        The state directory is removed with it when nothing else is kept there
+        """
+        if self.journal is None:
+            return
+
+        self.journal.close(remove=completed)
+        self.journal = None
+        if completed:
+            try:
+                os.rmdir(os.path.join(self.output, state_dir))
+            except OSError:
+                pass
+
+    def compact_journal(self, interrupted):
+        """
+        Drop the finished transfers of a batch of a watch from the journal. An interrupted batch keeps them for --resume
+        """
+        if self.journal is not None and not interrupted:
+            self.journal.compact()
+
+    def journal_start(self, source, target, **details):
+        if self.journal is not None:
+            # Archive members are copied, a partial copy is never kept
+            move = self.move and self.archives.find(source) is None
+            self.journal.start(source, target, move=move, **details)
+
+    def journal_finish(self, source):
+        if self.journal is not None:
+            self.journal.finish(source)
+
+    def open_manifest(self):
+        """
+        Open the manifest of processed input files in incremental mode. In dry run mode only an existing one is used
+        """
+        self.manifest = None
+        path = os.path.join(self.output, state_dir, 'manifest.sqlite')
+        if not self.incremental or (self.dry_run and not os.path.isfile(path)):
+            return
+
+        self.manifest = Manifest(path)
+
+    def close_manifest(self):
+        if self.manifest is None:
+            return
+
+        self.log('info', 'Skipped %d files processed by a previous run' % self.stats['unchanged'])
+        self.manifest.close()
+        self.manifest = None
+
+    def manifest_add(self, file):
+        if self.manifest is not None and not self.dry_run:
+            self.manifest.add(file, self.stat_file(file))
+
+    def open_plan(self):
+        self.plan_entries = [] if self.plan_path else None
+
+    def close_plan(self, completed):
+        """
+        Write the plan of a completed dry run. The header records the inputs and the output
+        the plan is for, paths in the output directory are relative to it
+        """
+        if self.plan_entries is None:
+            return
+
+        if completed:
+            directory = os.path.dirname(self.plan_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.plan_path, 'w') as f:
+                header = {'plan': 1, 'input': os.path.abspath(self.input), 'output': os.path.abspath(self.output)}
+                if len(self.inputs) > 1:
+                    header['inputs'] = [os.path.abspath(input) for input in self.inputs]
+                f.write(json.dumps(header) + '\n')
+                for entry in sorted(self.plan_entries, key=lambda entry: entry['source']):
+                    f.write(json.dumps(entry) + '\n')
+            self.log('info', 'Plan of %d files written to %s' % (len(self.plan_entries), self.plan_path))
+        self.plan_entries = None
+
+    def plan_add(self, file, output, target_file_name, target_file, suffix, duplicate):
+        if self.plan_entries is None:
+            return
+
+        with self.reserved_lock:
+            checksum = self.planned.get(target_file, (None, None))[1]
+            self.plan_entries.append({
+                'source': os.path.abspath(file),
+                'output': os.path.relpath(output, self.output),
+                'name': target_file_name,
+                'target': os.path.relpath(target_file, self.output),
+                'suffix': suffix,
+                'duplicate': duplicate,
+                'checksum': checksum,
+            })
+
+    def read_plan(self):
+        """
+        Read the entries of a plan. Raises PhockupError when it was written for other directories
+        """
+        try:
+            with open(self.apply_plan_path) as f:
+                header = json.loads(f.readline())
+                if not isinstance(header, dict) or header.get('plan') != 1:
+                    raise ValueError
+                entries = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            raise PhockupError('Cannot read plan "%s"' % self.apply_plan_path)
+
+        inputs = header.get('inputs', [header.get('input')])
+        if inputs != [os.path.abspath(input) for input in self.inputs]:
+            raise PhockupError('Plan "%s" was written for input %s' % (
+                self.apply_plan_path, ', '.join('"%s"' % input for input in inputs)))
+        if header.get('output') != os.path.abspath(self.output):
+            raise PhockupError('Plan "%s" was written for output "%s"' % (self.apply_plan_path, header.get('output')))
+        return entries
+
+    def disk_order(self, entry):
+        """
+        Sort key of a plan entry. Members of an archive are kept in the order they are stored in it
+        """
+        file = entry['source']
+        archive = self.archives.find(file)
+        position = 0
+        if archive is not None:
+            position = archive.position(file)
+            file = archive.path
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return 0, 0, position, entry['source']
+        return stat.st_dev, stat.st_ino, position, entry['source']
+
+    def apply_entry(self, entry):
+        """
+        Transfer a file of a plan. A target which appeared since the plan was made is compared with the file
+        and the file is skipped either as a duplicate or as a conflict to be planned again
+        """
+        file = entry['source']
+        output = os.path.join(self.output, entry['output'])
+        target_file = os.path.join(self.output, entry['target'])
+        duplicate = entry['duplicate']
+
+        if not duplicate and os.path.isfile(target_file):
+            if not self.digest(file).matches(FileDigest(target_file, self.hash_algorithm)):
+                self.add_result(file, 'skipped, %s exists since the plan was made' % target_file, 'conflict', target_file)
+                self.stats.count('skipped')
+                return
+            duplicate = True
+
+        if not duplicate:
+            if not self.dry_run:
+                with self.reserved_lock:
+                    self.reserved[target_file] = threading.Event(), entry.get('checksum')
+
+        self.transfer_file(file, output, entry['name'], target_file, entry['suffix'], duplicate)
+
+    def scan_batches(self):
+        """
+        Yield the files to process in batches of batch_size so their exif data is read with a single exiftool call.
+        The batches of several inputs take turns so the workers read from all of them at the same time
+        """
+        for batch in interleave([self.scan_input(input) for input in self.inputs]):
+            yield batch
+        self.stats.finish_scan()
+
+    def scan_input(self, input):
+        batch = []
+        start = time.perf_counter()
+        for name, file, stat in self.input_files(input):
+            if self.skip_file(name, file, stat):
+                continue
+
+            batch.append(file)
+            self.stats.count('scanned')
+            if len(batch) >= self.batch_size:
+                # Time spent by the consumer of the batch is not part of the scan
+                self.stats.record('scan', time.perf_counter() - start)
+                yield batch
+                batch = []
+                start = time.perf_counter()
+
+        if batch:
+            self.stats.record('scan', time.perf_counter() - start)
+            yield batch
+
+    def input_files(self, input):
+        """
+        Yield the name, path and a function returning the stat result of every file of an input.
+        An input can be an archive. With archives enabled the archives in input are read as well
+        """
+        if os.path.isfile(input):
+            for item in self.archive_files(input):
+                yield item
+            return
+
+        for entry in Scanner(input, self.scan_workers, self.ordered, ignored_dirs=(state_dir,)):
+            if self.read_archives and is_archive(entry.name) and self.archives.open(entry.path) is not None:
+                for item in self.archive_files(entry.path):
+                    yield item
+                continue
+            yield entry.name, entry.path, lambda entry=entry: self.stat(entry)
+
+    def archive_files(self, path):
+        """
+        Yield the members of an archive like input_files does for files
+        """
+        archive = self.archives.open(path)
+        if archive is None:
+            self.log('warning', 'Cannot read archive "%s"' % path)
+            return
+        for member in archive:
+            yield os.path.basename(member), member, lambda member=member: archive.stat(member)
+
+    def watched_batches(self, files):
+        """
+        Yield the new files found by the watcher in batches like scan_batches
+        """
+        batch = []
+        for name, file, stat in self.watched_files(files):
+            if name.endswith('.phockup-tmp') or self.skip_file(name, file, stat):
+                continue
+            batch.append(file)
+            self.stats.count('scanned')
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def watched_files(self, files):
+        for file in files:
+            if self.read_archives and is_archive(file) and self.archives.open(file) is not None:
+                for item in self.archive_files(file):
+                    yield item
+                continue
+            yield os.path.basename(file), file, lambda file=file: self.stat_file(file)
+
+    def skip_file(self, name, file, stat):
+        """
+        Check if a file found in the input is not processed. stat is called only when the manifest needs it
+        """
+        if name in ignored_files or str.endswith(name, '.xmp'):
+            return True
+        if self.resume and self.journal is not None and self.journal.is_done(file):
+            return True
+        if self.manifest is not None and self.manifest.is_processed(file, stat()):
+            self.stats.count('unchanged')
+            return True
+        return False
+
+    def stat_file(self, file):
+        archive = self.archives.find(file)
+        if archive is not None:
+            return archive.stat(file)
+        try:
+            return os.stat(file)
+        except OSError:
+            return None
+
+    def stat(self, entry):
+        try:
+            return entry.stat()
+        except OSError:
+            return None
+
+    def read_batch(self, files):
+        """
+        Read the exif data of a batch of files. With an index the whole files are hashed here too,
+        in the parallel workers rather than in the single planning thread
+        """
+        with self.stats.timer('exif'):
+            exif_data = self.read_exif(files)
+        return [(file, exif_data.get(file), self.index_digest(file)) for file in files]
+
+    def index_digest(self, file):
+        """
+        Return the digest of a file with its full checksum computed when an index is used, or None
+        """
+        if self.index is None or not self.is_file(file):
+            return None
+        source = self.digest(file)
+        try:
+            with self.stats.timer('checksum'):
+                source.full()
+        except (FileNotFoundError, MemberError):
+            # Removed since it was scanned or a corrupt member, planning finds that out
+            return None
+        return source
+
+    def read_exif(self, files):
+        """
+        Read exif data of the files. Files which are clearly not images or videos are not read at all
+        and go to the unknown directory. Common formats are read natively when possible.
+        Data of unchanged files is taken from the cache when one is used. The rest is read by exiftool
+        """
+        exif_data = self.read_members(files)
+        files = [file for file in files if file not in exif_data]
+        if self.native:
+            for file in files:
+                media = is_media(file)
+                if media is False:
+                    exif_data[file] = {}
                     continue
+                data = self.native_reader.read(file)
+                if data is not None:
+                    exif_data[file] = data
+            files = [file for file in files if file not in exif_data]
+            self.log('debug', 'Read %d files without exiftool' % len(exif_data))
+
+        if not files:
+            return exif_data
+
+        if self.cache is None:
+            self.log('debug', 'Reading %d files with exiftool' % len(files))
+            exif_data.update(Exif.batch(files))
+            return exif_data
+
+        # A dry run doesn't write to the cache
+        cached, missing = self.cache.get_many(files, touch=not self.dry_run)
+        exif_data.update(cached)
+        self.log('debug', 'Read %d files from the cache, %d with exiftool' % (len(cached), len(missing)))
+        if missing:
+            data = Exif.batch(missing)
+            if not self.dry_run:
+                self.cache.set_many(data)
+            exif_data.update(data)
+        return exif_data
+
+    def read_members(self, files):
+        """
+        Read the exif data of archive members from their first bytes. exiftool can't read them
+        so members whose dates can't be read natively keep only their mimetype
+        """
+        exif_data = {}
+        for file in files:
+            archive = self.archives.find(file)
+            if archive is None:
+                continue
+            try:
+                with archive.open(file) as stream:
+                    header = stream.read(header_size)
+                    data = self.native_reader.read_stream(file, stream, header)
+                    if data is None:
+                        data = self.member_mimetype(file, header[:32])
+            except read_errors + (ValueError,):
+                # A corrupt member gets no metadata, its transfer fails and is reported
+                data = {}
+            exif_data[file] = data
+        return exif_data
+
+    def member_mimetype(self, file, header):
+        mimetype = mimetypes.guess_type(file)[0]
+        if is_media_header(header, file) is False or not mimetype or not self.is_image_or_video(mimetype):
+            return {}
+        return {'MIMEType': mimetype}
 
-                file = os.path.join(root, filename)
-                self.process_file(file)
+    def plan_batch(self, items):
+        """
+        Plan a batch of files and create the output directories they need at once
+        """
+        paths = [(file, self.get_file_name_and_path(file, exif_data), source) for file, exif_data, source in items]
+        if not self.dry_run:
+            for output in sorted(set(path[0] for file, path, source in paths)):
+                self.make_dir(output)
+
+        for file, path, source in paths:
+            plan = self.plan_target(file, *path, source=source)
+            if plan is not None:
+                yield plan
+
+    def transfer_plan(self, plan):
+        self.transfer_file(*plan)
+
+    def digest(self, file):
+        archive = self.archives.find(file)
+        if archive is not None:
+            return MemberDigest(archive, file, self.hash_algorithm)
+        return FileDigest(file, self.hash_algorithm)
+
+    def is_file(self, file):
+        return self.archives.find(file) is not None or os.path.isfile(file)
 
     def checksum(self, file):
         """
         Calculate checksum for a file.
         Used to match if duplicated file name is actually a duplicated file
         """
-        block_size = 65536
-        sha256 = hashlib.sha256()
-        with open(file, 'rb') as f:
-            for block in iter(lambda: f.read(block_size), b''):
-                sha256.update(block)
-        return sha256.hexdigest()
+        return FileDigest(file, self.hash_algorithm).full()
 
     def is_image_or_video(self, mimetype):
         """
         Use mimetype to determine if the file is an image or video
         """
-        pattern = re.compile('^(image/.+|video/.+|application/vnd.adobe.photoshop)$')
-        if pattern.match(mimetype):
+        if media_mimetype.match(mimetype):
             return True
         return False
 
@@ -95,16 +854,21 @@ class Phockup():
         unless user included a regex from filename or uses timestamp
         """
         try:
-            path = [self.output, date['date'].date().strftime(self.dir_format)]
+            path = [self.output, format_dir(date['date'].date(), self.dir_format)]
         except:
             path = [self.output, 'unknown']
 
-        fullpath = os.path.sep.join(path)
+        return os.path.sep.join(path)
 
-        if not os.path.isdir(fullpath) and not self.dry_run:
-            os.makedirs(fullpath)
-
-        return fullpath
+    def make_dir(self, directory):
+        """
+        Create an output directory unless it is known to exist already
+        """
+        # Adding to and checking a set is atomic so workers need no lock, makedirs tolerates races
+        if directory in self.known_dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.known_dirs.add(directory)
 
     def get_file_name(self, file, date):
         """
@@ -115,76 +879,326 @@ class Phockup():
             return os.path.basename(file)
 
         try:
-            filename = [
-                '%04d' % date['date'].year,
-                '%02d' % date['date'].month,
-                '%02d' % date['date'].day,
-                '-',
-                '%02d' % date['date'].hour,
-                '%02d' % date['date'].minute,
-                '%02d' % date['date'].second,
-            ]
-
-            if date['subseconds']:
-                filename.append(date['subseconds'])
-
-            return ''.join(filename) + os.path.splitext(file)[1]
+            value = date['date']
+            filename = '%04d%02d%02d-%02d%02d%02d' % (
+                value.year, value.month, value.day, value.hour, value.minute, value.second
+            )
+            return filename + date['subseconds'] + os.path.splitext(file)[1]
         except:
             return os.path.basename(file)
 
-    def process_file(self, file):
+    def process_file(self, file, exif_data=None):
         """
         Process the file using the selected strategy
         If file is .xmp skip it so process_xmp method can handle it
+        Already extracted exif data can be passed to avoid reading it again
         """
         if str.endswith(file, '.xmp'):
             return None
 
-        printer.line(file, True)
+        plan = self.plan_file(file, exif_data)
+        if plan is not None:
+            self.transfer_file(*plan)
+
+    def plan_file(self, file, exif_data=None):
+        """
+        Decide where the file goes. If a different file already has the target name
+        the name is suffixed with -2, -3 ... until a free one or a duplicate is found.
+        Planned targets are reserved until they are written. A later file planned for
+        the same name waits for the transfer so it can be compared with the written file.
+        With an index of the output directory a duplicate stored anywhere is found by its checksum.
+        Files are compared by size first, then by a checksum of their beginning and end and only
+        then by a checksum of the whole file.
+        """
+        return self.plan_target(file, *self.get_file_name_and_path(file, exif_data))
 
-        output, target_file_name, target_file_path = self.get_file_name_and_path(file)
+    def plan_target(self, file, output, target_file_name, target_file_path, source=None):
+        """
+        Find the target of a file. Its metadata may have been read long before, a file which is gone
+        since, e.g. a link to a file moved by this run, is skipped and None is returned
+        """
+        with self.stats.timer('duplicate') as timer:
+            try:
+                plan = self.find_target(file, output, target_file_name, target_file_path, source)
+            except FileNotFoundError:
+                if self.is_file(file):
+                    raise
+                plan = None
+        self.add_details(file, duplicate=timer.duration)
+        if plan is None:
+            self.add_result(file, 'skipped, no such file or directory', 'missing')
+            self.stats.count('skipped')
+        return plan
 
+    def find_target(self, file, output, target_file_name, target_file_path, source=None):
+        """
+        source is the digest of the file when it was computed already
+        """
         suffix = 1
         target_file = target_file_path
+        if source is None:
+            source = self.digest(file)
+        checksum = None
 
-        while True:
-            if os.path.isfile(target_file):
-                if self.checksum(file) == self.checksum(target_file):
-                    printer.line(' => skipped, duplicated file %s' % target_file)
-                    break
+        if self.index is not None and self.is_file(file):
+            try:
+                checksum = source.full()
+            except MemberError:
+                # A corrupt archive member is not looked up, its transfer fails and is reported
+                pass
             else:
-                if self.move:
-                    try:
-                        if not self.dry_run:
-                            shutil.move(file, target_file)
-                    except FileNotFoundError:
-                        printer.line(' => skipped, no such file or directory')
-                        break
-                elif self.link and not self.dry_run:
-                    os.link(file, target_file)
-                else:
-                    try:
-                        if not self.dry_run:
-                            shutil.copy2(file, target_file)
-                    except FileNotFoundError:
-                        printer.line(' => skipped, no such file or directory')
-                        break
+                existing = self.find_indexed(checksum)
+                if existing is not None:
+                    return file, output, target_file_name, existing, suffix, True
+
+        while True:
+            self.wait_reserved(target_file)
 
-                printer.line(' => %s' % target_file)
-                self.process_xmp(file, target_file_name, suffix, output)
-                break
+            existing = self.planned_content(target_file)
+            if existing is None:
+                with self.reserved_lock:
+                    if self.dry_run:
+                        self.planned[target_file] = file, checksum
+                    else:
+                        self.reserved[target_file] = threading.Event(), checksum
+                    if checksum is not None:
+                        self.reserved_checksums[checksum] = target_file
+                return file, output, target_file_name, target_file, suffix, False
+
+            try:
+                duplicate = source.matches(self.digest(existing))
+            except MemberError:
+                duplicate = False
+            if duplicate:
+                if self.index is not None and not self.dry_run:
+                    self.index.add(source.full(), target_file)
+                return file, output, target_file_name, target_file, suffix, True
 
             suffix += 1
             target_split = os.path.splitext(target_file_path)
             target_file = "%s-%d%s" % (target_split[0], suffix, target_split[1])
 
-    def get_file_name_and_path(self, file):
+    def planned_content(self, target_file):
+        """
+        Return the file with the content the target has, or None for a free target.
+        In dry run mode targets are not written so a planned target has the content of its source
+        """
+        with self.reserved_lock:
+            planned = self.planned.get(target_file)
+        if planned is not None:
+            return planned[0]
+        if os.path.isfile(target_file):
+            return target_file
+        return None
+
+    def wait_reserved(self, target_file):
+        """
+        Wait until a planned target is written
+        """
+        with self.reserved_lock:
+            pending = self.reserved.get(target_file)
+        if pending is None:
+            return
+        while not pending[0].wait(0.1):
+            # A cancelled run may never write the target
+            if self.cancelled.is_set():
+                return
+
+    def find_indexed(self, checksum):
+        """
+        Find a file with the checksum in the output directory, including files planned but not written yet
+        """
+        with self.reserved_lock:
+            target_file = self.reserved_checksums.get(checksum)
+        if target_file is not None:
+            self.wait_reserved(target_file)
+            if self.planned_content(target_file) is not None:
+                return target_file
+        return self.index.find(checksum)
+
+    def reserved_checksum(self, target_file):
+        with self.reserved_lock:
+            return self.reserved.get(target_file, (None, None))[1]
+
+    def release_reserved(self, target_file, written, digest=None):
+        """
+        Release a planned target. A written target is added to the index with its planned
+        checksum or with digest, the checksum computed while it was written
+        """
+        with self.reserved_lock:
+            event, checksum = self.reserved.pop(target_file, (None, None))
+            if checksum is not None:
+                self.reserved_checksums.pop(checksum, None)
+        checksum = digest or checksum
+        if checksum is not None and written and self.index is not None:
+            self.index.add(checksum, target_file)
+        if event is not None:
+            event.set()
+
+    def transfer_file(self, file, output, target_file_name, target_file, suffix, duplicate):
+        """
+        Copy, move or link the file to the planned target and handle its xmp files
+        """
+        self.plan_add(file, output, target_file_name, target_file, suffix, duplicate)
+
+        if duplicate:
+            self.add_result(file, 'skipped, duplicated file %s' % target_file, 'duplicate', target_file)
+            self.stats.count('duplicates')
+            self.manifest_add(file)
+            return
+
+        self.journal_start(file, target_file, output=output, name=target_file_name, suffix=suffix)
+
+        written = False
+        digest = None
+        try:
+            size = self.digest(file).size()
+            with self.stats.timer('transfer') as timer:
+                digest = self.transfer(file, target_file)
+            self.add_details(file, transfer=timer.duration)
+            written = True
+        except FileNotFoundError:
+            if self.link:
+                raise
+            self.add_result(file, 'skipped, no such file or directory', 'missing')
+            self.stats.count('skipped')
+            return
+        except (MoveError, MemberError) as e:
+            # The source is left in place. Its journal entry stays pending and is rolled back by recovery
+            self.add_result(file, 'skipped, %s' % e, 'failed')
+            self.stats.count('skipped')
+            return
+        finally:
+            self.release_reserved(target_file, written, digest)
+
+        self.add_result(file, target_file, self.strategy(file), target_file)
+        self.process_xmp(file, target_file_name, suffix, output)
+        self.journal_finish(file)
+        self.manifest_add(file)
+        if digest is None:
+            # A streamed move counted its bytes while copying
+            self.stats.count('bytes', size)
+        self.stats.count('transferred')
+        if os.path.relpath(output, self.output) == 'unknown':
+            # Counted here rather than when planning so applied plans count them too
+            self.stats.count('unknown')
+
+    def add_details(self, file, date_source=None, **timings):
+        """
+        Collect the date source and stage timings of a file for its Result
+        """
+        if not self.callbacks:
+            return
+        with self.details_lock:
+            details = self.details.setdefault(file, {'date_source': None, 'timings': {}})
+            if date_source is not None:
+                details['date_source'] = date_source
+            details['timings'].update(timings)
+
+    def add_result(self, source, message, action, target=None, **fields):
+        """
+        Print the result of a file and pass it to the callbacks
+        """
+        if target is not None:
+            fields['target'] = target
+        if self.printing:
+            printer.result(source, message, status=action, **fields)
+
+        if not self.callbacks:
+            return
+        with self.details_lock:
+            details = self.details.pop(source, {'date_source': None, 'timings': {}})
+        result = Result(source, target, action, details['date_source'], details['timings'], message)
+        for callback in list(self.callbacks):
+            callback(result)
+
+    def log(self, level, message):
+        """
+        Print a line about the run which is not the result of a file and pass it to the messages callbacks
+        """
+        if self.printing:
+            printer.log(level, message)
+        for callback in list(self.messages):
+            callback(level, message)
+
+    def strategy(self, file=None):
+        if self.dry_run:
+            return 'planned'
+        if file is not None and self.archives.find(file) is not None:
+            # Archive members are always copied, the archive is left as it is
+            return 'copied'
+        if self.move:
+            return 'moved'
+        if self.link:
+            return 'linked'
+        if self.reflink:
+            return 'cloned'
+        return 'copied'
+
+    def transfer(self, source, target):
+        """
+        Copy, reflink, move or link source to target. Copied and moved files are written to a temporary file
+        next to the target and renamed when complete so a partial file never has the target name.
+        Returns the checksum of a file moved across filesystems and None otherwise
+        """
+        if self.dry_run:
+            return None
+
+        directory = os.path.dirname(target)
+        self.make_dir(directory)
+        try:
+            return self.write_file(source, target)
+        except FileNotFoundError:
+            if os.path.isdir(directory) or not self.is_file(source):
+                raise
+            # The directory was removed since it was created
+            self.known_dirs.discard(directory)
+            self.make_dir(directory)
+            return self.write_file(source, target)
+
+    def write_file(self, source, target):
+        archive = self.archives.find(source)
+        if self.link and archive is None:
+            os.link(source, target)
+            return None
+        if self.move and archive is None:
+            # Written through the temporary file, the source is removed only once target is in place
+            return move(source, target, self.hash_algorithm, self.reserved_checksum(target),
+                        self.count_bytes, temp_file(target))
+
+        temp = temp_file(target)
+        try:
+            if archive is not None:
+                archive.copy(source, temp)
+            elif self.reflink:
+                reflink(source, temp, self.reflink)
+            else:
+                shutil.copy2(source, temp)
+            os.replace(temp, target)
+        except BaseException as e:
+            if os.path.isfile(temp):
+                os.remove(temp)
+            # A file which can't be cloned with --reflink=always means the output can't be used at all
+            if isinstance(e, ReflinkError):
+                raise PhockupError(str(e))
+            raise
+        return None
+
+    def count_bytes(self, amount):
+        self.stats.count('bytes', amount)
+
+    def get_file_name_and_path(self, file, exif_data=None):
         """
         Returns target file name and path
         """
-        exif_data = Exif(file).data()
+        if exif_data is None:
+            exif_data = Exif(file).data()
         if exif_data and 'MIMEType' in exif_data and self.is_image_or_video(exif_data['MIMEType']):
-            date = Date(file).from_exif(exif_data, self.timestamp, self.date_regex, self.date_field)
+            archive = self.archives.find(file)
+            parser = Date(file, archive.stat(file).st_mtime if archive is not None else None)
+            with self.stats.timer('date') as timer:
+                date = parser.from_exif(exif_data, self.timestamp, self.date_regex, self.date_field)
+            self.add_details(file, parser.source, date=timer.duration)
             output = self.get_output_dir(date)
             target_file_name = self.get_file_name(file, date)
             if not self.original_filenames:
@@ -197,9 +1211,10 @@ class Phockup():
 
         return output, target_file_name, target_file_path
 
-    def process_xmp(self, file, file_name, suffix, output):
+    def process_xmp(self, file, file_name, suffix, output, recovering=False):
         """
-        Process xmp files. These are meta data for RAW images
+        Process xmp files. These are meta data for RAW images.
+        When recovering an interrupted transfer the xmp files already at their target are kept
         """
         xmp_original_with_ext = file + '.xmp'
         xmp_original_without_ext = os.path.splitext(file)[0] + '.xmp'
@@ -208,21 +1223,30 @@ class Phockup():
 
         xmp_files = {}
 
-        if os.path.isfile(xmp_original_with_ext):
+        if self.is_file(xmp_original_with_ext):
             xmp_target = '%s%s.xmp' % (file_name, suffix)
             xmp_files[xmp_original_with_ext] = xmp_target
-        if os.path.isfile(xmp_original_without_ext):
+        if self.is_file(xmp_original_without_ext):
             xmp_target = '%s%s.xmp' % (os.path.splitext(file_name)[0], suffix)
             xmp_files[xmp_original_without_ext] = xmp_target
 
         for original, target in xmp_files.items():
+            if self.resume and self.journal is not None and self.journal.is_done(original):
+                continue
+
             xmp_path = os.path.sep.join([output, target])
-            printer.line('%s => %s' % (original, xmp_path))
+            if recovering and os.path.isfile(xmp_path):
+                # Transferred before the interrupted run got to its main file
+                continue
 
-            if not self.dry_run:
-                if self.move:
-                    shutil.move(original, xmp_path)
-                elif self.link:
-                    os.link(original, xmp_path)
-                else:
-                    shutil.copy2(original, xmp_path)
+            self.journal_start(original, xmp_path, xmp=True)
+            try:
+                with self.stats.timer('transfer'):
+                    self.transfer(original, xmp_path)
+            except (MoveError, MemberError) as e:
+                self.add_result(original, 'skipped, %s' % e, 'failed')
+                self.stats.count('skipped')
+                continue
+            self.add_result(original, xmp_path, self.strategy(original), xmp_path, xmp=True)
+            self.journal_finish(original)
+            self.stats.count('xmp')
@@ -0,0 +1,154 @@
+import queue
+import threading
+
+DONE = object()
+
+
+class Stage(object):
+    """
+    A single step of the pipeline run by a number of worker threads.
+    func is called with every item from the previous stage and its result is passed to the next one.
+    With expand=True func returns an iterable and each of its items is passed on separately.
+    An ordered stage has one worker and gets items in source order. The stage before it has
+    to produce exactly one item for each item it receives.
+    """
+    def __init__(self, func, workers=1, ordered=False, expand=False):
+        self.func = func
+        self.workers = 1 if ordered else max(1, workers)
+        self.ordered = ordered
+        self.expand = expand
+
+
+class Pipeline(object):
+    """
+    Run items from a source through a chain of stages connected by bounded queues.
+    The source is consumed in its own thread so at most queue_size items wait in front of every stage.
+    cancel stops the pipeline, run returns when the workers finished the items they are working on,
+    also when it is interrupted.
+    An event shared with the owner of the pipeline can be passed as cancelled, it is set on errors too.
+    """
+    def __init__(self, stages, queue_size=16, cancelled=None):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.cancelled = cancelled if cancelled is not None else threading.Event()
+        self.error = None
+
+    def run(self, source):
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(target=self.feed, args=(source, queues[0]))]
+
+        for index, stage in enumerate(self.stages):
+            output = queues[index + 1] if index + 1 < len(self.stages) else None
+            downstream_workers = self.stages[index + 1].workers if output else 0
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self.work,
+                    args=(stage, queues[index], output, downstream_workers, remaining, lock)
+                ))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive() and not self.cancelled.is_set():
+                    thread.join(0.1)
+        except BaseException:
+            # Interrupted, e.g. by Ctrl-C. Workers stop at their next item and must be done
+            # before the owner closes what they write to. The source may be blocked so it is not waited for
+            self.cancel()
+            for thread in threads[1:]:
+                thread.join()
+            raise
+
+        # Workers finish the items they hold before the pipeline returns
+        for thread in threads:
+            thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.cancel()
+
+    def put(self, target, item):
+        while not self.cancelled.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, source):
+        while not self.cancelled.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def feed(self, source, target):
+        try:
+            for seq, item in enumerate(source):
+                if not self.put(target, (seq, item)):
+                    return
+        except Exception as e:
+            self.fail(e)
+            return
+
+        for _ in range(self.stages[0].workers):
+            self.put(target, DONE)
+
+    def work(self, stage, source, output, downstream_workers, remaining, lock):
+        pending = {}
+        next_seq = 0
+
+        try:
+            while True:
+                item = self.get(source)
+                if item is DONE:
+                    break
+
+                if not stage.ordered:
+                    self.call(stage, item, output)
+                    continue
+
+                pending[item[0]] = item
+                while next_seq in pending and not self.cancelled.is_set():
+                    self.call(stage, pending.pop(next_seq), output)
+                    next_seq += 1
+        except Exception as e:
+            self.fail(e)
+            return
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+
+        if last and output is not None:
+            for _ in range(downstream_workers):
+                self.put(output, DONE)
+
+    def call(self, stage, item, output):
+        seq, value = item
+        result = stage.func(value)
+        if output is None:
+            if stage.expand:
+                for _ in result:
+                    pass
+            return
+
+        for value in (result if stage.expand else [result]):
+            if not self.put(output, (seq, value)):
+                if stage.expand and hasattr(result, 'close'):
+                    result.close()
+                return
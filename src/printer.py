@@ -1,20 +1,115 @@
+import atexit
+import json
 import sys
+import threading
+import time
+
+QUIET = 0
+NORMAL = 1
+VERBOSE = 2
+
+levels = {'error': QUIET, 'warning': QUIET, 'info': NORMAL, 'debug': VERBOSE}
 
 
 class Printer(object):
+    """
+    Output of phockup. The settings are shared by all printers and set once with configure.
+    Messages below the configured verbosity are dropped. In json format every message is
+    written as a JSON line with its level and the fields of file results.
+    Buffered output is written in chunks at most flush_interval seconds apart instead of line by line.
+    """
+    lock = threading.Lock()
+    verbosity = NORMAL
+    format = 'text'
+    buffered = False
+    flush_interval = 1.0
+    buffer_size = 65536
+    buffer = []
+    buffer_length = 0
+    last_flush = 0.0
+
+    @classmethod
+    def configure(cls, verbosity=NORMAL, format='text', buffered=False):
+        cls.flush()
+        with cls.lock:
+            cls.verbosity = verbosity
+            cls.format = format
+            cls.buffered = buffered
+            cls.last_flush = time.monotonic()
+
     def line(self, message, skip_end=False):
-        if skip_end:
-            print(message, end="", flush=True)
+        if skip_end and self.format == 'text':
+            self.write(message, end='')
         else:
-            print(message)
+            self.log('info', message)
+
+    def debug(self, message):
+        self.log('debug', message)
+
+    def warning(self, message):
+        self.log('warning', message)
+
+    def result(self, source, message, **fields):
+        """
+        Result of processing a file. fields are added to json output
+        """
+        self.log('info', '%s => %s' % (source, message), source=source, **fields)
+
+    def log(self, level, message, **fields):
+        if levels[level] > self.verbosity:
+            return
+
+        if self.format == 'json':
+            record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'level': level, 'message': message}
+            record.update(fields)
+            self.write(json.dumps(record))
+        else:
+            self.write(message)
+
+    def write(self, text, end='\n'):
+        cls = type(self)
+        with cls.lock:
+            if not cls.buffered:
+                sys.stdout.write(text + end)
+                if not end:
+                    sys.stdout.flush()
+                return
+
+            cls.buffer.append(text + end)
+            cls.buffer_length += len(text) + len(end)
+            now = time.monotonic()
+            if cls.buffer_length < cls.buffer_size and now - cls.last_flush < cls.flush_interval:
+                return
+            cls.write_buffer()
+
+    @classmethod
+    def write_buffer(cls):
+        if cls.buffer:
+            sys.stdout.write(''.join(cls.buffer))
+            cls.buffer = []
+            cls.buffer_length = 0
+        sys.stdout.flush()
+        cls.last_flush = time.monotonic()
+
+    @classmethod
+    def flush(cls):
+        with cls.lock:
+            cls.write_buffer()
 
     def error(self, message):
-        self.line('')
-        self.line(message)
-        self.line('')
+        if self.format == 'json':
+            self.log('error', message)
+        else:
+            self.line('')
+            self.log('error', message)
+            self.line('')
+        self.flush()
         sys.exit(1)
 
     def empty(self, times=1):
         for i in range(times):
-            print('')
+            self.line('')
         return self
+
+
+atexit.register(Printer.flush)
@@ -0,0 +1,131 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Entry(object):
+    """
+    File of a directory listed with os.listdir, with the attributes of os.DirEntry the scanner uses.
+    Only for Python 3.4 which has no os.scandir
+    """
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def scandir(path):
+    if hasattr(os, 'scandir'):
+        return os.scandir(path)
+    return [Entry(path, name) for name in os.listdir(path)]
+
+
+class Scanner(object):
+    """
+    Walk a directory tree with os.scandir and yield a DirEntry for every file.
+    The stat results cached by the entries can be reused instead of calling stat again.
+    With more than one worker the directories are listed in parallel ahead of the consumer.
+    Ordered scans yield the files of a directory sorted by name followed by its subdirectories
+    in name order. Unordered scans yield the files of each directory as soon as it is listed.
+    Like os.walk, symbolic links to directories are not followed and unreadable directories are skipped.
+    Without os.scandir (Python 3.4) the directories are listed with os.listdir and every file is stat'ed.
+    """
+    def __init__(self, root, workers=1, ordered=True, ignored_dirs=()):
+        self.root = root
+        self.workers = max(1, workers)
+        self.ordered = ordered
+        self.ignored_dirs = ignored_dirs
+        self.prefetch = 4 * self.workers
+
+    def list(self, path):
+        files = []
+        dirs = []
+        try:
+            for entry in scandir(path):
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if not is_dir:
+                    files.append(entry)
+                elif entry.name not in self.ignored_dirs and not entry.is_symlink():
+                    dirs.append(entry)
+        except OSError:
+            pass
+
+        if self.ordered:
+            files.sort(key=lambda entry: entry.name)
+            dirs.sort(key=lambda entry: entry.name)
+
+        return files, [entry.path for entry in dirs]
+
+    def __iter__(self):
+        if self.workers == 1:
+            return self.scan_serial()
+        if self.ordered:
+            return self.scan_ordered()
+        return self.scan_unordered()
+
+    def scan_serial(self):
+        stack = [self.root]
+        while stack:
+            files, dirs = self.list(stack.pop())
+            for entry in files:
+                yield entry
+            stack.extend(reversed(dirs))
+
+    def scan_ordered(self):
+        """
+        Depth first scan where the next directories on the stack are listed ahead by the pool
+        """
+        stack = [self.root]
+        futures = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            while stack:
+                for path in stack[-self.prefetch:]:
+                    if path not in futures:
+                        futures[path] = pool.submit(self.list, path)
+
+                files, dirs = futures.pop(stack.pop()).result()
+                for entry in files:
+                    yield entry
+                stack.extend(reversed(dirs))
+
+    def scan_unordered(self):
+        pending = deque([self.root])
+        running = set()
+        with ThreadPoolExecutor(self.workers) as pool:
+            while pending or running:
+                while pending and len(running) < self.prefetch:
+                    running.add(pool.submit(self.list, pending.popleft()))
+
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, dirs = future.result()
+                    for entry in files:
+                        yield entry
+                    pending.extend(dirs)
+
+
+def interleave(iterables):
+    """
+    Yield the items of the iterables taking turns until all of them are exhausted
+    """
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            continue
+        yield item
+        iterators.append(iterator)
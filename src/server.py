@@ -0,0 +1,288 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from src.cache import MetadataCache
+from src.index import HashIndex
+from src.phockup import Phockup, PhockupError
+from src.printer import Printer
+
+printer = Printer()
+
+# Phockup arguments holding paths which are relative to the working directory of the client
+path_arguments = ('cache', 'index', 'report', 'plan', 'apply_plan')
+
+
+def default_socket():
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or os.path.expanduser('~'), 'phockup.sock')
+
+
+class ClientGone(Exception):
+    """
+    The client of a job can't be sent its events any more
+    """
+    pass
+
+
+class Resources(object):
+    """
+    Metadata caches and checksum indexes kept open between the jobs of a server.
+    Jobs get the open cache or index of a path instead of opening it again
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.caches = {}
+        self.indexes = {}
+
+    def cache(self, path, limit):
+        with self.lock:
+            cache = self.caches.get(path)
+            if cache is None or not os.path.isfile(path):
+                cache = self.caches[path] = MetadataCache(path, limit)
+            cache.limit = limit
+            return cache
+
+    def index(self, path, root, algorithm):
+        key = path, root, algorithm
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None or not os.path.isfile(path):
+                index = self.indexes[key] = HashIndex(path, root, algorithm)
+            return index
+
+    def close(self):
+        with self.lock:
+            for cache in self.caches.values():
+                cache.close()
+            for index in self.indexes.values():
+                index.close()
+            self.caches = {}
+            self.indexes = {}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Results are sent by the handler and messages by the thread running the job
+        self.lock = threading.Lock()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+        except ValueError:
+            self.send({'event': 'error', 'message': 'Invalid request'})
+            return
+        self.server.owner.run_job(request, self.send, self.rfile)
+
+    def send(self, event):
+        with self.lock:
+            self.wfile.write(json.dumps(event).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Server(object):
+    """
+    Run import jobs sent by clients over a Unix socket in a single long-running process so
+    exiftool, the metadata caches and the checksum indexes stay warm between them.
+    A job is a command line as given to phockup.py. parse turns it into the inputs, output and
+    arguments of Phockup. Every job runs in its own thread. Jobs writing to the same output
+    directory are queued and run one after the other.
+    Events are sent back as JSON lines: queued, started, result, message, progress, done and error
+    """
+    def __init__(self, path, parse, progress_interval=2.0):
+        self.path = path
+        self.parse = parse
+        self.progress_interval = progress_interval
+        self.resources = Resources()
+        self.lock = threading.Lock()
+        self.output_locks = {}
+        self.server = None
+
+    def start(self):
+        """
+        Listen on the socket. A socket left behind by a server which is not running any more is replaced
+        """
+        if os.path.exists(self.path):
+            try:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.connect(self.path)
+                connection.close()
+            except OSError:
+                os.remove(self.path)
+            else:
+                raise PhockupError('A server is already listening on %s' % self.path)
+
+        # The socket accepts jobs which move and delete files, it is created readable by the user only
+        umask = os.umask(0o177)
+        try:
+            self.server = UnixServer(self.path, Handler)
+        finally:
+            os.umask(umask)
+        self.server.owner = self
+
+    def serve(self):
+        self.start()
+        printer.line('Listening on %s' % self.path)
+        printer.flush()
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            printer.line('Exiting...')
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self.server.shutdown()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        self.resources.close()
+        printer.flush()
+
+    def output_lock(self, output):
+        with self.lock:
+            return self.output_locks.setdefault(os.path.realpath(output), threading.Lock())
+
+    def job(self, request):
+        """
+        Create the Phockup of a request. Relative paths are resolved from the working directory of the client
+        """
+        inputs, output, args = self.parse(request.get('args', []))
+        cwd = request.get('cwd') or os.getcwd()
+        for key in path_arguments:
+            if isinstance(args.get(key), str):
+                args[key] = os.path.join(cwd, args[key])
+        # The output of a job goes to its client only
+        args.update(run=False, resources=self.resources, printing=False)
+        return Phockup(
+            [os.path.join(cwd, os.path.expanduser(input)) for input in inputs],
+            os.path.join(cwd, os.path.expanduser(output)),
+            **args
+        )
+
+    def run_job(self, request, send, hangup=None):
+        """
+        Run a job and send its events. The job is cancelled when the client goes away,
+        which is noticed when a read from hangup returns or an event can't be sent
+        """
+        try:
+            phockup = self.job(request)
+        except ClientGone:
+            raise
+        except Exception as e:
+            send({'event': 'error', 'message': str(e)})
+            return
+
+        def send_event(event):
+            try:
+                send(event)
+            except OSError as e:
+                raise ClientGone(str(e))
+
+        def send_message(level, message):
+            try:
+                send_event({'event': 'message', 'level': level, 'line': message})
+            except ClientGone:
+                # Noticed by the results or the hangup, the job is cancelled there
+                pass
+
+        phockup.messages.append(send_message)
+        if hangup is not None:
+            thread = threading.Thread(target=self.watch_hangup, args=(hangup, phockup))
+            thread.daemon = True
+            thread.start()
+
+        lock = self.output_lock(phockup.output)
+        try:
+            if not lock.acquire(False):
+                send_event({'event': 'queued', 'output': phockup.output})
+                while not lock.acquire(timeout=0.1):
+                    if phockup.cancelled.is_set():
+                        return
+            try:
+                printer.debug('Job started: %s => "%s"' % (', '.join('"%s"' % input for input in phockup.inputs), phockup.output))
+                send_event({'event': 'started', 'inputs': phockup.inputs, 'output': phockup.output})
+                self.send_results(phockup, send_event)
+            finally:
+                lock.release()
+        except ClientGone:
+            printer.line('Client of "%s" went away, job cancelled' % phockup.output)
+        finally:
+            printer.flush()
+
+    def send_results(self, phockup, send):
+        """
+        Run the job and send its results. Any failure of the job is sent to the client as an error event
+        """
+        last_progress = time.monotonic()
+        results = phockup.results()
+        try:
+            for result in results:
+                send({
+                    'event': 'result',
+                    'source': result.source,
+                    'target': result.target,
+                    'action': result.action,
+                    'message': result.message,
+                })
+                if phockup.progress and time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    send({'event': 'progress', 'line': phockup.stats.progress_line()})
+        except ClientGone:
+            raise
+        except Exception as e:
+            send({'event': 'error', 'message': str(e)})
+            return
+        finally:
+            results.close()
+
+        if phockup.progress:
+            send({'event': 'progress', 'line': phockup.stats.progress_line()})
+        send({'event': 'done', 'stats': phockup.stats.report()})
+
+    @staticmethod
+    def watch_hangup(hangup, phockup):
+        try:
+            hangup.read()
+        except (OSError, ValueError):
+            pass
+        phockup.cancel()
+
+
+def submit(path, args, cwd=None):
+    """
+    Send a job to the server listening on path and yield its events until it is done.
+    Raises PhockupError when no server is listening
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(path)
+        except OSError:
+            raise PhockupError('No server is listening on %s' % path)
+
+        request = {'args': list(args), 'cwd': cwd or os.getcwd()}
+        connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as events:
+            for line in events:
+                event = json.loads(line.decode('utf-8'))
+                yield event
+                if event['event'] in ('done', 'error'):
+                    return
+        raise PhockupError('The server closed the connection before the job was done')
+    finally:
+        connection.close()
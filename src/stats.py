@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+stages = ('scan', 'exif', 'checksum', 'date', 'duplicate', 'transfer')
+counters = ('scanned', 'transferred', 'bytes', 'duplicates', 'unknown', 'skipped', 'unchanged', 'xmp')
+
+# Upper bounds in seconds of the timing histogram buckets. The last bucket has no bound
+buckets = (0.001, 0.01, 0.1, 1, 10)
+
+
+class Timing(object):
+    """
+    Number of calls, total and longest duration and a histogram of the durations of a stage
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        for i, bound in enumerate(buckets):
+            if duration <= bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def report(self):
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else 0,
+            'max': round(self.max, 6),
+            'histogram': [
+                {'le': bound, 'count': count}
+                for bound, count in zip(buckets + (None,), self.histogram)
+            ],
+        }
+
+
+class Timer(object):
+    duration = 0.0
+
+
+class Stats(object):
+    """
+    Thread safe counters and stage timings of a run.
+    With progress enabled a line with the rate of processed files and bytes and the estimated
+    time left is printed at most every interval seconds. The estimate is available once the
+    whole input was scanned.
+    """
+    def __init__(self, printer=None, progress=False, interval=2.0):
+        self.printer = printer
+        self.progress = progress
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(counters, 0)
+        self.timings = {stage: Timing() for stage in stages}
+        self.scan_complete = False
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.last_progress = self.clock
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+        if self.progress:
+            self.show_progress()
+
+    def __getitem__(self, name):
+        with self.lock:
+            return self.counters[name]
+
+    def record(self, stage, duration):
+        with self.lock:
+            self.timings[stage].add(duration)
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Time the block as a call of the stage. The duration is also set on the yielded timer
+        """
+        timer = Timer()
+        start = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            timer.duration = time.perf_counter() - start
+            self.record(stage, timer.duration)
+
+    def finish_scan(self):
+        with self.lock:
+            self.scan_complete = True
+
+    def elapsed(self):
+        return time.perf_counter() - self.clock
+
+    def processed(self):
+        return self.counters['transferred'] + self.counters['duplicates'] + self.counters['skipped']
+
+    def progress_line(self):
+        with self.lock:
+            elapsed = max(self.elapsed(), 1e-9)
+            processed = self.processed()
+            files_rate = processed / elapsed
+            bytes_rate = self.counters['bytes'] / elapsed
+            line = 'Progress: %d/%d%s files, %.1f files/s, %.1f MB/s' % (
+                processed, self.counters['scanned'], '' if self.scan_complete else '+',
+                files_rate, bytes_rate / 1000000
+            )
+            if self.scan_complete and files_rate:
+                remaining = (self.counters['scanned'] - processed) / files_rate
+                line += ', ETA %s' % format_duration(remaining)
+        return line
+
+    def show_progress(self):
+        now = time.perf_counter()
+        with self.lock:
+            if now - self.last_progress < self.interval:
+                return
+            self.last_progress = now
+        if self.printer is not None:
+            self.printer.line(self.progress_line())
+
+    def report(self):
+        with self.lock:
+            duration = self.elapsed()
+            return {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started)),
+                'duration': round(duration, 6),
+                'totals': dict(self.counters),
+                'rates': {
+                    'files_per_second': round(self.processed() / duration, 3) if duration else 0,
+                    'bytes_per_second': round(self.counters['bytes'] / duration, 3) if duration else 0,
+                },
+                'stages': {stage: timing.report() for stage, timing in self.timings.items()},
+            }
+
+    def write_report(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
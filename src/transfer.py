@@ -0,0 +1,137 @@
+import errno
+import os
+import shutil
+import sys
+
+from src.checksum import algorithms, checksum
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl number of FICLONE on Linux
+FICLONE = 0x40049409
+buffer_size = 1024 * 1024
+
+
+class ReflinkError(Exception):
+    pass
+
+
+class MoveError(Exception):
+    pass
+
+
+def clone(source, target):
+    """
+    Make target a copy-on-write clone of source. Raises OSError when the filesystem can't do it
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported on this platform')
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def copy_data(source, target):
+    """
+    Copy the content of source to target with copy_file_range when available
+    and with a streaming copy with large buffers otherwise
+    """
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(src.fileno(), dst.fileno(), buffer_size * 64):
+                    pass
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        shutil.copyfileobj(src, dst, buffer_size)
+
+
+def reflink(source, target, mode='auto'):
+    """
+    Copy source to target as a reflink clone and preserve its metadata like shutil.copy2.
+    In auto mode a file which can't be cloned is copied instead. In always mode only a copy
+    to another filesystem falls back to copying and other failures raise ReflinkError
+    """
+    try:
+        clone(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError as e:
+        if os.path.isfile(target):
+            os.remove(target)
+        if mode == 'always' and e.errno != errno.EXDEV:
+            raise ReflinkError('Cannot create reflink of "%s": %s' % (source, e))
+        copy_data(source, target)
+
+    shutil.copystat(source, target)
+
+
+def sync_directory(directory):
+    """
+    Flush the entries of a directory to disk so a file created in it survives a crash
+    """
+    if os.name == 'nt':
+        # Windows can't open directories and NTFS journals its metadata
+        return
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def move(source, target, algorithm='sha256', expected=None, progress=None, temp=None):
+    """
+    Move source to target. On the same filesystem the file is renamed and None is returned.
+    Across filesystems the file is streamed to temp, or to target when no temp is given, and hashed
+    in the same pass. It is synced to disk, verified by hashing it again and renamed to target.
+    Only when target and its directory entry are on the disk the source is removed, so a crash
+    leaves at least one complete copy. Returns the checksum of the moved file in that case.
+    When the checksum of source is already known it is given as expected and a source which
+    changed since is not moved. progress is called with the number of bytes of every block copied
+    """
+    try:
+        os.rename(source, target)
+        return None
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    written = temp or target
+    digest = algorithms()[algorithm]()
+    try:
+        with open(source, 'rb') as src, open(written, 'wb') as dst:
+            for block in iter(lambda: src.read(buffer_size), b''):
+                digest.update(block)
+                dst.write(block)
+                if progress is not None:
+                    progress(len(block))
+            dst.flush()
+            os.fsync(dst.fileno())
+            if hasattr(os, 'posix_fadvise'):
+                # Verify what is on the disk rather than the pages just written
+                os.posix_fadvise(dst.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        shutil.copystat(source, written)
+
+        if expected is not None and digest.hexdigest() != expected:
+            raise MoveError('"%s" changed since it was planned, not moved' % source)
+        if checksum(written, algorithm) != digest.hexdigest():
+            raise MoveError('Verification of "%s" moved to "%s" failed' % (source, target))
+        if written != target:
+            os.replace(written, target)
+        sync_directory(os.path.dirname(target))
+    except BaseException:
+        if os.path.isfile(written):
+            os.remove(written)
+        raise
+
+    os.remove(source)
+    return digest.hexdigest()
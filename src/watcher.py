@@ -0,0 +1,137 @@
+import os
+import time
+
+from src.scanner import Scanner
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+class Watcher(object):
+    """
+    Watch a directory tree, or a list of them, for new and changed files. Changes are noticed with inotify when
+    the inotify_simple package is available and by scanning the tree every interval seconds otherwise.
+    A file is reported once its size and modification time did not change for settle seconds,
+    so files which are still being copied or synced are left alone. Files settled at the same
+    time are reported together.
+    """
+    def __init__(self, root, ignored_dirs=(), settle=2.0, interval=1.0, polling=False):
+        self.roots = [root] if isinstance(root, str) else list(root)
+        self.ignored_dirs = ignored_dirs
+        self.settle = settle
+        self.interval = interval
+        self.pending = {}
+        self.started = time.time()
+        self.inotify = None
+        self.watches = {}
+        self.snapshot = {}
+
+        if INotify is not None and not polling:
+            self.inotify = INotify()
+            for root in self.roots:
+                self.add_tree(root)
+        else:
+            self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for root in self.roots:
+            for entry in Scanner(root, ordered=False, ignored_dirs=self.ignored_dirs):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.path] = stat.st_size, stat.st_mtime_ns
+        return snapshot
+
+    def add_tree(self, root, new=False):
+        """
+        Watch root and its subdirectories. Files in a new directory may be created before it is watched
+        so they are added as changed
+        """
+        mask = flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO | flags.MODIFY
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = [name for name in dirs if name not in self.ignored_dirs]
+            try:
+                self.watches[self.inotify.add_watch(directory, mask)] = directory
+            except OSError:
+                continue
+            if new:
+                for name in files:
+                    self.changed(os.path.join(directory, name))
+
+    def changed(self, file):
+        if file not in self.pending:
+            self.pending[file] = None, time.monotonic()
+
+    def poll(self):
+        """
+        Wait up to interval seconds for changes and add the changed files to pending
+        """
+        if self.inotify is None:
+            time.sleep(self.interval)
+            snapshot = self.scan()
+            for file, state in snapshot.items():
+                if self.snapshot.get(file) != state:
+                    self.changed(file)
+            self.snapshot = snapshot
+            return
+
+        for event in self.inotify.read(timeout=int(self.interval * 1000)):
+            if event.mask & flags.Q_OVERFLOW:
+                # Events were lost, look for files changed since the watch started
+                for file, state in self.scan().items():
+                    if state[1] >= self.started * 1e9:
+                        self.changed(file)
+                continue
+
+            directory = self.watches.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = os.path.join(directory, event.name)
+            if event.mask & flags.ISDIR:
+                if event.name not in self.ignored_dirs and event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self.add_tree(path, new=True)
+                continue
+            self.changed(path)
+
+    def settled(self):
+        """
+        Remove and return the pending files which did not change for settle seconds
+        """
+        now = time.monotonic()
+        ready = []
+        for file, (state, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(file)
+            except OSError:
+                del self.pending[file]
+                continue
+
+            current = stat.st_size, stat.st_mtime_ns
+            if current != state:
+                self.pending[file] = current, now
+            elif now - since >= self.settle:
+                del self.pending[file]
+                ready.append(file)
+        return sorted(ready)
+
+    def watch(self, stop):
+        """
+        Yield lists of settled files until the stop event is set
+        """
+        try:
+            while not stop.is_set():
+                self.poll()
+                ready = self.settled()
+                if ready and not stop.is_set():
+                    yield ready
+        finally:
+            self.close()
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import io
+import os
+import pytest
+import shutil
+import struct
+import tarfile
+import zipfile
+from datetime import datetime
+from benchmarks.corpus import box, jpeg, mp4, quicktime_epoch
+from src.archive import Archive, Archives, MemberDigest, MemberError, is_archive
+from src.checksum import FileDigest
+from src.native import NativeReader, header_size
+from src.phockup import Phockup
+
+
+os.chdir(os.path.dirname(__file__))
+
+photo = jpeg(datetime(2017, 1, 1, 1, 1, 1), b'photo')
+other_photo = jpeg(datetime(2017, 1, 1, 1, 1, 1), b'other photo')
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def write(file, content):
+    with open(file, 'wb') as f:
+        f.write(content)
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+
+
+def make_tar(path, members):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = 1483232461
+            archive.addfile(info, io.BytesIO(content))
+
+
+def test_is_archive():
+    assert is_archive('takeout.zip')
+    assert is_archive('backup.TAR.GZ')
+    assert not is_archive('photo.jpg')
+
+
+def test_archive_lists_and_streams_members():
+    make_zip('output/photos.zip', [('DCIM/', b''), ('DCIM/a.jpg', photo), ('./b.txt', b'text')])
+    archive = Archive('output/photos.zip')
+    assert list(archive) == ['output/photos.zip/DCIM/a.jpg', 'output/photos.zip/b.txt']
+    assert archive.stat('output/photos.zip/DCIM/a.jpg').st_size == len(photo)
+    with archive.open('output/photos.zip/DCIM/a.jpg') as f:
+        assert f.read() == photo
+    archive.copy('output/photos.zip/DCIM/a.jpg', 'output/a.jpg')
+    assert open('output/a.jpg', 'rb').read() == photo
+    archive.close()
+
+
+def test_tar_members_keep_their_time():
+    make_tar('output/photos.tgz', [('a.jpg', photo)])
+    archive = Archive('output/photos.tgz')
+    archive.copy('output/photos.tgz/a.jpg', 'output/a.jpg')
+    assert os.path.getmtime('output/a.jpg') == 1483232461
+    archive.close()
+
+
+def test_archives_open_members_on_demand():
+    make_zip('output/photos.zip', [('a.jpg', photo)])
+    write('output/broken.zip', b'not an archive')
+    archives = Archives()
+    assert archives.find('output/photos.zip/a.jpg').path == 'output/photos.zip'
+    assert archives.find('output/photos.zip/missing.jpg') is None
+    assert archives.find('output/broken.zip/a.jpg') is None
+    assert archives.find('input/exif.jpg') is None
+    archives.close()
+
+
+def test_member_digest_matches_file_digest():
+    make_tar('output/photos.tgz', [('a.jpg', photo), ('b.jpg', other_photo)])
+    write('output/a.jpg', photo)
+    archive = Archive('output/photos.tgz')
+    digest = MemberDigest(archive, 'output/photos.tgz/a.jpg')
+    assert digest.full() == FileDigest('output/a.jpg').full()
+    assert digest.matches(FileDigest('output/a.jpg'))
+    assert not MemberDigest(archive, 'output/photos.tgz/b.jpg').matches(FileDigest('output/a.jpg'))
+    archive.close()
+
+
+def test_read_stream_finds_moov_at_the_end():
+    seconds = int((datetime(2017, 1, 1, 1, 1, 1) - quicktime_epoch).total_seconds())
+    mvhd = box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>IIII', seconds, seconds, 1000, 0) + b'\x00' * 80)
+    video = box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41') + box(b'mdat', b'\x00' * header_size) + box(b'moov', mvhd)
+    make_tar('output/videos.tgz', [('a.mp4', video)])
+    archive = Archive('output/videos.tgz')
+    with archive.open('output/videos.tgz/a.mp4') as f:
+        assert NativeReader().read_stream('a.mp4', f)['CreateDate'] == '2017:01:01 01:01:01'
+    archive.close()
+
+
+def test_phockup_reads_archive_inputs():
+    make_zip('output/takeout.zip', [
+        ('Photos/a.jpg', photo),
+        ('Photos/a.jpg.xmp', b'<x:xmpmeta/>'),
+        ('Photos/b.jpg', other_photo),
+        ('Photos/video.mp4', mp4(datetime(2017, 1, 1, 1, 1, 1))),
+        ('Photos/IMG_20170102_030405.png', b'\x89PNG\r\n\x1a\n'),
+        ('Photos/notes.txt', b'text'),
+    ])
+    Phockup('output/takeout.zip', 'output/sorted', move=True)
+    day = 'output/sorted/2017/01/01/'
+    assert open(day + '20170101-010101.jpg', 'rb').read() == photo
+    assert open(day + '20170101-010101.jpg.xmp', 'rb').read() == b'<x:xmpmeta/>'
+    assert open(day + '20170101-010101-2.jpg', 'rb').read() == other_photo
+    assert os.path.isfile(day + '20170101-010101.mp4')
+    assert os.path.isfile('output/sorted/2017/01/02/20170102-030405.png')
+    assert os.path.isfile('output/sorted/unknown/notes.txt')
+    # Members are copied even with the move strategy
+    assert os.path.isfile('output/takeout.zip')
+
+
+def test_archives_in_input_directories_need_archives():
+    os.makedirs('output/input')
+    make_tar('output/input/backup.tar.gz', [('a.jpg', photo)])
+    Phockup('output/input', 'output/sorted')
+    assert os.path.isfile('output/sorted/unknown/backup.tar.gz')
+
+    Phockup('output/input', 'output/sorted-archives', archives=True)
+    assert os.listdir('output/sorted-archives/2017/01/01') == ['20170101-010101.jpg']
+
+
+def corrupt(path, content):
+    """
+    Change a byte in the middle of the stored content of a member
+    """
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    data[data.index(content) + len(content) // 2] ^= 0xff
+    write(path, bytes(data))
+
+
+def test_corrupt_member_raises_member_error():
+    make_zip('output/photos.zip', [('a.jpg', photo)])
+    corrupt('output/photos.zip', photo)
+    archive = Archive('output/photos.zip')
+    with pytest.raises(MemberError):
+        archive.copy('output/photos.zip/a.jpg', 'output/a.jpg')
+    with pytest.raises(MemberError):
+        MemberDigest(archive, 'output/photos.zip/a.jpg').full()
+    archive.close()
+
+
+def test_phockup_skips_corrupt_members():
+    make_zip('output/takeout.zip', [('a.jpg', photo), ('b.jpg', other_photo)])
+    corrupt('output/takeout.zip', other_photo)
+    for index in (False, True):
+        phockup = Phockup('output/takeout.zip', 'output/sorted-%s' % index, index=index)
+        assert os.listdir('output/sorted-%s/2017/01/01' % index) == ['20170101-010101.jpg']
+        assert not os.path.exists('output/sorted-%s/unknown/b.jpg' % index)
+        assert phockup.stats['skipped'] == 1
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import os
+import shutil
+from src.cache import MetadataCache
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_cache_hit_and_miss():
+    cache = MetadataCache('output/cache.sqlite')
+    found, missing = cache.get_many(['input/exif.jpg'])
+    assert found == {}
+    assert missing == ['input/exif.jpg']
+    cache.set_many({'input/exif.jpg': {'MIMEType': 'image/jpeg'}})
+    found, missing = cache.get_many(['input/exif.jpg', 'input/other.txt'])
+    assert found == {'input/exif.jpg': {'MIMEType': 'image/jpeg'}}
+    assert missing == ['input/other.txt']
+    assert cache.hits == 1
+    assert cache.misses == 2
+    cache.close()
+
+
+def test_cache_is_persistent():
+    cache = MetadataCache('output/cache.sqlite')
+    cache.set_many({'input/exif.jpg': {'MIMEType': 'image/jpeg'}})
+    cache.close()
+    cache = MetadataCache('output/cache.sqlite')
+    assert cache.get_many(['input/exif.jpg'])[0] == {'input/exif.jpg': {'MIMEType': 'image/jpeg'}}
+    cache.close()
+
+
+def test_cache_misses_changed_file():
+    os.makedirs('output')
+    open('output/changed.jpg', 'w').close()
+    cache = MetadataCache('output/cache.sqlite')
+    cache.set_many({'output/changed.jpg': {'MIMEType': 'image/jpeg'}})
+    with open('output/changed.jpg', 'w') as f:
+        f.write('changed')
+    assert cache.get_many(['output/changed.jpg'])[1] == ['output/changed.jpg']
+    cache.close()
+
+
+def test_cache_does_not_store_failures_or_missing_files():
+    cache = MetadataCache('output/cache.sqlite')
+    cache.set_many({'input/exif.jpg': {}, 'not-existing.jpg': {'MIMEType': 'image/jpeg'}})
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_cache_clear():
+    cache = MetadataCache('output/cache.sqlite')
+    cache.set_many({'input/exif.jpg': {'MIMEType': 'image/jpeg'}})
+    cache.clear()
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used():
+    cache = MetadataCache('output/cache.sqlite', limit=1)
+    cache.set_many({'input/exif.jpg': {'MIMEType': 'image/jpeg'}})
+    cache.set_many({'input/other.txt': {'MIMEType': 'text/plain'}})
+    cache.get_many(['input/exif.jpg'])
+    cache.evict()
+    assert len(cache) == 1
+    assert cache.get_many(['input/exif.jpg'])[0] == {'input/exif.jpg': {'MIMEType': 'image/jpeg'}}
+    cache.close()
+
+
+def test_cache_lookup_without_touch_writes_nothing():
+    cache = MetadataCache('output/cache.sqlite')
+    cache.set_many({'input/exif.jpg': {'MIMEType': 'image/jpeg'}})
+    used = cache.connection.execute('SELECT used FROM metadata').fetchone()[0]
+    assert cache.get_many(['input/exif.jpg'], touch=False)[0] == {'input/exif.jpg': {'MIMEType': 'image/jpeg'}}
+    assert cache.connection.execute('SELECT used FROM metadata').fetchone()[0] == used
+    cache.close()
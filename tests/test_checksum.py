@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import shutil
+import src.checksum
+from src.checksum import FileDigest, algorithms, checksum
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def write(file, content):
+    with open(file, 'wb') as f:
+        f.write(content)
+
+
+def test_checksum_is_sha256_by_default():
+    with open('input/exif.jpg', 'rb') as f:
+        assert checksum('input/exif.jpg') == hashlib.sha256(f.read()).hexdigest()
+
+
+def test_checksum_with_other_algorithm():
+    if 'blake2b' in algorithms():
+        with open('input/exif.jpg', 'rb') as f:
+            assert checksum('input/exif.jpg', 'blake2b') == hashlib.blake2b(f.read()).hexdigest()
+
+
+def test_digest_matches_same_content():
+    write('output/a', b'a' * 100)
+    write('output/b', b'a' * 100)
+    assert FileDigest('output/a').matches(FileDigest('output/b'))
+
+
+def test_digest_compares_size_before_reading(mocker):
+    write('output/a', b'a' * 100)
+    write('output/b', b'a' * 101)
+    mocker.spy(src.checksum, 'checksum')
+    assert not FileDigest('output/a').matches(FileDigest('output/b'))
+    assert not src.checksum.checksum.called
+
+
+def test_digest_compares_partial_before_full(mocker):
+    mocker.patch('src.checksum.partial_size', 10)
+    write('output/a', b'a' * 100)
+    write('output/b', b'b' + b'a' * 99)
+    mocker.spy(src.checksum, 'checksum')
+    assert not FileDigest('output/a').matches(FileDigest('output/b'))
+    assert not src.checksum.checksum.called
+
+
+def test_digest_compares_full_when_partial_matches(mocker):
+    mocker.patch('src.checksum.partial_size', 10)
+    write('output/a', b'a' * 100)
+    write('output/b', b'a' * 50 + b'b' + b'a' * 49)
+    assert not FileDigest('output/a').matches(FileDigest('output/b'))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import os
+import shutil
+from datetime import datetime
+from benchmarks.corpus import generate, jpeg, mp4
+from src.mime import is_media
+from src.native import NativeReader
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def write(file, content):
+    with open(file, 'wb') as f:
+        f.write(content)
+
+
+def test_generated_files_have_dates():
+    date = datetime(2015, 6, 7, 8, 9, 10)
+    write('output/a.jpg', jpeg(date, b'\xff' * 100))
+    write('output/a.mp4', mp4(date, b'data'))
+    assert is_media('output/a.jpg')
+    assert NativeReader().read('output/a.jpg')['DateTimeOriginal'] == '2015:06:07 08:09:10'
+    assert NativeReader().read('output/a.mp4')['CreateDate'] == '2015:06:07 08:09:10'
+
+
+def test_generate_is_reproducible():
+    first = generate('output/first', files=50, size=1024, seed=1)
+    second = generate('output/second', files=50, size=1024, seed=1)
+    assert first == second
+    assert first['files'] == 50
+    assert first['jpeg'] + first['mp4'] + first['duplicates'] == 50
+    files = sorted(os.path.relpath(os.path.join(root, name), 'output/first')
+                   for root, dirs, names in os.walk('output/first') for name in names)
+    assert len(files) == 50 + first['xmp']
@@ -21,7 +21,8 @@ def test_get_date_from_exif():
         "CreateDate": "2017-01-01 01:01:01"
     }) == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
     }
 
 def test_get_date_from_custom_date_field():
@@ -29,24 +30,27 @@ def test_get_date_from_custom_date_field():
         "CustomField": "2017:01:01 01:01:01"
     }, date_field="CustomField") == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
     }
 
-def test_get_date_from_exif_strip_timezone():
+def test_get_date_from_exif_keeps_timezone():
     assert Date().from_exif({
         "CreateDate": "2017-01-01 01:01:01-02:00"
     }) == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": "-02:00"
     }
 
 
-def test_get_date_from_exif_strip_timezone_sub_sec():
+def test_get_date_from_exif_keeps_timezone_sub_sec():
     assert Date().from_exif({
         "SubSecCreateDate": "2019:10:06 11:02:50.575+01:00"
     }) == {
         "date": datetime(2019, 10, 6, 11, 2, 50),
-        "subseconds": "575"
+        "subseconds": "575",
+        "offset": "+01:00"
     }
 
 
@@ -55,7 +59,8 @@ def test_get_date_from_exif_colon():
         "CreateDate": "2017:01:01 01:01:01"
     }) == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
     }
 
 
@@ -64,7 +69,8 @@ def test_get_date_from_exif_subseconds():
         "CreateDate": "2017-01-01 01:01:01.20"
     }) == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
-        "subseconds": "20"
+        "subseconds": "20",
+        "offset": None
     }
 
 
@@ -73,14 +79,38 @@ def test_get_date_from_exif_invalid():
         "CreateDate": "Invalid"
     }) == {
         "date": None,
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
     }
 
 
+def test_get_date_from_exif_other_layout():
+    assert Date().from_exif({
+        "CreateDate": "2017:1:1 1:01:01+02:00"
+    }) == {
+        "date": datetime(2017, 1, 1, 1, 1, 1),
+        "subseconds": "",
+        "offset": "+02:00"
+    }
+
+
+def test_get_date_from_exif_mixed_separators_are_invalid():
+    assert Date().from_exif({
+        "CreateDate": "2017:01-01 01:01:01"
+    })["date"] is None
+
+
+def test_get_date_from_exif_invalid_values():
+    assert Date().from_exif({
+        "CreateDate": "2017:13:01 01:01:01"
+    })["date"] is None
+
+
 def test_get_date_from_filename():
     assert Date("IMG_20170101_010101.jpg").from_exif({}) == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
     }
 
 
@@ -103,7 +133,8 @@ def test_get_date_custom_regex():
     date_regex = re.compile(r"(?P<day>\d{2})\.(?P<month>\d{2})\.(?P<year>\d{4})[_-]?(?P<hour>\d{2})\.(?P<minute>\d{2})\.(?P<second>\d{2})")
     assert Date("IMG_27.01.2015-19.20.00.jpg").from_exif({}, False, date_regex) == {
         "date": datetime(2015, 1, 27, 19, 20, 00),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
     }
 
 
@@ -131,5 +162,18 @@ def test_get_date_custom_regex_optional_time():
     date_regex = re.compile(r"(?P<day>\d{2})\.(?P<month>\d{2})\.(?P<year>\d{4})[_-]?((?P<hour>\d{2})\.(?P<minute>\d{2})\.(?P<second>\d{2}))?")
     assert Date("IMG_27.01.2015.jpg").from_exif({}, False, date_regex) == {
         "date": datetime(2015, 1, 27, 0, 0, 00),
-        "subseconds": ""
+        "subseconds": "",
+        "offset": None
+    }
+
+
+def test_get_date_from_timestamp(tmp_path):
+    path = tmp_path / 'Foo.jpg'
+    path.touch()
+    os.utime(path, (1483232461, 1483232461))
+    date = Date(str(path)).from_exif({}, timestamp=True)
+    assert date == {
+        "date": datetime.fromtimestamp(1483232461),
+        "subseconds": "",
+        "offset": None
     }
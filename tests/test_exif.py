@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import os
-from subprocess import CalledProcessError
-from src.exif import Exif
+import shutil
+import pytest
+from src.exif import Exif, ExifTool, ExifToolError, exiftool
 
 
 os.chdir(os.path.dirname(__file__))
@@ -16,6 +17,60 @@ def test_exif_reads_files_with_illegal_characters():
     assert exif.data()['CreateDate'] == '2017:01:01 01:01:01'
 
 def test_exif_handles_exception(mocker):
-    mocker.patch('subprocess.check_output', side_effect=CalledProcessError(2, 'cmd'))
-    exif = Exif("not-existing.jpg")
+    mocker.patch.object(ExifTool, 'send', side_effect=BrokenPipeError)
+    exif = Exif("input/exif.jpg")
+    assert exif.data() == None
+    assert Exif.batch(["input/exif.jpg"]) == {"input/exif.jpg": {}}
+
+def test_exif_reads_files_with_line_breaks(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+    shutil.copy2('input/exif.jpg', 'output/line\nbreak.jpg')
+    mocker.spy(ExifTool, 'send')
+    data = Exif.batch(['output/line\nbreak.jpg', 'input/exif.jpg'])
+    assert data['output/line\nbreak.jpg']['CreateDate'] == '2017:01:01 01:01:01'
+    assert data['input/exif.jpg']['CreateDate'] == '2017:01:01 01:01:01'
+    assert all('output/line\nbreak.jpg' not in call[0][1] for call in ExifTool.send.call_args_list)
+    shutil.rmtree('output', ignore_errors=True)
+
+def test_exiftool_refuses_arguments_with_line_breaks():
+    with pytest.raises(ValueError):
+        ExifTool().send(['-j', 'line\nbreak.jpg'])
+
+def test_exif_handles_missing_exiftool(mocker):
+    mocker.patch.object(exiftool, 'execute', side_effect=ExifToolError)
+    exif = Exif("input/exif.jpg")
     assert exif.data() == None
+
+def test_exiftool_missing_executable():
+    with pytest.raises(ExifToolError):
+        ExifTool('not-existing-exiftool').execute('-ver')
+
+def test_exiftool_is_reused():
+    Exif("input/exif.jpg").data()
+    tool = exiftool.idle[-1]
+    process = tool.process
+    Exif("input/exif.jpg").data()
+    assert exiftool.idle[-1] is tool
+    assert tool.process is process
+
+def test_exiftool_restarts_after_crash():
+    Exif("input/exif.jpg").data()
+    exiftool.idle[-1].process.kill()
+    exiftool.idle[-1].process.wait()
+    assert Exif("input/exif.jpg").data()['CreateDate'] == '2017:01:01 01:01:01'
+
+def test_exif_batch_maps_files_by_source_file():
+    data = Exif.batch(["input/exif.jpg", "input/UNKNOWN.jpg", "not-existing.jpg"])
+    assert data["input/exif.jpg"]['CreateDate'] == '2017:01:01 01:01:01'
+    assert data["input/UNKNOWN.jpg"]['SourceFile'] == 'input/UNKNOWN.jpg'
+    assert data["not-existing.jpg"] == {}
+
+def test_exif_batch_falls_back_to_single_files(mocker):
+    mocker.patch.object(exiftool, 'execute', side_effect=ExifToolError)
+    mocker.patch.object(Exif, 'data', return_value={"MIMEType": "image/jpeg"})
+    data = Exif.batch(["input/exif.jpg", "input/UNKNOWN.jpg"])
+    assert data == {
+        "input/exif.jpg": {"MIMEType": "image/jpeg"},
+        "input/UNKNOWN.jpg": {"MIMEType": "image/jpeg"},
+    }
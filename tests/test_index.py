@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sqlite3
+from src.index import HashIndex
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_index_find():
+    open('output/2017/a.jpg', 'w').close()
+    index = HashIndex('output/.phockup/index.sqlite', 'output')
+    assert index.find('abc') is None
+    index.add('abc', 'output/2017/a.jpg')
+    assert index.find('abc') == os.path.join('output', '2017', 'a.jpg')
+    index.close()
+
+
+def test_index_removes_missing_files():
+    index = HashIndex('output/.phockup/index.sqlite', 'output')
+    index.add('abc', 'output/2017/missing.jpg')
+    assert index.find('abc') is None
+    assert len(index) == 0
+    index.close()
+
+
+def test_index_rebuild():
+    with open('output/2017/a.jpg', 'w') as f:
+        f.write('a')
+    with open('output/2017/b.jpg', 'w') as f:
+        f.write('b')
+    index = HashIndex('output/.phockup/index.sqlite', 'output')
+    index.add('stale', 'output/2017/stale.jpg')
+    assert index.rebuild(lambda file: open(file).read(), ignored_dirs=('.phockup',)) == 2
+    assert len(index) == 2
+    assert index.find('b') == os.path.join('output', '2017', 'b.jpg')
+    index.close()
+
+
+def test_index_keeps_algorithm_until_rebuilt():
+    index = HashIndex('output/.phockup/index.sqlite', 'output')
+    index.close()
+    index = HashIndex('output/.phockup/index.sqlite', 'output', 'blake2b')
+    assert index.algorithm == 'sha256'
+    index.rebuild(lambda file: '', ignored_dirs=('.phockup',))
+    assert index.algorithm == 'blake2b'
+    index.close()
+
+
+def test_index_commits_in_batches_and_on_close():
+    open('output/2017/a.jpg', 'w').close()
+    index = HashIndex('output/.phockup/index.sqlite', 'output')
+    index.commit_every = 2
+    reader = sqlite3.connect('output/.phockup/index.sqlite')
+
+    def committed():
+        return reader.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    index.add('a', 'output/2017/a.jpg')
+    assert committed() == 0
+    index.add('b', 'output/2017/b.jpg')
+    assert committed() == 2
+    index.add('c', 'output/2017/c.jpg')
+    index.close()
+    assert committed() == 3
+    reader.close()
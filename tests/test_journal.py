@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import pytest
+from src.journal import Journal, temp_file
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_temp_file_is_next_to_target():
+    assert temp_file(os.path.join('output', 'a.jpg')) == os.path.join('output', '.a.jpg.phockup-tmp')
+
+
+def test_journal_keeps_done_and_pending_entries():
+    journal = Journal('output/journal').open()
+    journal.start('input/exif.jpg', 'output/a.jpg')
+    journal.finish('input/exif.jpg')
+    journal.start('input/UNKNOWN.jpg', 'output/b.jpg')
+    journal.close()
+
+    journal = Journal('output/journal')
+    assert journal.is_done('input/exif.jpg')
+    assert not journal.is_done('input/UNKNOWN.jpg')
+    assert list(journal.pending) == [os.path.abspath('input/UNKNOWN.jpg')]
+    assert journal.pending[os.path.abspath('input/UNKNOWN.jpg')]['target'] == 'output/b.jpg'
+
+
+def test_journal_undo():
+    journal = Journal('output/journal').open()
+    journal.start('input/exif.jpg', 'output/a.jpg')
+    journal.undo('input/exif.jpg')
+    journal.close()
+    assert Journal('output/journal').pending == {}
+
+
+def test_journal_ignores_incomplete_line():
+    journal = Journal('output/journal').open()
+    journal.finish('input/exif.jpg')
+    journal.close()
+    with open('output/journal', 'a') as f:
+        f.write('{"op": "sta')
+    assert Journal('output/journal').is_done('input/exif.jpg')
+
+
+def test_journal_without_resume_starts_over():
+    journal = Journal('output/journal').open()
+    journal.finish('input/exif.jpg')
+    journal.close()
+    journal = Journal('output/journal').open(resume=False)
+    assert not journal.is_done('input/exif.jpg')
+    journal.close(remove=True)
+    assert not os.path.isfile('output/journal')
+
+
+def test_closed_journal_refuses_entries():
+    journal = Journal('output/journal').open()
+    journal.start('input/exif.jpg', 'output/a.jpg')
+    journal.close()
+    with pytest.raises(ValueError):
+        journal.finish('input/exif.jpg')
+    assert list(Journal('output/journal').pending) == [os.path.abspath('input/exif.jpg')]
+
+
+def test_journal_compact_keeps_only_pending_entries():
+    journal = Journal('output/journal').open()
+    journal.start('input/exif.jpg', 'output/a.jpg')
+    journal.finish('input/exif.jpg')
+    journal.compact()
+    assert not os.path.isfile('output/journal')
+    journal.start('input/exif.jpg', 'output/a.jpg')
+    journal.finish('input/exif.jpg')
+    journal.start('input/UNKNOWN.jpg', 'output/b.jpg')
+    journal.compact()
+    with open('output/journal') as f:
+        assert len(f.readlines()) == 1
+    journal.finish('input/UNKNOWN.jpg')
+    journal.close()
+    journal = Journal('output/journal')
+    assert journal.pending == {}
+    assert journal.is_done('input/UNKNOWN.jpg')
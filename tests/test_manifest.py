@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import os
+import shutil
+from src.manifest import Manifest
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_manifest_processed_file():
+    manifest = Manifest('output/.phockup/manifest.sqlite')
+    assert not manifest.is_processed('input/exif.jpg')
+    manifest.add('input/exif.jpg')
+    assert manifest.is_processed('input/exif.jpg')
+    manifest.close()
+    manifest = Manifest('output/.phockup/manifest.sqlite')
+    assert manifest.is_processed('input/exif.jpg')
+    manifest.close()
+
+
+def test_manifest_changed_file():
+    with open('output/changed.jpg', 'w') as f:
+        f.write('a')
+    manifest = Manifest('output/.phockup/manifest.sqlite')
+    manifest.add('output/changed.jpg')
+    with open('output/changed.jpg', 'w') as f:
+        f.write('ab')
+    assert not manifest.is_processed('output/changed.jpg')
+    manifest.close()
+
+
+def test_manifest_missing_file():
+    manifest = Manifest('output/.phockup/manifest.sqlite')
+    manifest.add('not-existing.jpg')
+    assert len(manifest) == 0
+    assert not manifest.is_processed('not-existing.jpg')
+    manifest.close()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import os
+import shutil
+from src.mime import is_media
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def write(file, content):
+    with open(file, 'wb') as f:
+        f.write(content)
+
+
+def test_media_by_content():
+    assert is_media('input/exif.jpg')
+    assert is_media('input/exif.mp4')
+    write('output/photo.txt', b'\x89PNG\r\n\x1a\n' + b'\x00' * 20)
+    assert is_media('output/photo.txt')
+
+
+def test_other_by_content():
+    write('output/archive.jpg', b'PK\x03\x04' + b'\x00' * 20)
+    assert is_media('output/archive.jpg') is False
+
+
+def test_other_by_extension():
+    write('output/notes.txt', b'some notes')
+    assert is_media('output/notes.txt') is False
+
+
+def test_empty_file_is_not_media():
+    assert is_media('input/other.txt') is False
+
+
+def test_unknown_is_left_to_exiftool():
+    write('output/file.xyz', b'some data')
+    assert is_media('output/file.xyz') is None
+    assert is_media('not-existing.jpg') is None
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import struct
+from src.native import NativeReader
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def write(file, content):
+    with open(file, 'wb') as f:
+        f.write(content)
+
+
+def ifd(entries, start, endian='<'):
+    """
+    Build an IFD of ASCII entries placed at offset start of the TIFF data
+    """
+    values = b''
+    data_offset = start + 2 + 12 * len(entries) + 4
+    packed = struct.pack(endian + 'H', len(entries))
+    for tag, value in sorted(entries.items()):
+        if isinstance(value, int):
+            packed += struct.pack(endian + 'HHII', tag, 4, 1, value)
+            continue
+        value = value.encode() + b'\x00'
+        if len(value) <= 4:
+            packed += struct.pack(endian + 'HHI', tag, 2, len(value)) + value.ljust(4, b'\x00')
+            continue
+        packed += struct.pack(endian + 'HHII', tag, 2, len(value), data_offset + len(values))
+        values += value
+    return packed + b'\x00\x00\x00\x00' + values
+
+
+def tiff(endian='<'):
+    exif = {0x9003: '2017:01:02 03:04:05', 0x9291: '12', 0x9011: '+02:00'}
+    ifd0 = {0x0132: '2018:01:01 00:00:00', 0x8769: 0}
+    header = (b'II*\x00' if endian == '<' else b'MM\x00*') + struct.pack(endian + 'I', 8)
+    first = ifd(ifd0, 8, endian)
+    ifd0[0x8769] = 8 + len(first)
+    first = ifd(ifd0, 8, endian)
+    return header + first + ifd(exif, 8 + len(first), endian)
+
+
+def box(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def test_read_jpeg():
+    assert NativeReader().read('input/exif.jpg') == {
+        'MIMEType': 'image/jpeg',
+        'CreateDate': '2017:01:01 01:01:01',
+    }
+
+
+def test_read_jpeg_without_exif_is_left_to_exiftool():
+    assert NativeReader().read('input/date_20170101_010101.jpg') is None
+
+
+def test_read_jpeg_without_used_date_is_left_to_exiftool():
+    tiff = b'II*\x00' + struct.pack('<I', 8) + ifd({0x0132: '2018:01:01 00:00:00'}, 8)
+    app1 = b'Exif\x00\x00' + tiff
+    write('output/modified.jpg', b'\xff\xd8\xff\xe1' + struct.pack('>H', 2 + len(app1)) + app1 + b'\xff\xd9')
+    assert NativeReader().read('output/modified.jpg') is None
+    assert NativeReader(['ModifyDate']).read('output/modified.jpg') == {
+        'MIMEType': 'image/jpeg',
+        'ModifyDate': '2018:01:01 00:00:00',
+    }
+
+
+def test_read_other_file_is_left_to_exiftool():
+    assert NativeReader().read('input/other.txt') is None
+    assert NativeReader().read('not-existing.jpg') is None
+
+
+def test_read_mp4():
+    exif = NativeReader().read('input/exif.mp4')
+    assert exif['MIMEType'] == 'video/mp4'
+    assert exif['CreateDate'] == '2017:01:01 01:01:01'
+
+
+def test_read_raw_with_subseconds():
+    for endian in ('<', '>'):
+        write('output/raw.nef', tiff(endian))
+        assert NativeReader().read('output/raw.nef') == {
+            'MIMEType': 'image/x-nikon-nef',
+            'DateTimeOriginal': '2017:01:02 03:04:05',
+            'ModifyDate': '2018:01:01 00:00:00',
+            'SubSecDateTimeOriginal': '2017:01:02 03:04:05.12+02:00',
+        }
+
+
+def test_read_mov_version_1():
+    created = 3566632861  # 2017-01-07 11:21:01 since 1904
+    mvhd = box(b'mvhd', b'\x01\x00\x00\x00' + struct.pack('>QQ', created, created) + b'\x00' * 80)
+    write('output/movie.mov', box(b'ftyp', b'qt  \x00\x00\x00\x00') + box(b'moov', mvhd))
+    assert NativeReader().read('output/movie.mov') == {
+        'MIMEType': 'video/quicktime',
+        'CreateDate': '2017:01:07 11:21:01',
+        'ModifyDate': '2017:01:07 11:21:01',
+    }
+
+
+def test_read_zero_dates_is_left_to_exiftool():
+    mvhd = box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>II', 0, 0) + b'\x00' * 88)
+    write('output/movie.mp4', box(b'ftyp', b'isom\x00\x00\x02\x00') + box(b'moov', mvhd))
+    assert NativeReader().read('output/movie.mp4') is None
+
+    tiff = b'II*\x00' + struct.pack('<I', 8) + ifd({0x8769: 26}, 8) + ifd({0x9004: '0000:00:00 00:00:00'}, 26)
+    app1 = b'Exif\x00\x00' + tiff
+    write('output/photo.jpg', b'\xff\xd8\xff\xe1' + struct.pack('>H', 2 + len(app1)) + app1 + b'\xff\xd9')
+    assert NativeReader().read('output/photo.jpg') is None
+
+
+def test_read_heic():
+    exif = b'\x00\x00\x00\x00' + tiff('>')
+    infe = box(b'infe', b'\x02\x00\x00\x00' + b'\x00\x01' + b'\x00\x00' + b'Exif' + b'\x00')
+    iinf = box(b'iinf', b'\x00\x00\x00\x00' + b'\x00\x01' + infe)
+    ftyp = box(b'ftyp', b'heic\x00\x00\x00\x00')
+
+    def build(location):
+        iloc = box(b'iloc', b'\x00\x00\x00\x00' + b'\x44\x00' + b'\x00\x01' + b'\x00\x01' + b'\x00\x00' +
+                   b'\x00\x01' + struct.pack('>II', location, len(exif)))
+        return ftyp + box(b'meta', b'\x00\x00\x00\x00' + iinf + iloc)
+
+    head = build(0)
+    content = build(len(head) + 8) + box(b'mdat', exif)
+    write('output/image.heic', content)
+    assert NativeReader().read('output/image.heic')['SubSecDateTimeOriginal'] == '2017:01:02 03:04:05.12+02:00'
@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
+import errno
+import json
 import shutil
 import sys
 import os
+import pytest
+import threading
+import time
 from datetime import datetime
 from src.dependency import check_dependencies
+import src.transfer
+from src.checksum import checksum
 from src.exif import Exif
-from src.phockup import Phockup
+from src.index import HashIndex
+from src.phockup import Phockup, PhockupError
+from src.printer import Printer
 
 
 os.chdir(os.path.dirname(__file__))
@@ -73,6 +82,18 @@ def test_walking_directory():
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_walking_directory_in_batches(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.spy(Exif, 'batch')
+    Phockup('input', 'output', batch_size=2, exiftool_only=True)
+    assert Exif.batch.call_count > 1
+    assert all(len(call[0][0]) <= 2 for call in Exif.batch.call_args_list)
+    assert len(os.listdir('output/2017/01/01')) == 3
+    assert len(os.listdir('output/2017/10/06')) == 1
+    assert len(os.listdir('output/unknown')) == 1
+    shutil.rmtree('output', ignore_errors=True)
+
+
 def test_dry_run():
     shutil.rmtree('output', ignore_errors=True)
     Phockup('input', 'output', dry_run=True)
@@ -122,6 +143,20 @@ def test_process_file_with_filename_date(mocker):
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_process_file_with_exif_data(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Phockup('input', 'output').process_file("input/exif.jpg", {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    })
+    assert not Exif.data.called
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
+    shutil.rmtree('output', ignore_errors=True)
+
+
 def test_process_link_to_file_with_filename_date(mocker):
     shutil.rmtree('output', ignore_errors=True)
     mocker.patch.object(Phockup, 'check_directories')
@@ -319,3 +354,653 @@ def test_keep_original_filenames_and_filenames_case(mocker):
     assert os.path.isfile("output/2017/10/06/UNKNOWN.jpg")
     assert not 'unknown.jpg' in os.listdir("output/2017/10/06")
     shutil.rmtree('output', ignore_errors=True)
+
+
+def test_walking_directory_with_workers_matches_serial():
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('output_serial', ignore_errors=True)
+    Phockup('input', 'output_serial', batch_size=3)
+    Phockup('input', 'output', batch_size=3, workers=4)
+    serial = sorted(os.path.relpath(os.path.join(root, name), 'output_serial')
+                    for root, _, files in os.walk('output_serial') for name in files)
+    parallel = sorted(os.path.relpath(os.path.join(root, name), 'output')
+                      for root, _, files in os.walk('output') for name in files)
+    assert parallel == serial
+    shutil.rmtree('output', ignore_errors=True)
+    shutil.rmtree('output_serial', ignore_errors=True)
+
+
+def test_plan_file_waits_for_reserved_target(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    phockup = Phockup('input', 'output')
+    open("input/tmp_20170101_010101.jpg", "w").close()
+    first = phockup.plan_file("input/exif.jpg")
+    assert first[3] == "output/2017/01/01/20170101-010101.jpg"
+    threading.Timer(0.1, phockup.transfer_file, first).start()
+    second = phockup.plan_file("input/tmp_20170101_010101.jpg")
+    assert second[3] == "output/2017/01/01/20170101-010101-2.jpg"
+    assert not second[5]
+    shutil.rmtree('output', ignore_errors=True)
+    os.remove("input/tmp_20170101_010101.jpg")
+
+
+def test_move_skips_link_to_moved_file(mocker, capsys):
+    shutil.rmtree('input_move', ignore_errors=True)
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('input_move')
+    shutil.copy2('input/date_20170101_010101.jpg', 'input_move')
+    os.symlink('date_20170101_010101.jpg', 'input_move/link_to_date_20170101_010101.jpg')
+    mocker.patch.object(Phockup, 'read_exif', side_effect=lambda files: {
+        file: {'MIMEType': 'image/jpeg'} for file in files
+    })
+    Phockup('input_move', 'output', move=True)
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert 'link_to_date_20170101_010101.jpg => skipped, no such file or directory' in capsys.readouterr()[0]
+    shutil.rmtree('input_move', ignore_errors=True)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_walking_directory_with_cache(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', cache=True)
+    assert os.path.isfile('output/.phockup/cache.sqlite')
+    mocker.spy(Exif, 'batch')
+    shutil.rmtree('output/2017', ignore_errors=True)
+    Phockup('input', 'output', cache=True)
+    assert all('input/exif.jpg' not in call[0][0] for call in Exif.batch.call_args_list)
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert 'Metadata cache: ' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_dry_run_does_not_write_to_cache(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'batch', side_effect=lambda files: {
+        file: {'MIMEType': 'image/jpeg', 'CreateDate': '2017:01:01 01:01:01'} for file in files
+    })
+    Phockup('input', 'output', cache=True)
+    with open('output/.phockup/cache.sqlite', 'rb') as f:
+        content = f.read()
+    Phockup('input', 'output', cache=True, dry_run=True)
+    assert Exif.batch.call_count == 1
+    with open('output/.phockup/cache.sqlite', 'rb') as f:
+        assert f.read() == content
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_index_finds_duplicate_with_different_name(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2016')
+    shutil.copy2('input/exif.jpg', 'output/2016/renamed.jpg')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['input/exif.jpg']])
+    mocker.patch.object(Exif, 'batch', return_value={
+        'input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"}
+    })
+    Phockup('input', 'output', rebuild_index=True)
+    assert os.path.isfile('output/.phockup/index.sqlite')
+    assert not os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert 'skipped, duplicated file output/2016/renamed.jpg' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_index_is_updated_with_written_files(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Exif, 'batch', return_value={
+        'input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"}
+    })
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['input/exif.jpg']])
+    Phockup('input', 'output', index=True)
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    Exif.batch.return_value = {
+        'input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2018:01:01 01:01:01"}
+    }
+    Phockup('input', 'output', index=True)
+    assert not os.path.isfile('output/2018/01/01/20180101-010101.jpg')
+    assert 'skipped, duplicated file output/2017/01/01/20170101-010101.jpg' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_move_across_filesystems_updates_index_and_bytes(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/input')
+    shutil.copy2('input/exif.jpg', 'output/input/exif.jpg')
+    size = os.path.getsize('input/exif.jpg')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['output/input/exif.jpg']])
+    mocker.patch.object(Exif, 'batch', return_value={
+        'output/input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"}
+    })
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    phockup = Phockup('output/input', 'output', move=True, index=True)
+    assert not os.path.isfile('output/input/exif.jpg')
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert phockup.stats['bytes'] == size
+    index = HashIndex('output/.phockup/index.sqlite', 'output')
+    assert index.find(checksum('input/exif.jpg')) == 'output/2017/01/01/20170101-010101.jpg'
+    index.close()
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_failed_move_skips_the_file(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/input')
+    shutil.copy2('input/exif.jpg', 'output/input/exif.jpg')
+    shutil.copy2('input/exif.mp4', 'output/input/exif.mp4')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['output/input/exif.jpg', 'output/input/exif.mp4']])
+    mocker.patch.object(Exif, 'batch', return_value={
+        'output/input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"},
+        'output/input/exif.mp4': {"MIMEType": "video/mp4", "CreateDate": "2017:01:01 01:01:01"},
+    })
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    verified = src.transfer.checksum
+    mocker.patch('src.transfer.checksum', side_effect=lambda file, algorithm: (
+        'bad' if file.endswith('.jpg.phockup-tmp') else verified(file, algorithm)))
+    mocker.patch('sys.exit')
+    phockup = Phockup('output/input', 'output', move=True)
+    sys.exit.assert_not_called()
+    assert os.path.isfile('output/input/exif.jpg')
+    assert not os.path.exists('output/2017/01/01/20170101-010101.jpg')
+    assert not os.path.exists('output/2017/01/01/.20170101-010101.jpg.phockup-tmp')
+    assert os.path.isfile('output/2017/01/01/20170101-010101.mp4')
+    assert phockup.stats['skipped'] == 1
+    assert phockup.stats['transferred'] == 1
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_index_times_each_file_once_per_stage(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['input/exif.jpg']])
+    mocker.patch.object(Exif, 'batch', return_value={
+        'input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"}
+    })
+    stages = Phockup('input', 'output', index=True).stats.report()['stages']
+    assert stages['checksum']['count'] == 1
+    assert stages['duplicate']['count'] == 1
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_journal_is_removed_after_completed_run(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['input/exif.jpg']])
+    mocker.patch.object(Exif, 'batch', return_value={
+        'input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"}
+    })
+    Phockup('input', 'output')
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert not os.path.isfile('output/2017/01/01/.20170101-010101.jpg.phockup-tmp')
+    assert not os.path.exists('output/.phockup')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_resume_skips_processed_files(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/.phockup')
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({'op': 'done', 'source': os.path.abspath('input/exif.jpg')}) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.spy(Exif, 'batch')
+    Phockup('input', 'output', resume=True)
+    assert all('input/exif.jpg' not in call[0][0] for call in Exif.batch.call_args_list)
+    assert not os.path.isfile('output/.phockup/journal')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_interrupted_copy_is_rolled_back(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017/01/01')
+    os.makedirs('output/.phockup')
+    open('output/2017/01/01/.20170101-010101.jpg.phockup-tmp', 'w').close()
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({
+            'op': 'start', 'source': os.path.abspath('input/exif.jpg'),
+            'target': 'output/2017/01/01/20170101-010101.jpg', 'move': False,
+            'output': 'output/2017/01/01', 'name': '20170101-010101.jpg', 'suffix': 1
+        }) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[])
+    Phockup('input', 'output')
+    assert not os.path.isfile('output/2017/01/01/.20170101-010101.jpg.phockup-tmp')
+    assert 'rolled back interrupted transfer' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_interrupted_move_never_keeps_partial_file(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017/01/01')
+    os.makedirs('output/.phockup')
+    with open('output/2017/01/01/.20170101-010101.jpg.phockup-tmp', 'wb') as f:
+        f.write(b'\xff\xd8partial')
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({
+            'op': 'start', 'source': os.path.abspath('input/gone.jpg'),
+            'target': 'output/2017/01/01/20170101-010101.jpg', 'move': True,
+            'output': 'output/2017/01/01', 'name': '20170101-010101.jpg', 'suffix': 1
+        }) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[])
+    Phockup('input', 'output', move=True)
+    assert not os.path.exists('output/2017/01/01/20170101-010101.jpg')
+    assert not os.path.exists('output/2017/01/01/.20170101-010101.jpg.phockup-tmp')
+    assert 'rolled back interrupted transfer' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_interrupted_move_removes_source(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017/01/01')
+    os.makedirs('output/.phockup')
+    shutil.copy2('input/exif.jpg', 'input/tmp_move.jpg')
+    shutil.copy2('input/exif.jpg', 'output/2017/01/01/20170101-010101.jpg')
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({
+            'op': 'start', 'source': os.path.abspath('input/tmp_move.jpg'),
+            'target': 'output/2017/01/01/20170101-010101.jpg', 'move': True,
+            'output': 'output/2017/01/01', 'name': '20170101-010101.jpg', 'suffix': 1
+        }) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[])
+    Phockup('input', 'output', move=True)
+    assert not os.path.exists('input/tmp_move.jpg')
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert 'finished interrupted transfer' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_interrupted_move_of_changed_source_is_rolled_back(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017/01/01')
+    os.makedirs('output/.phockup')
+    with open('input/tmp_move.jpg', 'w') as f:
+        f.write('changed')
+    shutil.copy2('input/exif.jpg', 'output/2017/01/01/20170101-010101.jpg')
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({
+            'op': 'start', 'source': os.path.abspath('input/tmp_move.jpg'),
+            'target': 'output/2017/01/01/20170101-010101.jpg', 'move': True,
+            'output': 'output/2017/01/01', 'name': '20170101-010101.jpg', 'suffix': 1
+        }) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[])
+    Phockup('input', 'output', move=True)
+    assert os.path.isfile('input/tmp_move.jpg')
+    assert not os.path.exists('output/2017/01/01/20170101-010101.jpg')
+    assert 'rolled back interrupted transfer' in capsys.readouterr()[0]
+    os.remove('input/tmp_move.jpg')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_interrupted_transfer_is_finished_with_xmp(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017/01/01')
+    os.makedirs('output/.phockup')
+    shutil.copy2('input/xmp.jpg', 'output/2017/01/01/20170101-010101.jpg')
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({
+            'op': 'start', 'source': os.path.abspath('input/xmp.jpg'),
+            'target': 'output/2017/01/01/20170101-010101.jpg', 'move': False,
+            'output': 'output/2017/01/01', 'name': '20170101-010101.jpg', 'suffix': 1
+        }) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[])
+    Phockup('input', 'output')
+    assert 'finished interrupted transfer' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_interrupted_transfer_keeps_linked_xmp(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/2017/01/01')
+    os.makedirs('output/.phockup')
+    os.link('input/xmp.jpg', 'output/2017/01/01/20170101-010101.jpg')
+    os.link('input/xmp.jpg.xmp', 'output/2017/01/01/20170101-010101.jpg.xmp')
+    with open('output/.phockup/journal', 'w') as f:
+        f.write(json.dumps({
+            'op': 'start', 'source': os.path.abspath('input/xmp.jpg'),
+            'target': 'output/2017/01/01/20170101-010101.jpg', 'move': False,
+            'output': 'output/2017/01/01', 'name': '20170101-010101.jpg', 'suffix': 1
+        }) + '\n')
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[])
+    Phockup('input', 'output', link=True)
+    assert 'finished interrupted transfer' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_incremental_skips_processed_files(mocker, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', incremental=True)
+    assert os.path.isfile('output/.phockup/manifest.sqlite')
+    mocker.spy(Exif, 'batch')
+    Phockup('input', 'output', incremental=True)
+    assert all('input/exif.jpg' not in call[0][0] for call in Exif.batch.call_args_list)
+    assert 'Skipped ' in capsys.readouterr()[0]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_walking_directory_reads_common_formats_natively(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.spy(Exif, 'batch')
+    Phockup('input', 'output')
+    assert all('input/exif.jpg' not in call[0][0] for call in Exif.batch.call_args_list)
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert os.path.isfile('output/2017/01/01/20170101-010101.mp4')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_native_reading_is_disabled_for_other_date_fields(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    assert Phockup('input', 'output', date_field='DateTimeOriginal').native
+    assert not Phockup('input', 'output', date_field='FileModifyDate').native
+    assert not Phockup('input', 'output', exiftool_only=True).native
+
+
+def test_walking_directory_skips_exiftool_for_other_files(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.spy(Exif, 'batch')
+    Phockup('input', 'output')
+    assert all('input/other.txt' not in call[0][0] for call in Exif.batch.call_args_list)
+    assert os.path.isfile('output/unknown/other.txt')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_process_reflink(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    Phockup('input', 'output', reflink='auto').process_file("input/xmp.jpg")
+    assert os.path.isfile("input/xmp.jpg")
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg.xmp")
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_unsupported_reflink_is_reported(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch('src.transfer.clone', side_effect=OSError(errno.EOPNOTSUPP, 'Operation not supported'))
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'scan_batches', return_value=[['input/exif.jpg']])
+    mocker.patch.object(Exif, 'batch', return_value={
+        'input/exif.jpg': {"MIMEType": "image/jpeg", "CreateDate": "2017:01:01 01:01:01"}
+    })
+    mocker.patch('sys.exit')
+    Phockup('input', 'output', reflink='always')
+    sys.exit.assert_called_once_with(1)
+    assert not os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+    assert not os.path.isfile('output/2017/01/01/.20170101-010101.jpg.phockup-tmp')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_walking_directory_writes_report():
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', report='output/report.json')
+    with open('output/report.json') as f:
+        report = json.load(f)
+    totals = report['totals']
+    assert totals['scanned'] == totals['transferred'] + totals['duplicates'] + totals['skipped']
+    assert totals['transferred'] > 0
+    assert report['stages']['exif']['count'] > 0
+    assert report['stages']['transfer']['count'] >= totals['transferred']
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def read_plan(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f][1:]
+
+
+def output_files():
+    return sorted(
+        os.path.relpath(os.path.join(root, name), 'output')
+        for root, dirs, names in os.walk('output') if '.phockup' not in root
+        for name in names if not name.endswith('.xmp')
+    )
+
+
+def test_plan_predicts_suffixes_of_real_run():
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', plan='plan.jsonl')
+    assert not os.path.isdir('output')
+    plan = read_plan('plan.jsonl')
+    planned = sorted(entry['target'] for entry in plan if not entry['duplicate'])
+    assert len(planned) == len(set(planned))
+    assert any(entry['suffix'] > 1 for entry in plan)
+    Phockup('input', 'output')
+    assert output_files() == planned
+    os.remove('plan.jsonl')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_apply_plan_does_not_read_metadata(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', plan='plan.jsonl')
+    planned = sorted(entry['target'] for entry in read_plan('plan.jsonl') if not entry['duplicate'])
+    mocker.patch.object(Phockup, 'read_exif')
+    Phockup('input', 'output', apply_plan='plan.jsonl')
+    Phockup.read_exif.assert_not_called()
+    assert output_files() == planned
+    os.remove('plan.jsonl')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_apply_plan_skips_targets_created_since(capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', plan='plan.jsonl')
+    os.makedirs('output/2017/01/01')
+    with open('output/2017/01/01/20170101-010101.jpg', 'w') as f:
+        f.write('other')
+    Phockup('input', 'output', apply_plan='plan.jsonl')
+    assert 'exists since the plan was made' in capsys.readouterr()[0]
+    os.remove('plan.jsonl')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_apply_plan_refuses_plan_of_other_directories():
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', plan='plan.jsonl')
+    os.makedirs('output_other')
+    with pytest.raises(PhockupError):
+        Phockup('input', 'output_other', apply_plan='plan.jsonl', run=False).run()
+    with pytest.raises(PhockupError):
+        Phockup('output_other', 'output', apply_plan='plan.jsonl', run=False).run()
+    assert os.listdir('output_other') == []
+    os.remove('plan.jsonl')
+    shutil.rmtree('output_other', ignore_errors=True)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_apply_plan_counts_unknown_files():
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', plan='plan.jsonl')
+    unknown = [entry for entry in read_plan('plan.jsonl') if entry['output'] == 'unknown' and not entry['duplicate']]
+    stats = Phockup('input', 'output', apply_plan='plan.jsonl', run=False).run()
+    assert unknown
+    assert stats['unknown'] == len(unknown)
+    os.remove('plan.jsonl')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_output_dirs_are_created_once(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.spy(os, 'makedirs')
+    Phockup('input', 'output')
+    created = [call[0][0] for call in os.makedirs.call_args_list if '.phockup' not in call[0][0]]
+    assert len(created) == len(set(created))
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_output_dir_removed_during_run_is_created_again(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    phockup = Phockup('input', 'output')
+    phockup.process_file('input/exif.jpg')
+    shutil.rmtree('output/2017')
+    phockup.process_file('input/exif.mp4')
+    assert os.path.isfile('output/2017/01/01/20170101-010101.mp4')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_results_yields_a_record_for_every_file():
+    shutil.rmtree('output', ignore_errors=True)
+    phockup = Phockup('input', 'output', run=False)
+    assert not os.path.isdir('output')
+    results = {result.source: result for result in phockup.results()}
+    result = results['input/exif.mp4']
+    assert result.action == 'copied'
+    assert result.target == 'output/2017/01/01/20170101-010101.mp4'
+    assert result.date_source == 'exif'
+    assert set(result.timings) == {'date', 'duplicate', 'transfer'}
+    assert results['input/other.txt'].date_source is None
+    assert any(result.action == 'duplicate' for result in results.values())
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_callbacks_get_results():
+    shutil.rmtree('output', ignore_errors=True)
+    results = []
+    Phockup('input', 'output', callbacks=[results.append])
+    assert 'input/exif.jpg' in [result.source for result in results]
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_cancel_stops_the_run():
+    shutil.rmtree('output', ignore_errors=True)
+    all_results = list(Phockup('input', 'output-all', run=False).results())
+    shutil.rmtree('output-all', ignore_errors=True)
+
+    phockup = Phockup('input', 'output', run=False, batch_size=1, callbacks=[lambda result: phockup.cancel()])
+    results = list(phockup.results())
+    assert 0 < len(results) < len(all_results)
+    # The journal of a cancelled run is kept for --resume
+    assert os.path.isfile('output/.phockup/journal')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_run_raises_instead_of_exiting(mocker):
+    mocker.patch('sys.exit')
+    phockup = Phockup('in', 'out', run=False)
+    with pytest.raises(PhockupError):
+        phockup.run()
+    sys.exit.assert_not_called()
+
+
+def test_watch_processes_new_files():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/watched')
+    shutil.copy2('input/exif.jpg', 'output/watched/first.jpg')
+    phockup = Phockup('output/watched', 'output/sorted', run=False, watch=True,
+                      watch_polling=True, watch_settle=0.1)
+    results = phockup.results()
+    assert next(results).source == 'output/watched/first.jpg'
+    shutil.copy2('input/exif.mp4', 'output/watched/second.mp4')
+    assert next(results).target == 'output/sorted/2017/01/01/20170101-010101.mp4'
+    results.close()
+    assert os.path.isfile('output/sorted/2017/01/01/20170101-010101.mp4')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_watch_cancelled_while_processing_keeps_journal():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/watched')
+    shutil.copy2('input/exif.jpg', 'output/watched/first.jpg')
+    shutil.copy2('input/exif.mp4', 'output/watched/second.mp4')
+    phockup = Phockup('output/watched', 'output/sorted', run=False, watch=True, watch_polling=True,
+                      batch_size=1, callbacks=[lambda result: phockup.cancel()])
+    phockup.run()
+    assert os.path.isfile('output/sorted/.phockup/journal')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_watch_compacts_journal_after_each_batch():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/watched')
+    shutil.copy2('input/exif.jpg', 'output/watched/first.jpg')
+    journals = []
+
+    def watching(level, message):
+        if message.startswith('Watching'):
+            journals.append(os.path.exists('output/sorted/.phockup/journal'))
+            phockup.cancel()
+    phockup = Phockup('output/watched', 'output/sorted', run=False, watch=True, watch_polling=True,
+                      messages=[watching])
+    phockup.run()
+    assert journals == [False]
+    assert os.path.isfile('output/sorted/2017/01/01/20170101-010101.jpg')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_watch_flushes_buffered_output_while_idle(capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/watched')
+    Printer.configure(buffered=True)
+    phockup = Phockup('output/watched', 'output/sorted', run=False, watch=True,
+                      watch_polling=True, watch_settle=0.1)
+    results = phockup.results()
+    thread = threading.Thread(target=list, args=(results,))
+    thread.start()
+    output = ''
+    deadline = time.monotonic() + 5
+    while 'Watching "output/watched" for new files' not in output and time.monotonic() < deadline:
+        time.sleep(0.05)
+        output += capsys.readouterr()[0]
+    phockup.cancel()
+    thread.join()
+    Printer.configure()
+    assert 'Watching "output/watched" for new files' in output
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_results_wait_for_the_caller():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/input')
+    for i in range(6):
+        with open('output/input/%d.txt' % i, 'w') as f:
+            f.write(str(i))
+    phockup = Phockup('output/input', 'output/sorted', run=False, queue_size=1, transfer_workers=1)
+    results = phockup.results()
+    next(results)
+    time.sleep(0.5)
+    assert phockup.stats['skipped'] + phockup.stats['transferred'] < 6
+    results.close()
+    assert not phockup.callbacks
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_multiple_inputs_share_one_run():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/card1/DCIM')
+    os.makedirs('output/card2')
+    shutil.copy2('input/exif.jpg', 'output/card1/DCIM/first.jpg')
+    shutil.copy2('input/exif.mp4', 'output/card2/video.mp4')
+    shutil.copy2('input/exif.jpg', 'output/card2/copy.jpg')
+    phockup = Phockup(['output/card1', 'output/card2/', 'output/card1/DCIM'], 'output/sorted', run=False, batch_size=1)
+    results = list(phockup.results())
+    assert phockup.inputs == ['output/card1', 'output/card2']
+    # The batches of the inputs take turns
+    assert [result.source for result in results] == [
+        'output/card1/DCIM/first.jpg', 'output/card2/copy.jpg', 'output/card2/video.mp4'
+    ]
+    assert [result.action for result in results] == ['copied', 'duplicate', 'copied']
+    assert phockup.stats['scanned'] == 3
+    assert sorted(os.listdir('output/sorted/2017/01/01')) == ['20170101-010101.jpg', '20170101-010101.mp4']
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_error_for_missing_one_of_the_inputs():
+    phockup = Phockup(['input', 'missing'], 'output', run=False)
+    with pytest.raises(PhockupError) as e:
+        phockup.run()
+    assert 'Input directory "missing" does not exist' in str(e.value)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import _thread
+import itertools
+import threading
+import time
+import pytest
+from src.pipeline import Pipeline, Stage
+
+
+def test_pipeline_runs_items_through_all_stages():
+    results = []
+    Pipeline([
+        Stage(lambda x: x * 2, workers=4),
+        Stage(results.append),
+    ]).run(range(10))
+    assert sorted(results) == [x * 2 for x in range(10)]
+
+
+def test_ordered_stage_gets_items_in_source_order():
+    results = []
+
+    def slow(x):
+        time.sleep(0.01 * (5 - x % 5))
+        return x
+
+    Pipeline([
+        Stage(slow, workers=5),
+        Stage(results.append, ordered=True),
+    ], queue_size=2).run(range(20))
+    assert results == list(range(20))
+
+
+def test_expand_stage_passes_items_separately():
+    results = []
+    Pipeline([
+        Stage(lambda x: [x, x], expand=True),
+        Stage(results.append),
+    ]).run(range(3))
+    assert sorted(results) == [0, 0, 1, 1, 2, 2]
+
+
+def test_pipeline_raises_stage_error():
+    def fail(x):
+        raise ValueError('failed on %d' % x)
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage(fail, workers=2)]).run(range(100))
+
+
+def test_interrupted_pipeline_waits_for_workers():
+    finished = []
+
+    def slow(x):
+        time.sleep(0.3)
+        finished.append(x)
+
+    threading.Timer(0.1, _thread.interrupt_main).start()
+    with pytest.raises(KeyboardInterrupt):
+        Pipeline([Stage(slow)]).run(itertools.count())
+    assert finished == [0]
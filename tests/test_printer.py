@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import json
+import pytest
+from src.printer import Printer, QUIET, NORMAL, VERBOSE
+
+
+@pytest.fixture(autouse=True)
+def reset_printer():
+    yield
+    Printer.configure()
+
+
+def test_levels(capsys):
+    Printer.configure(QUIET)
+    Printer().line('info')
+    Printer().warning('warning')
+    Printer().debug('debug')
+    assert capsys.readouterr()[0] == 'warning\n'
+
+    Printer.configure(VERBOSE)
+    Printer().debug('debug')
+    assert capsys.readouterr()[0] == 'debug\n'
+
+    Printer.configure(NORMAL)
+    Printer().debug('debug')
+    assert capsys.readouterr()[0] == ''
+
+
+def test_json_format(capsys):
+    Printer.configure(format='json')
+    Printer().result('input/a.jpg', 'output/a.jpg', status='copied', target='output/a.jpg')
+    record = json.loads(capsys.readouterr()[0])
+    assert record['level'] == 'info'
+    assert record['message'] == 'input/a.jpg => output/a.jpg'
+    assert record['source'] == 'input/a.jpg'
+    assert record['status'] == 'copied'
+
+
+def test_buffered_output_is_written_on_flush(capsys):
+    Printer.configure(buffered=True)
+    Printer.flush_interval = 3600
+    try:
+        Printer().line('first')
+        Printer().line('second')
+        assert capsys.readouterr()[0] == ''
+        Printer.flush()
+        assert capsys.readouterr()[0] == 'first\nsecond\n'
+    finally:
+        Printer.flush_interval = 1.0
+
+
+def test_error_exits(capsys):
+    with pytest.raises(SystemExit):
+        Printer().error('failed')
+    assert 'failed' in capsys.readouterr()[0]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import shutil
+from src.scanner import Scanner, interleave
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('input_scan', ignore_errors=True)
+    for directory in ('input_scan/b/d', 'input_scan/a', 'input_scan/.phockup'):
+        os.makedirs(directory)
+    for file in ('input_scan/2.jpg', 'input_scan/1.jpg', 'input_scan/b/3.jpg',
+                 'input_scan/b/d/4.jpg', 'input_scan/a/5.jpg', 'input_scan/.phockup/cache'):
+        open(file, 'w').close()
+    os.symlink('b', 'input_scan/link')
+
+
+def teardown_function():
+    shutil.rmtree('input_scan', ignore_errors=True)
+
+
+expected = [
+    'input_scan/1.jpg',
+    'input_scan/2.jpg',
+    'input_scan/a/5.jpg',
+    'input_scan/b/3.jpg',
+    'input_scan/b/d/4.jpg',
+]
+
+
+def test_scanner_ordered():
+    paths = [entry.path for entry in Scanner('input_scan', ignored_dirs=('.phockup',))]
+    assert paths == [path.replace('/', os.path.sep) for path in expected]
+
+
+def test_scanner_ordered_parallel():
+    paths = [entry.path for entry in Scanner('input_scan', workers=4, ignored_dirs=('.phockup',))]
+    assert paths == [path.replace('/', os.path.sep) for path in expected]
+
+
+def test_scanner_unordered_parallel():
+    scanner = Scanner('input_scan', workers=4, ordered=False, ignored_dirs=('.phockup',))
+    paths = [entry.path for entry in scanner]
+    assert sorted(paths) == [path.replace('/', os.path.sep) for path in expected]
+
+
+def test_scanner_entries_have_stat():
+    entry = next(iter(Scanner('input_scan')))
+    assert entry.stat().st_size == 0
+
+
+def test_scanner_without_scandir(monkeypatch):
+    monkeypatch.delattr(os, 'scandir')
+    entries = list(Scanner('input_scan', ignored_dirs=('.phockup',)))
+    assert [entry.path for entry in entries] == [path.replace('/', os.path.sep) for path in expected]
+    assert entries[0].stat().st_size == 0
+
+
+def test_scanner_missing_directory():
+    assert list(Scanner('not-existing')) == []
+
+
+def test_interleave_takes_turns():
+    assert list(interleave([[1, 2, 3], [], ['a'], (4, 5)])) == [1, 'a', 4, 2, 5, 3]
@@ -0,0 +1,133 @@
+import errno
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from src.phockup import Phockup, PhockupError
+from src.server import Resources, Server, submit
+
+os.chdir(os.path.dirname(__file__))
+
+
+def parse(args):
+    if len(args) < 2:
+        raise PhockupError('Input and output directories are required')
+    return [args[0]], args[1], {'cache': True} if '--cache' in args else {}
+
+
+@pytest.fixture
+def server():
+    directory = tempfile.mkdtemp()
+    server = Server(os.path.join(directory, 'phockup.sock'), parse)
+    server.start()
+    thread = threading.Thread(target=server.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.close()
+    shutil.rmtree(directory)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_server_runs_jobs(server):
+    shutil.rmtree('output', ignore_errors=True)
+    events = list(submit(server.path, ['input', 'output']))
+    assert events[0]['event'] == 'started'
+    assert events[0]['output'] == os.path.abspath('output')
+    assert events[-1]['event'] == 'done'
+    results = [event for event in events if event['event'] == 'result']
+    assert os.path.abspath('input/exif.jpg') in [result['source'] for result in results]
+    assert events[-1]['stats']['totals']['scanned'] == len(results)
+    assert os.path.isfile('output/2017/01/01/20170101-010101.jpg')
+
+
+def test_server_keeps_resources_between_jobs(server):
+    shutil.rmtree('output', ignore_errors=True)
+    list(submit(server.path, ['input', 'output', '--cache']))
+    cache = server.resources.caches[os.path.abspath('output/.phockup/cache.sqlite')]
+    events = list(submit(server.path, ['input', 'output', '--cache']))
+    assert server.resources.caches[os.path.abspath('output/.phockup/cache.sqlite')] is cache
+    assert cache.hits > 0
+    assert all(event['action'] == 'duplicate' for event in events if event['event'] == 'result')
+
+
+def test_server_sends_messages_of_jobs(server):
+    shutil.rmtree('output', ignore_errors=True)
+    events = list(submit(server.path, ['input', 'output', '--cache']))
+    messages = [event['line'] for event in events if event['event'] == 'message']
+    assert any(message.startswith('Metadata cache: ') for message in messages)
+
+
+def test_server_sends_job_output_to_the_client_only(server, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+    capsys.readouterr()
+    events = list(submit(server.path, ['input', 'output', '--cache']))
+    assert any(event['event'] == 'result' for event in events)
+    assert capsys.readouterr()[0] == ''
+
+
+def test_server_socket_is_private(server):
+    assert os.stat(server.path).st_mode & 0o777 == 0o600
+
+
+def test_server_reports_errors(server):
+    events = list(submit(server.path, ['input']))
+    assert events == [{'event': 'error', 'message': 'Input and output directories are required'}]
+    events = list(submit(server.path, ['missing', 'output']))
+    assert events[-1]['event'] == 'error'
+    assert 'missing' in events[-1]['message']
+
+
+def test_server_reports_failures_of_jobs(server, mocker):
+    def results(self):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+        yield
+    mocker.patch.object(Phockup, 'results', results)
+    events = list(submit(server.path, ['input', 'output']))
+    assert events[-1]['event'] == 'error'
+    assert 'No space left on device' in events[-1]['message']
+
+
+def test_server_cancels_jobs_of_clients_gone(server, capsys):
+    shutil.rmtree('output', ignore_errors=True)
+
+    def send(event):
+        raise BrokenPipeError(errno.EPIPE, 'Broken pipe')
+    server.run_job({'args': ['input', 'output'], 'cwd': os.getcwd()}, send)
+    assert 'went away, job cancelled' in capsys.readouterr()[0]
+
+
+def test_server_queues_jobs_with_the_same_output(server):
+    shutil.rmtree('output', ignore_errors=True)
+    lock = server.output_lock('output')
+    lock.acquire()
+    events = submit(server.path, ['input', 'output'])
+    assert next(events) == {'event': 'queued', 'output': os.path.abspath('output')}
+    lock.release()
+    assert list(events)[-1]['event'] == 'done'
+
+
+def test_submit_without_server():
+    with pytest.raises(PhockupError):
+        list(submit(os.path.join(tempfile.gettempdir(), 'missing-phockup.sock'), ['input', 'output']))
+
+
+def test_start_refuses_a_running_server(server):
+    with pytest.raises(PhockupError):
+        Server(server.path, parse).start()
+
+
+def test_resources_reopen_removed_files():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'index.sqlite')
+    resources = Resources()
+    index = resources.index(path, directory, 'sha256')
+    assert resources.index(path, directory, 'sha256') is index
+    os.remove(path)
+    assert resources.index(path, directory, 'sha256') is not index
+    resources.close()
+    shutil.rmtree(directory)
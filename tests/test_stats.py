@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+from src.stats import Stats, Timing, format_duration
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+class FakePrinter(object):
+    def __init__(self):
+        self.lines = []
+
+    def line(self, message, skip_end=False):
+        self.lines.append(message)
+
+
+def test_timing_histogram():
+    timing = Timing()
+    for duration in (0.0005, 0.005, 0.05, 0.5, 5, 50):
+        timing.add(duration)
+    report = timing.report()
+    assert report['count'] == 6
+    assert report['max'] == 50
+    assert [bucket['count'] for bucket in report['histogram']] == [1, 1, 1, 1, 1, 1]
+    assert report['histogram'][-1]['le'] is None
+
+
+def test_counters_and_timer():
+    stats = Stats()
+    stats.count('scanned', 3)
+    stats.count('transferred')
+    with stats.timer('exif'):
+        pass
+    assert stats['scanned'] == 3
+    report = stats.report()
+    assert report['totals']['transferred'] == 1
+    assert report['stages']['exif']['count'] == 1
+    assert report['stages']['scan']['count'] == 0
+
+
+def test_progress_line_has_eta_after_scan():
+    stats = Stats()
+    stats.count('scanned', 4)
+    stats.count('transferred', 2)
+    assert 'ETA' not in stats.progress_line()
+    assert '2/4+ files' in stats.progress_line()
+    stats.finish_scan()
+    assert 'ETA' in stats.progress_line()
+
+
+def test_progress_is_printed_at_most_every_interval():
+    printer = FakePrinter()
+    stats = Stats(printer, progress=True, interval=0)
+    stats.count('scanned')
+    assert len(printer.lines) == 1
+    stats = Stats(printer, progress=True, interval=3600)
+    stats.count('scanned')
+    assert len(printer.lines) == 1
+
+
+def test_write_report():
+    shutil.rmtree('output', ignore_errors=True)
+    stats = Stats()
+    stats.count('duplicates')
+    stats.write_report('output/report.json')
+    with open('output/report.json') as f:
+        report = json.load(f)
+    assert report['totals']['duplicates'] == 1
+    assert set(report['stages']) == {'scan', 'exif', 'checksum', 'date', 'duplicate', 'transfer'}
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_format_duration():
+    assert format_duration(3725) == '1:02:05'
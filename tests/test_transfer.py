@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import errno
+import os
+import shutil
+import pytest
+import src.transfer
+from src.checksum import checksum
+from src.transfer import MoveError, ReflinkError, copy_data, move, reflink
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_copy_data():
+    copy_data('input/exif.mp4', 'output/exif.mp4')
+    with open('input/exif.mp4', 'rb') as a, open('output/exif.mp4', 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_reflink_auto_preserves_content_and_metadata():
+    reflink('input/exif.jpg', 'output/exif.jpg')
+    with open('input/exif.jpg', 'rb') as a, open('output/exif.jpg', 'rb') as b:
+        assert a.read() == b.read()
+    assert os.path.getmtime('output/exif.jpg') == os.path.getmtime('input/exif.jpg')
+
+
+def test_reflink_auto_falls_back_to_copy(mocker):
+    mocker.patch.object(src.transfer, 'clone', side_effect=OSError(errno.EOPNOTSUPP, 'Not supported'))
+    reflink('input/exif.jpg', 'output/exif.jpg', 'auto')
+    assert os.path.isfile('output/exif.jpg')
+
+
+def test_reflink_always_fails_when_not_supported(mocker):
+    mocker.patch.object(src.transfer, 'clone', side_effect=OSError(errno.EOPNOTSUPP, 'Not supported'))
+    with pytest.raises(ReflinkError):
+        reflink('input/exif.jpg', 'output/exif.jpg', 'always')
+
+
+def test_reflink_always_copies_across_filesystems(mocker):
+    mocker.patch.object(src.transfer, 'clone', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    reflink('input/exif.jpg', 'output/exif.jpg', 'always')
+    assert os.path.isfile('output/exif.jpg')
+
+
+def test_reflink_missing_source():
+    with pytest.raises(FileNotFoundError):
+        reflink('not-existing.jpg', 'output/exif.jpg')
+
+
+def test_move_renames_on_same_filesystem():
+    shutil.copy2('input/exif.jpg', 'output/source.jpg')
+    assert move('output/source.jpg', 'output/target.jpg') is None
+    assert not os.path.exists('output/source.jpg')
+    assert os.path.isfile('output/target.jpg')
+
+
+def test_move_across_filesystems_verifies_and_removes_source(mocker):
+    shutil.copy2('input/exif.jpg', 'output/source.jpg')
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    copied = []
+    digest = move('output/source.jpg', 'output/target.jpg', progress=copied.append)
+    assert digest == checksum('input/exif.jpg')
+    assert sum(copied) == os.path.getsize('input/exif.jpg')
+    assert not os.path.exists('output/source.jpg')
+    assert os.path.getmtime('output/target.jpg') == os.path.getmtime('input/exif.jpg')
+
+
+def test_move_keeps_source_when_verification_fails(mocker):
+    shutil.copy2('input/exif.jpg', 'output/source.jpg')
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    mocker.patch.object(src.transfer, 'checksum', return_value='bad')
+    with pytest.raises(MoveError):
+        move('output/source.jpg', 'output/target.jpg')
+    assert os.path.isfile('output/source.jpg')
+    assert not os.path.exists('output/target.jpg')
+
+
+def test_move_keeps_source_changed_since_it_was_planned(mocker):
+    shutil.copy2('input/exif.jpg', 'output/source.jpg')
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    with pytest.raises(MoveError):
+        move('output/source.jpg', 'output/target.jpg', expected='planned')
+    assert os.path.isfile('output/source.jpg')
+    assert not os.path.exists('output/target.jpg')
+
+
+def test_move_through_temp_removes_source_once_target_is_synced(mocker):
+    shutil.copy2('input/exif.jpg', 'output/source.jpg')
+    mocker.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Cross-device link'))
+    synced = []
+
+    def sync_directory(directory):
+        synced.append((directory, os.path.isfile('output/target.jpg'), os.path.isfile('output/source.jpg')))
+    mocker.patch.object(src.transfer, 'sync_directory', side_effect=sync_directory)
+    move('output/source.jpg', 'output/target.jpg', temp='output/.target.jpg.phockup-tmp')
+    assert synced == [('output', True, True)]
+    assert not os.path.exists('output/source.jpg')
+    assert not os.path.exists('output/.target.jpg.phockup-tmp')
+    assert open('output/target.jpg', 'rb').read() == open('input/exif.jpg', 'rb').read()
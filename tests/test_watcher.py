@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import threading
+import time
+from src.watcher import Watcher
+
+
+os.chdir(os.path.dirname(__file__))
+
+
+def setup_function():
+    shutil.rmtree('output', ignore_errors=True)
+    os.makedirs('output/watched')
+
+
+def teardown_function():
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def write(file, content=b'data'):
+    with open(file, 'wb') as f:
+        f.write(content)
+
+
+def test_existing_files_are_not_reported():
+    write('output/watched/old.jpg')
+    watcher = Watcher('output/watched', settle=0, interval=0, polling=True)
+    watcher.poll()
+    assert watcher.settled() == []
+
+
+def test_new_file_is_reported_when_settled():
+    watcher = Watcher('output/watched', settle=0.2, interval=0, polling=True)
+    os.makedirs('output/watched/sub')
+    write('output/watched/sub/new.jpg')
+    watcher.poll()
+    assert watcher.settled() == []
+    time.sleep(0.3)
+    assert watcher.settled() == ['output/watched/sub/new.jpg']
+    assert watcher.settled() == []
+
+
+def test_growing_file_is_not_reported():
+    watcher = Watcher('output/watched', settle=0.2, interval=0, polling=True)
+    write('output/watched/new.jpg')
+    watcher.poll()
+    watcher.settled()
+    time.sleep(0.3)
+    write('output/watched/new.jpg', b'more data')
+    assert watcher.settled() == []
+
+
+def test_ignored_dirs_are_not_watched():
+    watcher = Watcher('output/watched', ignored_dirs=('.phockup',), settle=0, interval=0, polling=True)
+    os.makedirs('output/watched/.phockup')
+    write('output/watched/.phockup/journal')
+    watcher.poll()
+    assert watcher.settled() == []
+
+
+def test_watch_stops_when_stopped():
+    stop = threading.Event()
+    watcher = Watcher('output/watched', settle=0, interval=0.01, polling=True)
+    threading.Timer(0.1, stop.set).start()
+    assert list(watcher.watch(stop)) == []